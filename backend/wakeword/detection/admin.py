@@ -1,3 +1,29 @@
 from django.contrib import admin
+from .models import Stream, DetectionEvent, Incident, ScoreTimeline
 
-# Register your models here.
+
+@admin.register(Stream)
+class StreamAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'started_at', 'ended_at')
+    date_hierarchy = 'started_at'
+
+
+@admin.register(DetectionEvent)
+class DetectionEventAdmin(admin.ModelAdmin):
+    list_display = ('stream', 'detector', 'state', 'score', 'smoothed', 'occurred_at')
+    list_filter = ('detector', 'state')
+    date_hierarchy = 'occurred_at'
+
+
+@admin.register(Incident)
+class IncidentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'stream', 'opened_at', 'closed_at', 'hits', 'max_confidence', 'escalated')
+    list_filter = ('escalated',)
+    date_hierarchy = 'opened_at'
+
+
+@admin.register(ScoreTimeline)
+class ScoreTimelineAdmin(admin.ModelAdmin):
+    list_display = ('stream', 'started_at', 'ended_at', 'count')
+    # The packed arrays are not meaningful as form fields
+    exclude = ('offsets', 'wakeword', 'panic')
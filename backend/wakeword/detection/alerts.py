@@ -0,0 +1,557 @@
+# detection/alerts.py
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters, keyed (backend, outcome) and by incident event
+delivery_totals = defaultdict(int)
+incident_totals = defaultdict(int)
+_totals_lock = threading.Lock()
+
+
+def _count(totals, key):
+    with _totals_lock:
+        totals[key] += 1
+
+
+# Dispatchers subscribe to incidents by these labels (see EmergencyConsumer)
+ROUTING_KINDS = ('site', 'region', 'stream')
+# Channels group names allow these characters; keys are kept short so prefixed names stay under 100
+_ROUTING_KEY = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+def routing_key(value):
+    """A site, region or stream id usable in a group name, or None if it is not."""
+    value = str(value).strip() if value is not None else ''
+    return value if _ROUTING_KEY.match(value) else None
+
+
+def alert_group(kind, key=None, prefix='emergency'):
+    """Channel-layer group for one subscription: ('site', 'lobby') -> 'emergency.site.lobby'; 'all' takes no key."""
+    return f"{prefix}.all" if kind == 'all' else f"{prefix}.{kind}.{key}"
+
+
+def alert_groups(incident, prefix='emergency'):
+    """Every group an incident's events go to: all, and its site, region and stream."""
+    groups = [alert_group('all', prefix=prefix)]
+    for kind in ROUTING_KINDS:
+        key = routing_key(incident.get(kind))
+        if key is not None:
+            groups.append(alert_group(kind, key, prefix))
+    return groups
+
+
+class Incident:
+    """One run of panic detections on a stream, however many windows it spans."""
+
+    def __init__(self, stream, confidence, now, site=None, region=None):
+        self.id = uuid.uuid4().hex
+        self.stream = stream
+        self.site = site
+        self.region = region
+        self.opened_at = now
+        self.last_seen = now
+        self.closed_at = None
+        self.hits = 0
+        self.max_confidence = confidence
+        self.escalated = False
+
+    def to_dict(self):
+        return {
+            'incident_id': self.id,
+            'stream': self.stream,
+            'site': self.site,
+            'region': self.region,
+            'opened_at': self.opened_at,
+            'last_seen': self.last_seen,
+            'closed_at': self.closed_at,
+            'hits': self.hits,
+            'max_confidence': round(float(self.max_confidence), 4),
+        }
+
+
+class AlertGate:
+    """
+    Per-stream debouncing and hysteresis between panic detections and alerts.
+
+    An incident opens after `min_hits` consecutive panic windows, and stays
+    open while windows keep scoring at least `release_threshold`, which sits
+    below the detector's own threshold so a wavering scream is one incident.
+    It closes once no such window has been seen for `quiet_seconds`. Repeated
+    detections only update the open incident; `update` returns the events
+    worth fanning out: opened, escalated (confidence first reached
+    `notify_confidence`) and closed.
+    """
+
+    def __init__(self, stream, min_hits=2, release_threshold=0.5, quiet_seconds=10.0, notify_confidence=0.8,
+                 clock=time.time, site=None, region=None):
+        self.stream = stream
+        self.site = site
+        self.region = region
+        self.min_hits = max(1, int(min_hits))
+        self.release_threshold = release_threshold
+        self.quiet_seconds = quiet_seconds
+        self.notify_confidence = notify_confidence
+        self.clock = clock
+        self.incident = None
+        self._streak = 0
+
+    @classmethod
+    def from_settings(cls, stream, config, site=None, region=None):
+        return cls(
+            stream,
+            min_hits=config['MIN_HITS'],
+            release_threshold=config['RELEASE_THRESHOLD'],
+            quiet_seconds=config['QUIET_SECONDS'],
+            notify_confidence=config['NOTIFY_CONFIDENCE'],
+            site=site,
+            region=region
+        )
+
+    def _event(self, name):
+        _count(incident_totals, name)
+        return name, self.incident
+
+    def update(self, panic, confidence):
+        """Feeds one scored window; returns a list of (event, incident) pairs."""
+        now = self.clock()
+        confidence = float(confidence or 0.0)
+        events = self.expire(now)
+        self._streak = self._streak + 1 if panic else 0
+
+        if self.incident is None:
+            if self._streak < self.min_hits:
+                return events
+            self.incident = Incident(self.stream, confidence, now, self.site, self.region)
+            # The debounced windows belong to the incident too
+            self.incident.hits = self._streak - 1
+            events.append(self._event('opened'))
+
+        if panic or confidence >= self.release_threshold:
+            self.incident.last_seen = now
+            self.incident.hits += int(bool(panic))
+            self.incident.max_confidence = max(self.incident.max_confidence, confidence)
+        if not self.incident.escalated and self.incident.max_confidence >= self.notify_confidence:
+            self.incident.escalated = True
+            events.append(self._event('escalated'))
+        return events
+
+    def seconds_until_expiry(self, now=None):
+        """How long until the open incident closes unless another window keeps it open; None without one."""
+        if self.incident is None:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, self.incident.last_seen + self.quiet_seconds - now)
+
+    def expire(self, now=None):
+        """Closes the open incident if it has been quiet long enough."""
+        now = self.clock() if now is None else now
+        if self.incident is not None and now - self.incident.last_seen >= self.quiet_seconds:
+            return self.close(now)
+        return []
+
+    def close(self, now=None):
+        """Closes the open incident regardless of activity, e.g. when the stream ends."""
+        if self.incident is None:
+            return []
+        self.incident.closed_at = self.clock() if now is None else now
+        event = self._event('closed')
+        self.incident = None
+        self._streak = 0
+        return [event]
+
+
+# Backends
+
+class AlertBackend:
+    """
+    Destination for alerts. `kind` decides which alerts it receives:
+    'dashboard' gets every incident event, 'contact' and 'siren' only
+    escalations. Subclasses implement `async send(alert)` and raise on failure.
+    """
+
+    kind = 'contact'
+
+    def __init__(self, name=None):
+        self.name = name or type(self).__name__
+
+    async def send(self, alert):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class BlockingBackend(AlertBackend):
+    """
+    Backend around a synchronous client. `deliver` runs on the notifier's
+    own threads, never the inference executor, and the client is created
+    once so its HTTP or SMTP connection is reused between alerts.
+    """
+
+    executor = None
+
+    def __init__(self, name=None, timeout=5.0):
+        super().__init__(name)
+        self.timeout = timeout
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def connect(self):
+        raise NotImplementedError
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = self.connect()
+            return self._client
+
+    def reset(self):
+        """Drops the client so the next attempt reconnects."""
+        with self._client_lock:
+            self._client = None
+
+    def deliver(self, alert):
+        raise NotImplementedError
+
+    def _deliver(self, alert):
+        try:
+            self.deliver(alert)
+        except Exception:
+            self.reset()
+            raise
+
+    async def send(self, alert):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._deliver, alert)
+
+
+def alert_text(alert):
+    incident = alert['incident']
+    seen = time.strftime('%H:%M:%S', time.gmtime(incident['last_seen']))
+    return (
+        f"CalmAlert: panic detected on stream {incident['stream']} "
+        f"(confidence {incident['max_confidence']:.2f}, {incident['hits']} detections, last at {seen} UTC)"
+    )
+
+
+def dashboard_message(event, incident):
+    """The text frame EmergencyConsumer clients receive for an incident event."""
+    return json.dumps({
+        'type': 'emergency_alert',
+        'message': 'PANIC_DETECTED' if event != 'closed' else 'PANIC_CLEARED',
+        'event': event,
+        'incident': incident,
+    })
+
+
+class DashboardBackend(AlertBackend):
+    """
+    Broadcasts incident events to EmergencyConsumer clients over the
+    channel layer. Each event goes only to the groups of its incident's
+    site, region and stream, plus the 'all' group, so a dispatcher
+    receives only what it subscribed to. The client frame is serialized
+    here, once per event; consumers forward it without re-encoding.
+    """
+
+    kind = 'dashboard'
+
+    def __init__(self, name=None, prefix='emergency'):
+        super().__init__(name)
+        self.prefix = prefix
+
+    async def send(self, alert):
+        from channels.layers import get_channel_layer
+        layer = get_channel_layer()
+        message = {
+            'type': 'emergency.alert',
+            # Dispatchers subscribed through several groups get the event once
+            'key': f"{alert['incident']['incident_id']}:{alert['event']}",
+            'text': dashboard_message(alert['event'], alert['incident']),
+        }
+        await asyncio.gather(*(layer.group_send(group, message) for group in alert_groups(alert['incident'], self.prefix)))
+
+
+class TwilioSMSBackend(BlockingBackend):
+    """Texts every recipient through Twilio; the client keeps one HTTP session for all messages."""
+
+    def __init__(self, account_sid, auth_token, from_number, recipients, name=None, timeout=5.0):
+        super().__init__(name, timeout)
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.recipients = list(recipients)
+
+    def connect(self):
+        from twilio.rest import Client
+        from twilio.http.http_client import TwilioHttpClient
+        return Client(self.account_sid, self.auth_token, http_client=TwilioHttpClient(timeout=self.timeout))
+
+    def deliver(self, alert):
+        body = alert_text(alert)
+        for recipient in self.recipients:
+            self.client.messages.create(to=recipient, from_=self.from_number, body=body)
+
+
+class EmailBackend(BlockingBackend):
+    """Emails every recipient through Django's configured email backend over one open connection."""
+
+    def __init__(self, recipients, from_email=None, name=None, timeout=5.0):
+        super().__init__(name, timeout)
+        self.recipients = list(recipients)
+        self.from_email = from_email
+
+    def connect(self):
+        from django.core.mail import get_connection
+        connection = get_connection(fail_silently=False, timeout=self.timeout)
+        connection.open()
+        return connection
+
+    def deliver(self, alert):
+        from django.core.mail import EmailMessage
+        message = EmailMessage(
+            subject=f"CalmAlert incident on stream {alert['incident']['stream']}",
+            body=alert_text(alert),
+            from_email=self.from_email,
+            to=self.recipients,
+            connection=self.client
+        )
+        message.send()
+
+
+class WebhookBackend(BlockingBackend):
+    """POSTs the alert as JSON to an IoT controller, e.g. a siren, over a persistent session."""
+
+    kind = 'siren'
+
+    def __init__(self, url, headers=None, name=None, timeout=5.0):
+        super().__init__(name, timeout)
+        self.url = url
+        self.headers = headers or {}
+
+    def connect(self):
+        import requests
+        session = requests.Session()
+        session.headers.update(self.headers)
+        return session
+
+    def deliver(self, alert):
+        response = self.client.post(self.url, json=alert, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class LoggingBackend(AlertBackend):
+    """Logs alerts instead of sending them; the fallback when nothing else is configured."""
+
+    async def send(self, alert):
+        logger.warning(alert_text(alert))
+
+
+class FakeBackend(AlertBackend):
+    """
+    In-memory backend for tests and local runs. Records every alert it
+    accepts in `sent`, waits `delay` seconds per call and fails the first
+    `failures` attempts so retries and timeouts can be exercised.
+    """
+
+    def __init__(self, name=None, kind='contact', delay=0.0, failures=0):
+        super().__init__(name)
+        self.kind = kind
+        self.delay = delay
+        self.failures = failures
+        self.attempts = 0
+        self.sent = []
+
+    async def send(self, alert):
+        self.attempts += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError(f"{self.name}: simulated failure")
+        self.sent.append(alert)
+
+
+def backends_from_settings():
+    """
+    Backends listed in ALERT_CONFIG['BACKENDS'] as {'CLASS': dotted path,
+    'OPTIONS': kwargs}, or if that is empty, derived from EMERGENCY_CONFIG:
+    SMS to phone contacts when Twilio is configured, email to address
+    contacts, and the siren webhook when its URL is set.
+    """
+    config = settings.ALERT_CONFIG
+    timeout = config['NOTIFIER']['TIMEOUT']
+    backends = [DashboardBackend(prefix=config['DASHBOARD']['GROUP_PREFIX'])]
+    if config['BACKENDS']:
+        for entry in config['BACKENDS']:
+            backends.append(import_string(entry['CLASS'])(**entry.get('OPTIONS', {})))
+        return backends
+
+    emergency = settings.EMERGENCY_CONFIG
+    contacts = emergency.get('CONTACTS', [])
+    phones = [c for c in contacts if '@' not in c]
+    emails = [c for c in contacts if '@' in c]
+    twilio = emergency.get('TWILIO', {})
+    if phones and twilio.get('ACCOUNT_SID') and twilio.get('AUTH_TOKEN'):
+        backends.append(TwilioSMSBackend(
+            twilio['ACCOUNT_SID'], twilio['AUTH_TOKEN'], twilio['FROM_NUMBER'], phones, timeout=timeout
+        ))
+    if emails:
+        backends.append(EmailBackend(emails, timeout=timeout))
+    if emergency.get('SIREN_WEBHOOK_URL'):
+        backends.append(WebhookBackend(emergency['SIREN_WEBHOOK_URL'], timeout=timeout))
+    if len(backends) == 1:
+        backends.append(LoggingBackend())
+    return backends
+
+
+# Notifier
+
+class Notifier:
+    """
+    Asyncio worker pool delivering alerts to backends off the audio path.
+
+    `submit` never waits: each (backend, alert) job goes on a bounded queue,
+    and is dropped and counted if the queue is full. Workers give every
+    attempt `timeout` seconds and retry failures `retries` times with
+    jittered exponential backoff starting at `backoff` seconds.
+    """
+
+    def __init__(self, backends, workers=4, queue_size=256, timeout=5.0, retries=3, backoff=0.5):
+        self.backends = list(backends)
+        self.workers = max(1, int(workers))
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Blocking clients get their own threads so a slow SMTP server cannot starve inference
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='alerts')
+        for backend in self.backends:
+            if isinstance(backend, BlockingBackend):
+                backend.executor = self._threads
+        self._loop = None
+        self._queue = None
+        self._tasks = []
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(
+            backends_from_settings(),
+            workers=config['WORKERS'],
+            queue_size=config['QUEUE_SIZE'],
+            timeout=config['TIMEOUT'],
+            retries=config['RETRIES'],
+            backoff=config['BACKOFF']
+        )
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A queue belongs to one event loop, so start over if the server's loop changed
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, event, incident, kinds=None):
+        """Queues an incident event for every backend of the given kinds; must be called on the event loop."""
+        self._ensure_workers()
+        alert = {'event': event, 'incident': incident.to_dict()}
+        for backend in self.backends:
+            if kinds is not None and backend.kind not in kinds:
+                continue
+            try:
+                self._queue.put_nowait((backend, alert))
+            except asyncio.QueueFull:
+                _count(delivery_totals, (backend.name, 'dropped'))
+                logger.error(f"Alert queue full, dropped {event} for {backend.name}")
+
+    async def _worker(self):
+        while True:
+            backend, alert = await self._queue.get()
+            try:
+                await self._deliver(backend, alert)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, backend, alert):
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.wait_for(backend.send(alert), self.timeout)
+                _count(delivery_totals, (backend.name, 'sent'))
+                return True
+            except Exception as e:
+                error = 'timed out' if isinstance(e, asyncio.TimeoutError) else str(e)
+                if attempt == self.retries:
+                    _count(delivery_totals, (backend.name, 'failed'))
+                    logger.error(f"Alert to {backend.name} failed after {attempt + 1} attempts: {error}")
+                    return False
+                _count(delivery_totals, (backend.name, 'retried'))
+                logger.warning(f"Alert to {backend.name} failed ({error}), retrying")
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0))
+
+    async def join(self):
+        """Waits until every queued alert has been delivered or given up on."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for backend in self.backends:
+            await backend.close()
+        self._threads.shutdown(wait=False)
+
+
+_notifier = None
+
+
+def notifier():
+    """Process-wide Notifier shared by all consumers."""
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier.from_settings(settings.ALERT_CONFIG['NOTIFIER'])
+    return _notifier
+
+
+def stats():
+    with _totals_lock:
+        deliveries = dict(delivery_totals)
+        incidents = dict(incident_totals)
+    return {
+        'incidents': incidents,
+        'deliveries': {f"{backend}:{outcome}": count for (backend, outcome), count in deliveries.items()},
+        'queue_depth': _notifier.depth() if _notifier is not None else 0,
+    }
+
+
+metrics.Counter(
+    'calmalert_alert_deliveries_total', 'Alert deliveries by backend and outcome.', ('backend', 'outcome'),
+    function=lambda: [
+        ({'backend': backend, 'outcome': outcome}, count) for (backend, outcome), count in dict(delivery_totals).items()
+    ]
+)
+metrics.Counter(
+    'calmalert_incidents_total', 'Incident events raised by the alert gates.', ('event',),
+    function=lambda: [({'event': event}, count) for event, count in dict(incident_totals).items()]
+)
+metrics.Gauge(
+    'calmalert_alert_queue_depth', 'Alerts waiting for a notifier worker.',
+    function=lambda: _notifier.depth() if _notifier is not None else 0
+)
@@ -1,18 +1,72 @@
 import json
-import base64
+import time
+import uuid
 import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.conf import settings
-from .utils import wakeword_onnx, panic_detection
+from .utils.model_registry import registry
+from .utils.features import shared_frontend
+from .utils.streaming import StreamingState
+from .utils.vad import VoiceActivityGate
+from .utils.pipeline import DetectionPipeline
+from .utils.audio_protocol import decode_binary, decode_json, AudioProtocolError
+from .utils.backpressure import ChunkQueue, admission_controller
+from .utils.decisions import DecisionEngine
+from .utils.capture import PanicCapture, clip_writer
+from .utils import metrics
+from .workers import RemoteJobs
+from .emergency import EmergencySystem
+from .alerts import ROUTING_KINDS, alert_group, routing_key
+from .persistence import recorder
+
+logger = logging.getLogger(__name__)
+
+
+def _query_params(scope):
+    return parse_qs(scope.get('query_string', b'').decode('latin-1'))
+
 
 class MonitoringConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.wakeword_detector = wakeword_onnx.WakeWordDetector(settings.WAKEWORD_MODEL_PATH)
-        self.panic_detector = panic_detection.PanicDetector(settings.PANIC_MODEL_PATH)
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Executor and feature front-end are shared by every connection in this process
+        self.executor = registry.executor()
+        self.frontend = shared_frontend()
+
+        # In 'worker' mode windows are scored by InferenceWorkerConsumer processes
+        # and this process never loads the models; otherwise connect() builds the pipeline
+        self.remote = None
+        self.pipeline = None
+        self.remote_config = settings.INFERENCE_CONFIG['WORKER']
+        self.local = settings.INFERENCE_CONFIG['MODE'] != 'worker'
+
+        # Sliding-window context so detections spanning two client chunks are not lost
+        wakeword_config = settings.MODEL_CONFIG['WAKEWORD']
+        self.stream = None
+        if wakeword_config['STREAMING']:
+            self.stream = StreamingState(self.frontend, wakeword_config['CHUNK_SIZE'], wakeword_config['HOP_SIZE'])
+
+        # Smoothed, hysteretic per-stream state; clients only hear about changes
+        self.decisions = DecisionEngine.from_settings(settings.MODEL_CONFIG)
+        self.send_scores = settings.INFERENCE_CONFIG['SEND_SCORES']
+
+        # Silent chunks skip both models
+        self.vad = None
+        if settings.VAD_CONFIG['ENABLED']:
+            self.vad = VoiceActivityGate.from_settings(settings.VAD_CONFIG, wakeword_config['SAMPLE_RATE'])
+
+        # Stream history goes through a write-behind buffer, never awaited here
+        self.recorder = recorder() if settings.PERSISTENCE_CONFIG['ENABLED'] else None
+        self.stream_id = uuid.uuid4().hex
+
+        # The last few seconds of audio, written out around each panic incident
+        self.capture = None
+        if settings.CAPTURE_CONFIG['ENABLED']:
+            self.capture = PanicCapture.from_settings(clip_writer(), settings.CAPTURE_CONFIG, wakeword_config['SAMPLE_RATE'])
         
         self.logger = logging.getLogger(__name__)
         logging.basicConfig(level=logging.ERROR)
@@ -22,38 +76,177 @@ class MonitoringConsumer(AsyncWebsocketConsumer):
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(self.executor, func, *args)
 
-    async def receive(self, text_data):
-        """Handles incoming WebSocket messages, processes audio, and sends response."""
+    def _prepare_windows(self, samples, latest_only=False):
+        """
+        Feature windows due for this chunk, or none if the VAD gate judged it non-speech.
+        latest_only keeps just the newest window, for chunks coalesced under backpressure.
+        """
+        if self.capture is not None:
+            self.capture.push(samples)
+        if self.stream is not None:
+            # The rolling buffers must see every sample, so push before gating
+            windows = self.stream.push(samples)
+            if latest_only:
+                windows = windows[-1:]
+            if self.vad is not None and not self.vad.check(samples, units=len(windows)):
+                return []
+            return windows
+
+        if latest_only:
+            samples = samples[-settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']:]
+        if self.vad is not None and not self.vad.check(samples):
+            return []
+        # MFCCs are computed once and shared by both models
+        return [self.frontend.compute(samples)]
+
+    async def connect(self):
+        if self.local:
+            # Batchers are loaded on the executor; a model that failed to load refuses the connection
+            try:
+                self.pipeline = DetectionPipeline.from_settings(
+                    await registry.load_batcher('wakeword'), await registry.load_batcher('panic'),
+                    settings.INFERENCE_CONFIG['CASCADE']
+                )
+            except Exception as e:
+                logger.error(f"Refusing monitoring connection: {str(e)}")
+                await self.close(code=1011)
+                return
+        else:
+            self.remote = RemoteJobs(
+                self.channel_layer, self.channel_name,
+                self.remote_config['CHANNEL'], self.remote_config['JOB_TIMEOUT']
+            )
+
+        # receive() only queues chunks; _drain scores them one at a time, so a client
+        # sending faster than real time fills a bounded queue instead of the executor
+        self.backpressure_config = settings.BACKPRESSURE_CONFIG
+        self.queue = ChunkQueue(
+            self.backpressure_config['MAX_QUEUED_CHUNKS'],
+            self.backpressure_config['POLICY'],
+            is_speech=self.vad.has_speech if self.vad is not None else None,
+            # A coalesced chunk only has its newest window scored, so older audio is not kept
+            max_coalesced_samples=settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']
+        )
+        self.admission = admission_controller(self.backpressure_config['MAX_IN_FLIGHT'])
+        # Chunks of this connection shed by admission control; the queue counts its own drops
+        self.rejected = 0
+        self.slowed_down = False
+        # ws/monitoring/?site=<id>&region=<id> routes this stream's incidents to the dispatchers of that site and region
+        params = _query_params(self.scope)
+        site = routing_key(params.get('site', [None])[0])
+        region = routing_key(params.get('region', [None])[0])
+        if self.recorder is not None:
+            self.recorder.stream_opened(self.stream_id, self.channel_name, self.scope.get('user'), site, region)
+        # Debounces panic windows into incidents and notifies in the background
+        self.emergency = EmergencySystem(self.stream_id, recorder=self.recorder, site=site, region=region)
+        self.expiry_timer = None
+
+        await self.accept()
+        metrics.ACTIVE_CONNECTIONS.inc(consumer='monitoring')
+        self.drain_task = asyncio.ensure_future(self._drain())
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'drain_task', None) is not None:
+            self.drain_task.cancel()
+            metrics.ACTIVE_CONNECTIONS.dec(consumer='monitoring')
+        if self.remote is not None:
+            self.remote.cancel()
+        if getattr(self, 'emergency', None) is not None:
+            if self.expiry_timer is not None:
+                self.expiry_timer.cancel()
+            self.emergency.close()
+            if self.recorder is not None:
+                self.recorder.stream_closed(self.stream_id)
+        if self.capture is not None:
+            self.capture.close()
+        if self.vad is not None:
+            self.logger.info(f"Stream closed, VAD counters: {self.vad.stats()}")
+        if getattr(self, 'queue', None) is not None and (self.queue.dropped or self.queue.coalesced or self.rejected):
+            self.logger.info(
+                f"Stream closed, backpressure dropped {self.queue.dropped}, coalesced {self.queue.coalesced} "
+                f"and rejected {self.rejected} chunks"
+            )
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Decodes an incoming audio chunk and queues it for scoring."""
         try:
-            data = json.loads(text_data)
-            audio_bytes = base64.b64decode(data['audio'])
-            
-            # Run wakeword detection in a thread
-            wake_detected = await self._run_in_thread(self.wakeword_detector.detect, audio_bytes)
-            
-            # Run panic detection asynchronously
-            panic_result = await self._run_in_thread(self.panic_detector.detect, audio_bytes)
-
-            responses = []
-            if wake_detected:
-                responses.append({
-                    'type': 'wakeword',
-                    'message': 'Wakeword activated',
-                    'timestamp': data.get('timestamp')
-                })
-                
-            if panic_result.get('panic'):
-                responses.append({
-                    'type': 'panic',
-                    'confidence': panic_result['confidence'],
-                    'features': panic_result.get('features', {}),
-                    'timestamp': data.get('timestamp')
-                })
-                await self._trigger_emergency()
+            # Binary frames carry raw PCM after a fixed header; JSON/base64 is the fallback
+            with metrics.STAGE_SECONDS.time(stage='decode'):
+                if bytes_data is not None:
+                    frame = decode_binary(bytes_data)
+                else:
+                    frame = decode_json(text_data)
+        except AudioProtocolError as e:
+            await self.send(json.dumps([{
+                'type': 'error',
+                'message': str(e)
+            }]))
+            return
 
-            # Send all responses as a WebSocket message
-            if responses:
-                await self.send(json.dumps(responses))
+        self.queue.put(frame)
+        # Resuming is left to _drain, so a policy that empties the queue on put cannot flap the state
+        await self._update_flow_control(allow_resume=False)
+
+    async def _send_control(self, action, **extra):
+        await self.send(json.dumps([{
+            'type': 'control',
+            'action': action,
+            'queue_depth': len(self.queue),
+            'dropped': self.queue.dropped,
+            'rejected': self.rejected,
+            **extra
+        }]))
+
+    async def _update_flow_control(self, allow_resume=True):
+        """Asks the client to slow down past the high-water mark, and to resume once drained."""
+        depth = len(self.queue)
+        if not self.slowed_down and depth >= self.backpressure_config['SLOW_DOWN_AT']:
+            self.slowed_down = True
+            await self._send_control('slow_down')
+        elif allow_resume and self.slowed_down and depth <= self.backpressure_config['RESUME_AT']:
+            self.slowed_down = False
+            await self._send_control('resume')
+
+    async def _drain(self):
+        """Scores queued chunks in arrival order for the lifetime of the connection."""
+        while True:
+            item = await self.queue.get()
+            backlog = time.perf_counter() - item.enqueued_at
+            metrics.STAGE_SECONDS.observe(backlog, stage='backlog')
+            backlog_ms = round(backlog * 1000, 3)
+
+            # Global admission control: when every connection together has too much
+            # in flight the chunk is shed rather than left to grow the backlog
+            if not self.admission.try_acquire():
+                self.rejected += 1
+                if not self.slowed_down:
+                    self.slowed_down = True
+                    await self._send_control('slow_down', reason='server_overloaded')
+                continue
+            try:
+                await self._process(item.frame, backlog_ms, latest_only=item.coalesced)
+            finally:
+                self.admission.release()
+            await self._update_flow_control()
+
+    async def _process(self, frame, backlog_ms, latest_only=False):
+        """Runs features and detection for one queued chunk and sends the results."""
+        try:
+            # In streaming mode only the newly completed frames get STFT/MFCC work; one window per hop
+            features_start = time.perf_counter()
+            windows = await self._run_in_thread(self._prepare_windows, frame.samples, latest_only)
+            features_elapsed = time.perf_counter() - features_start
+            metrics.STAGE_SECONDS.observe(features_elapsed, stage='features')
+            features_ms = round(features_elapsed * 1000, 3)
+
+            if self.remote is not None:
+                results = await self._score_remotely(windows, frame.meta())
+            else:
+                # Windows and both models run concurrently, batched with other connections' chunks
+                results = await asyncio.gather(*(self.pipeline.run(features) for features in windows))
+            for result in results:
+                result['timings_ms'] = {'backlog': backlog_ms, 'features': features_ms, **result['timings_ms']}
+            await self._send_results(results, frame.meta())
 
         except Exception as e:
             self.logger.error(f"Processing error: {str(e)}")
@@ -62,35 +255,241 @@ class MonitoringConsumer(AsyncWebsocketConsumer):
                 'message': 'Processing failed'
             }]))
 
-    async def _trigger_emergency(self):
-        """Emergency response pipeline"""
-        await self.channel_layer.group_send(
-            "emergency_responses",
-            {
-                "type": "emergency.alert",
-                "message": "PANIC_DETECTED",
-                "channel": self.channel_name
-            }
-        )
+    async def _send_results(self, results, meta):
+        """
+        Turns detection results for one client chunk into a single WebSocket
+        message. Scores go through the stream's DecisionEngine, so only state
+        changes are sent: 'wakeword'/'panic' when a detector turns on and
+        'wakeword_end'/'panic_end' when it turns off.
+        """
+        responses = []
+        for result in results:
+            timings = result['timings_ms']
+            panic_result = result['panic']
+            panic_confidence = panic_result.get('confidence')
+
+            transitions = self.decisions.update(wakeword=result.get('wakeword_score'), panic=panic_confidence)
+            if self.recorder is not None:
+                self.recorder.scores(self.stream_id, result.get('wakeword_score'), panic_confidence)
+                for transition in transitions:
+                    self.recorder.decision(self.stream_id, transition, meta)
+            if self.send_scores:
+                responses.append({
+                    'type': 'scores',
+                    'wakeword_score': result.get('wakeword_score'),
+                    'panic_confidence': panic_confidence,
+                    'timings_ms': timings,
+                    **meta
+                })
+            for transition in transitions:
+                detector, state = transition['detector'], transition['state']
+                response = {
+                    'type': detector if state == 'on' else f'{detector}_end',
+                    'state': state,
+                    'smoothed': transition['smoothed'],
+                    'timings_ms': timings,
+                    **meta
+                }
+                if detector == 'wakeword':
+                    response['score'] = transition['score']
+                    if state == 'on':
+                        response['message'] = 'Wakeword activated'
+                else:
+                    response['confidence'] = transition['score']
+                    response['features'] = panic_result.get('features', {})
+                responses.append(response)
+
+            if panic_confidence is not None:
+                self._trigger_emergency(self.decisions.active('panic'), panic_confidence)
+
+        # Send all responses as a WebSocket message
+        if responses:
+            with metrics.STAGE_SECONDS.time(stage='send'):
+                await self.send(json.dumps(responses))
+
+    async def _score_remotely(self, windows, meta):
+        """
+        Sends windows to the inference workers and waits for their replies,
+        so the chunk keeps its admission slot while workers score it and
+        results reach the DecisionEngine in the order the windows were sent.
+        """
+        job_ids = []
+        for features in windows:
+            job_id = await self.remote.submit(features, meta)
+            if job_id is None:
+                await self.send(json.dumps([{'type': 'error', 'message': 'Inference queue full'}]))
+                break
+            job_ids.append(job_id)
+
+        results = []
+        for reply in await self.remote.results(job_ids):
+            if reply is None:
+                self.logger.warning("Inference worker reply timed out")
+                continue
+            if reply.get('error'):
+                self.logger.error(f"Inference worker error: {reply['error']}")
+                await self.send(json.dumps([{'type': 'error', 'message': 'Processing failed'}]))
+                continue
+            result = reply['result']
+            result['timings_ms'] = {**result['timings_ms'], 'round_trip': reply['round_trip_ms']}
+            results.append(result)
+        return results
+
+    async def inference_result(self, event):
+        """Reply from an inference worker; _score_remotely is waiting for it."""
+        if self.remote is not None:
+            self.remote.complete(event)
+
+    def _trigger_emergency(self, panic, confidence):
+        """Emergency response pipeline; only queues notifications, so it never waits on delivery."""
+        with metrics.STAGE_SECONDS.time(stage='emergency'):
+            for event, incident in self.emergency.observe(panic, confidence):
+                if event == 'opened' and self.capture is not None:
+                    # Clips are named after the incident, as stored by detection/persistence.py
+                    self.capture.trigger(incident.id)
+        if self.expiry_timer is None:
+            self._schedule_expiry(self.emergency.gate.seconds_until_expiry())
+
+    def _schedule_expiry(self, delay):
+        """
+        Closes a quiet incident on time. With VAD on, silence produces no
+        windows, so waiting for the next observe() could hold the incident
+        open (and PANIC_CLEARED unsent) until someone speaks again.
+        """
+        self.expiry_timer = None
+        if delay is not None:
+            self.expiry_timer = asyncio.get_running_loop().call_later(delay, self._expire_incident)
+
+    def _expire_incident(self):
+        # Windows seen since the timer was set may have pushed the deadline back; expire() reports the new one
+        self._schedule_expiry(self.emergency.expire())
+
+
+@database_sync_to_async
+def _open_incidents(subscriptions, limit):
+    from .models import Incident
+    selected = {kind: [key for k, key in subscriptions if k == kind] for kind in ROUTING_KINDS}
+    incidents = Incident.objects.open_for(
+        sites=selected['site'], regions=selected['region'], streams=selected['stream'],
+        everything=('all', None) in subscriptions
+    )
+    return [incident.to_dict() for incident in incidents[:limit]]
 
 
 class EmergencyConsumer(AsyncWebsocketConsumer):
+    """
+    Dispatcher dashboard. Dispatchers subscribe to incidents by site,
+    region or stream, in the query string (ws/emergency/?site=lobby,atrium)
+    or with {"type": "subscribe", "site": [...], "region": [...],
+    "stream": [...]} messages; "all": true subscribes to everything. Each
+    subscription is a channel-layer group, so an alert is only routed to
+    the dispatchers that asked for it, and it arrives already serialized
+    (see detection.alerts.DashboardBackend). New subscriptions are
+    answered with a snapshot of their open incidents.
+    """
+
     async def connect(self):
-        """Accepts the WebSocket connection."""
+        """Accepts the WebSocket connection and joins the subscriptions in its query string."""
+        self.config = settings.ALERT_CONFIG['DASHBOARD']
+        self.subscriptions = set()
+        # Keys of recently forwarded alerts; overlapping subscriptions deliver the same alert more than once
+        self._seen = OrderedDict()
         await self.accept()
+        metrics.ACTIVE_CONNECTIONS.inc(consumer='emergency')
         await self.send(text_data=json.dumps({"message": "Connected to EmergencyConsumer"}))
 
+        params = _query_params(self.scope)
+        request = {kind: ','.join(params[kind]).split(',') for kind in ROUTING_KINDS if kind in params}
+        request['all'] = params.get('all', [''])[0] in ('1', 'true')
+        if any(request.values()):
+            await self._subscribe(request)
+
     async def disconnect(self, close_code):
         """Handles disconnection."""
-        print(f"Disconnected with code {close_code}")
+        metrics.ACTIVE_CONNECTIONS.dec(consumer='emergency')
+        for kind, key in getattr(self, 'subscriptions', ()):
+            await self.channel_layer.group_discard(self._group(kind, key), self.channel_name)
+        logger.info(f"Dispatcher disconnected with code {close_code}")
+
+    def _group(self, kind, key):
+        return alert_group(kind, key, self.config['GROUP_PREFIX'])
+
+    @staticmethod
+    def _requested(data):
+        """(kind, key) pairs asked for in a subscribe message, and the keys that are not valid."""
+        requested, rejected = [], []
+        for kind in ROUTING_KINDS:
+            values = data.get(kind) or []
+            for value in [values] if isinstance(values, str) else values:
+                key = routing_key(value)
+                if key is None:
+                    rejected.append(f"{kind}:{value}")
+                else:
+                    requested.append((kind, key))
+        if data.get('all') is True:
+            requested.append(('all', None))
+        return requested, rejected
+
+    async def _subscribe(self, data):
+        requested, rejected = self._requested(data)
+        added = []
+        for subscription in requested:
+            if subscription in self.subscriptions:
+                continue
+            if len(self.subscriptions) >= self.config['MAX_SUBSCRIPTIONS']:
+                rejected.append(f"{subscription[0]}:{subscription[1]} (limit of {self.config['MAX_SUBSCRIPTIONS']})")
+                continue
+            # Joined before the snapshot is read, so no event falls between the two
+            await self.channel_layer.group_add(self._group(*subscription), self.channel_name)
+            self.subscriptions.add(subscription)
+            added.append(subscription)
+        await self._send_subscriptions(rejected)
+        if added:
+            await self._send_snapshot(added)
+
+    async def _unsubscribe(self, data):
+        requested, rejected = self._requested(data)
+        for subscription in requested:
+            if subscription in self.subscriptions:
+                await self.channel_layer.group_discard(self._group(*subscription), self.channel_name)
+                self.subscriptions.discard(subscription)
+        await self._send_subscriptions(rejected)
+
+    async def _send_subscriptions(self, rejected):
+        current = {kind: sorted(key for k, key in self.subscriptions if k == kind) for kind in ROUTING_KINDS}
+        current['all'] = ('all', None) in self.subscriptions
+        await self.send(text_data=json.dumps({'type': 'subscriptions', **current, 'rejected': rejected}))
+
+    async def _send_snapshot(self, subscriptions):
+        """Open incidents for new subscriptions, from the incident history (empty when persistence is off)."""
+        incidents = []
+        if settings.PERSISTENCE_CONFIG['ENABLED']:
+            try:
+                incidents = await _open_incidents(subscriptions, self.config['SNAPSHOT_LIMIT'])
+            except Exception as e:
+                logger.error(f"Open incident snapshot failed: {str(e)}")
+        await self.send(text_data=json.dumps({'type': 'snapshot', 'incidents': incidents}))
+
+    async def emergency_alert(self, event):
+        """An incident event from DashboardBackend, forwarded as the text it was serialized to."""
+        if event['key'] in self._seen:
+            return
+        self._seen[event['key']] = None
+        if len(self._seen) > 256:
+            self._seen.popitem(last=False)
+        await self.send(text_data=event['text'])
 
     async def receive(self, text_data):
-        """Handles emergency messages."""
+        """Handles subscription changes and emergency messages."""
         try:
             data = json.loads(text_data)
             message_type = data.get("type")
 
-            if message_type == "emergency_alert":
+            if message_type == "subscribe":
+                await self._subscribe(data)
+            elif message_type == "unsubscribe":
+                await self._unsubscribe(data)
+            elif message_type == "emergency_alert":
                 response = {
                     "type": "emergency_response",
                     "message": "Emergency alert received!",
@@ -99,5 +498,5 @@ class EmergencyConsumer(AsyncWebsocketConsumer):
                 await self.send(text_data=json.dumps(response))
 
         except Exception as e:
-            print(f"Error processing emergency message: {e}")
+            logger.error(f"Error processing emergency message: {str(e)}")
             await self.send(text_data=json.dumps({"type": "error", "message": "Invalid data format"}))
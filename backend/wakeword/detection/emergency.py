@@ -1,30 +1,66 @@
 # detection/emergency.py
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
+from .alerts import AlertGate, notifier
+
 
 class EmergencySystem:
-    def __init__(self):
-        self.channel_layer = get_channel_layer()
-        
-    def send_alert(self, message):
-        async_to_sync(self.channel_layer.group_send)(
-            "emergency_responses",
-            {
-                "type": "emergency.message",
-                "content": message
-            }
-        )
-
-    def handle_panic(self, confidence):
+    """
+    Emergency protocols for one monitored stream.
+
+    Panic detections pass through an AlertGate, so a sustained scream
+    becomes one incident rather than an alert per window. Incident events
+    are handed to the shared Notifier and delivered in the background;
+    nothing here awaits a channel layer, SMS gateway or mail server.
+    With a `recorder` (detection/persistence.py), each event's incident
+    snapshot is also queued for the database. `site` and `region` label
+    the stream's incidents, which decides which dispatchers see them.
+    """
+
+    def __init__(self, stream, gate=None, alert_notifier=None, recorder=None, site=None, region=None):
+        self.gate = gate or AlertGate.from_settings(stream, settings.ALERT_CONFIG, site, region)
+        self.notifier = alert_notifier or notifier()
+        self.recorder = recorder
+
+    def observe(self, panic, confidence):
+        """Feeds one scored window; returns the incident events it raised."""
+        events = self.gate.update(panic, confidence)
+        self._dispatch(events)
+        return events
+
+    def expire(self):
+        """
+        Closes the open incident once it has been quiet for QUIET_SECONDS.
+        Called on a timer, since silent audio produces no windows to observe;
+        returns how long until it is due again, or None with no open incident.
+        """
+        self._dispatch(self.gate.expire())
+        return self.gate.seconds_until_expiry()
+
+    def close(self):
+        """Closes any open incident, e.g. when the stream disconnects."""
+        self._dispatch(self.gate.close())
+
+    def _dispatch(self, events):
+        for event, incident in events:
+            if self.recorder is not None:
+                self.recorder.incident(incident)
+            self.send_alert(event, incident)
+            if event == 'escalated':
+                self.handle_panic(incident)
+
+    def send_alert(self, event, incident):
+        """Broadcasts an incident event to EmergencyConsumer dashboards."""
+        self.notifier.submit(event, incident, kinds=('dashboard',))
+
+    def handle_panic(self, incident):
         """Execute emergency protocols"""
-        if confidence > 0.8:
-            self.trigger_sirens()
-            self.notify_authorities()
-            
-    def trigger_sirens(self):
+        self.trigger_sirens(incident)
+        self.notify_authorities(incident)
+
+    def trigger_sirens(self, incident):
         # IoT integration
-        pass
-        
-    def notify_authorities(self):
+        self.notifier.submit('escalated', incident, kinds=('siren',))
+
+    def notify_authorities(self, incident):
         # SMS/Email integrations
-        pass
\ No newline at end of file
+        self.notifier.submit('escalated', incident, kinds=('contact',))
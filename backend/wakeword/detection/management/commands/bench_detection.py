@@ -0,0 +1,312 @@
+import os
+import io
+import glob
+import json
+import time
+import base64
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from detection.utils.model_registry import registry
+from detection.utils.audio_protocol import encode_frame
+from detection.utils.stub_models import StubWakeWordDetector, StubPanicDetector
+
+try:
+    import psutil
+except ImportError:  # CPU and RSS are reported as None without psutil
+    psutil = None
+
+DEFAULT_AUDIO_GLOB = os.path.join(settings.BASE_DIR.parent.parent, 'custom_audio', '*.wav')
+PATHS = ('ws', 'stream', 'upload')
+SAMPLE_RATE = 16000
+
+
+def load_pcm(path):
+    """Mono int16 PCM of a WAV file at 16 kHz."""
+    audio, sample_rate = sf.read(path, dtype='int16', always_2d=True)
+    audio = audio.mean(axis=1).astype(np.int16)
+    if sample_rate != SAMPLE_RATE:
+        from scipy.signal import resample_poly
+        audio = resample_poly(audio.astype(np.float32), SAMPLE_RATE, sample_rate).astype(np.int16)
+    return audio
+
+
+def percentiles(latencies):
+    values = np.array(latencies, dtype=np.float64) * 1000
+    if not values.size:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'max': round(float(values.max()), 3),
+        'mean': round(float(values.mean()), 3),
+    }
+
+
+class ResourceSampler:
+    """CPU use and RSS of this process while a benchmark phase runs."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.process = psutil.Process(os.getpid()) if psutil is not None else None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.rss_peak = max(self.rss_peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.process is not None:
+            self.cpu_start = self.process.cpu_times()
+            self.rss_start = self.rss_peak = self.process.memory_info().rss
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        if self.process is not None:
+            self._stop.set()
+            self._thread.join()
+            cpu_end = self.process.cpu_times()
+            self.cpu_seconds = (cpu_end.user - self.cpu_start.user) + (cpu_end.system - self.cpu_start.system)
+            self.rss_end = self.process.memory_info().rss
+            self.rss_peak = max(self.rss_peak, self.rss_end)
+
+    def report(self):
+        if self.process is None:
+            return {'elapsed_s': round(self.elapsed, 3), 'cpu_percent': None, 'rss_bytes': None}
+        return {
+            'elapsed_s': round(self.elapsed, 3),
+            'cpu_percent': round(self.cpu_seconds / self.elapsed * 100, 1),
+            'rss_bytes': {'start': self.rss_start, 'end': self.rss_end, 'peak': self.rss_peak},
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays audio as N concurrent real-time streams against MonitoringConsumer (in-memory "
+        "channel layer) and the REST detection endpoints; reports throughput, latency, CPU and RSS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help=f'WAV files to replay (default: {DEFAULT_AUDIO_GLOB})')
+        parser.add_argument('--synthetic', action='store_true', help='Replay synthetic PCM instead of WAV files')
+        parser.add_argument('--paths', nargs='*', default=list(PATHS), choices=PATHS)
+        parser.add_argument('--streams', type=int, default=8, help='Concurrent streams / clients')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of audio sent by each stream')
+        parser.add_argument('--chunk-ms', type=int, default=500, help='Audio per WebSocket message / REST request')
+        parser.add_argument('--speed', type=float, default=1.0, help='1.0 sends at real time, 0 as fast as possible')
+        parser.add_argument('--drain-timeout', type=float, default=2.0, help='Seconds to wait for late responses')
+        parser.add_argument('--stub', action='store_true', help='Use stub models so no model files are needed')
+        parser.add_argument('--stub-latency-ms', type=float, default=5.0)
+        parser.add_argument('--stub-per-item-ms', type=float, default=0.5)
+        parser.add_argument('--json', action='store_true', help='Print machine-readable output')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def _audio(self, options):
+        if not options['synthetic']:
+            files = options['files'] or sorted(glob.glob(DEFAULT_AUDIO_GLOB))
+            if files:
+                return np.concatenate([load_pcm(path) for path in files])
+        rng = np.random.default_rng(0)
+        # Speech-like level with slow amplitude modulation so the VAD gate sees both speech and pauses
+        t = np.arange(SAMPLE_RATE * 10) / SAMPLE_RATE
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 0.3 * t)
+        return (rng.standard_normal(t.size) * 4000 * envelope).astype(np.int16)
+
+    def _stream_chunks(self, audio, index, options):
+        """Chunks for one stream: the audio looped from a per-stream offset."""
+        chunk = SAMPLE_RATE * options['chunk_ms'] // 1000
+        count = max(1, int(options['duration'] * 1000 // options['chunk_ms']))
+        offset = (index * len(audio)) // max(options['streams'], 1)
+        looped = np.resize(np.roll(audio, -offset), max(count * chunk, len(audio)))
+        return [looped[i * chunk:(i + 1) * chunk] for i in range(count)]
+
+    def _pace(self, start, index, options):
+        """Seconds to wait before sending chunk `index` so the stream runs at the requested speed."""
+        if options['speed'] <= 0:
+            return 0.0
+        due = start + index * options['chunk_ms'] / 1000 / options['speed']
+        return max(0.0, due - time.perf_counter())
+
+    # WebSocket path
+
+    async def _ws_stream(self, chunks, options, totals):
+        from channels.testing import WebsocketCommunicator
+        from detection.consumers import MonitoringConsumer
+
+        communicator = WebsocketCommunicator(MonitoringConsumer.as_asgi(), '/ws/monitoring/')
+        connected, _ = await communicator.connect(timeout=30)
+        if not connected:
+            totals['errors'] += 1
+            return
+
+        sent_at = {}
+        sending = True
+
+        async def receive():
+            idle_since = None
+            while True:
+                # receive_from() with a timeout would cancel the consumer, so poll instead
+                if await communicator.receive_nothing(timeout=0.01, interval=0.002):
+                    if sending:
+                        continue
+                    idle_since = idle_since or time.perf_counter()
+                    if not sent_at or time.perf_counter() - idle_since > options['drain_timeout']:
+                        return
+                    continue
+                idle_since = None
+                received = time.perf_counter()
+                for message in json.loads(await communicator.receive_from()):
+                    if message['type'] == 'control':
+                        totals['control'][message['action']] = totals['control'].get(message['action'], 0) + 1
+                    elif message['type'] == 'error':
+                        totals['errors'] += 1
+                    elif message.get('sequence') in sent_at:
+                        # Score and state-change replies for one chunk share a sequence; time the first
+                        totals['latencies'].append(received - sent_at.pop(message['sequence']))
+                        totals['answered'] += 1
+
+        receiver = asyncio.ensure_future(receive())
+        start = time.perf_counter()
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(self._pace(start, index, options))
+            sent_at[index] = time.perf_counter()
+            await communicator.send_to(bytes_data=encode_frame(chunk, sequence=index, timestamp_ms=int(time.time() * 1000)))
+            totals['sent'] += 1
+        sending = False
+        await receiver
+        await communicator.disconnect()
+
+    def _bench_ws(self, audio, options):
+        totals = {'sent': 0, 'answered': 0, 'errors': 0, 'control': {}, 'latencies': []}
+
+        async def run():
+            await asyncio.gather(*(
+                self._ws_stream(self._stream_chunks(audio, i, options), options, totals)
+                for i in range(options['streams'])
+            ))
+
+        with ResourceSampler() as sampler:
+            asyncio.run(run())
+        return self._report(totals, sampler, options, answered_key='windows_answered')
+
+    # REST paths
+
+    def _rest_client(self, path, chunks, options, totals, lock):
+        client = Client()
+        window = settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']
+        history = np.zeros(window, dtype=np.int16)
+        start = time.perf_counter()
+        for index, chunk in enumerate(chunks):
+            time.sleep(self._pace(start, index, options))
+            # Without server-side stream state a REST client re-sends its latest full window each time
+            history = np.concatenate([history, chunk])[-window:]
+            request_start = time.perf_counter()
+            if path == 'stream':
+                response = client.post(
+                    '/api/stream/',
+                    data=json.dumps({'audio': base64.b64encode(history.tobytes()).decode(), 'timestamp': index}),
+                    content_type='application/json'
+                )
+            else:
+                wav = io.BytesIO()
+                sf.write(wav, history, SAMPLE_RATE, format='WAV', subtype='PCM_16')
+                wav.name = 'chunk.wav'
+                wav.seek(0)
+                response = client.post('/api/audio/upload/', data={'audio': wav})
+            elapsed = time.perf_counter() - request_start
+            with lock:
+                totals['sent'] += 1
+                if response.status_code == 200:
+                    totals['answered'] += 1
+                    totals['latencies'].append(elapsed)
+                else:
+                    totals['errors'] += 1
+                    totals.setdefault('status_codes', {})
+                    totals['status_codes'][response.status_code] = totals['status_codes'].get(response.status_code, 0) + 1
+
+    def _bench_rest(self, path, audio, options):
+        totals = {'sent': 0, 'answered': 0, 'errors': 0, 'latencies': []}
+        lock = threading.Lock()
+        with ResourceSampler() as sampler:
+            with ThreadPoolExecutor(max_workers=options['streams']) as pool:
+                futures = [
+                    pool.submit(self._rest_client, path, self._stream_chunks(audio, i, options), options, totals, lock)
+                    for i in range(options['streams'])
+                ]
+                for future in futures:
+                    future.result()
+        return self._report(totals, sampler, options, answered_key='requests_ok')
+
+    def _report(self, totals, sampler, options, answered_key):
+        resources = sampler.report()
+        elapsed = resources['elapsed_s']
+        audio_seconds = totals['sent'] * options['chunk_ms'] / 1000
+        report = {
+            'streams': options['streams'],
+            'chunks_sent': totals['sent'],
+            answered_key: totals['answered'],
+            'errors': totals['errors'],
+            'throughput_per_s': round(totals['answered'] / elapsed, 2) if elapsed else None,
+            'audio_seconds_per_s': round(audio_seconds / elapsed, 2) if elapsed else None,
+            'latency_ms': percentiles(totals['latencies']),
+            **resources,
+        }
+        if 'control' in totals:
+            report['control_messages'] = totals['control']
+        if 'status_codes' in totals:
+            report['status_codes'] = {str(k): v for k, v in totals['status_codes'].items()}
+        return report
+
+    def handle(self, *args, **options):
+        if options['stub']:
+            registry.install('wakeword', StubWakeWordDetector(options['stub_latency_ms'], options['stub_per_item_ms']))
+            registry.install('panic', StubPanicDetector(options['stub_latency_ms'], options['stub_per_item_ms']))
+        audio = self._audio(options)
+
+        overrides = {
+            # The benchmark is self-contained: no Redis and no inference workers
+            'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            # Every scored window is answered, not just detector state changes, so each can be timed
+            'INFERENCE_CONFIG': {**settings.INFERENCE_CONFIG, 'MODE': 'local', 'SEND_SCORES': True},
+            'ALLOWED_HOSTS': ['testserver', *settings.ALLOWED_HOSTS],
+        }
+        report = {
+            'config': {key: options[key] for key in ('streams', 'duration', 'chunk_ms', 'speed', 'stub', 'synthetic')},
+            'models': registry.status(),
+            'results': {},
+        }
+        # Failed requests are counted in the report; one log line each would drown the output
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with override_settings(**overrides):
+            registry.warmup()
+            for path in options['paths']:
+                if path == 'ws':
+                    report['results'][path] = self._bench_ws(audio, options)
+                else:
+                    report['results'][path] = self._bench_rest(path, audio, options)
+        report['models'] = {name: registry.status()[name] for name in ('wakeword', 'panic')}
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        for path, result in report['results'].items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{path:>7}: {result['chunks_sent']} sent, {result['errors']} errors, "
+                f"{result['throughput_per_s']}/s, p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                f"p99 {latency['p99']} ms, cpu {result['cpu_percent']}%"
+            )
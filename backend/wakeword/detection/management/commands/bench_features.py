@@ -0,0 +1,138 @@
+import json
+import time
+import numpy as np
+import librosa
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from detection.utils.features import FeatureFrontend
+from detection.utils.clip_stats import ClipStatsFrontend
+from detection.training.features import extract_features
+
+
+def legacy_features(audio_bytes):
+    """The pre-FeatureFrontend path: each detector decoded and ran librosa.feature.mfcc itself."""
+    # WakeWordDetector.preprocess_audio
+    audio = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32)
+    mfcc = librosa.feature.mfcc(y=audio, sr=16000, n_mfcc=40, n_fft=512, hop_length=160)
+    wakeword = ((mfcc - np.mean(mfcc)) / np.std(mfcc)).T.astype(np.float32)[np.newaxis, ...]
+
+    # PanicDetector.extract_features
+    audio = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32)
+    panic = librosa.feature.mfcc(y=audio, sr=16000, n_mfcc=40, n_fft=512, hop_length=160)
+    return wakeword, panic
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks per-chunk feature extraction (legacy double librosa path vs FeatureFrontend, "
+        "one chunk at a time and batched) and checks FeatureFrontend against librosa. With --clip-stats, "
+        "does the same for the panic model's clip statistics (extract_features vs ClipStatsFrontend)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=200, help='Number of chunks to time')
+        parser.add_argument('--wav', nargs='*', default=[], help='WAV files to cut chunks from (synthetic PCM if omitted)')
+        parser.add_argument('--batch-size', type=int, default=16, help='Chunks per compute_batch call')
+        parser.add_argument('--tolerance', type=float, default=1e-2,
+                            help='Largest allowed absolute MFCC difference from librosa')
+        parser.add_argument('--clip-stats', action='store_true',
+                            help='Also time and check ClipStatsFrontend against extract_features')
+        parser.add_argument('--clip-stats-tolerance', type=float, default=1e-2,
+                            help='Largest allowed clip statistic difference, relative to the value (or 1, if larger)')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable output')
+
+    def _chunks(self, options):
+        size = settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']
+        rng = np.random.default_rng(0)
+        sources = []
+        for path in options['wav']:
+            audio, _ = librosa.load(path, sr=16000)
+            pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+            sources.extend(pcm[i:i + size] for i in range(0, len(pcm) - size + 1, size))
+        if not sources:
+            sources = [(rng.standard_normal(size) * 3000).astype(np.int16) for _ in range(8)]
+        return [sources[i % len(sources)].tobytes() for i in range(options['chunks'])]
+
+    def handle(self, *args, **options):
+        chunks = self._chunks(options)
+        frontend = FeatureFrontend()
+
+        # Warm both paths so one-off JIT / allocation costs are not timed
+        legacy_features(chunks[0])
+        frontend.compute(chunks[0]).wakeword_view()
+
+        start = time.perf_counter()
+        for chunk in chunks:
+            legacy_features(chunk)
+        legacy = (time.perf_counter() - start) / len(chunks)
+
+        start = time.perf_counter()
+        for chunk in chunks:
+            features = frontend.compute(chunk)
+            features.wakeword_view()
+            features.panic_view()
+        shared = (time.perf_counter() - start) / len(chunks)
+
+        pcm = np.stack([np.frombuffer(chunk, dtype=np.int16) for chunk in chunks])
+        size = options['batch_size']
+        start = time.perf_counter()
+        for i in range(0, len(pcm), size):
+            frontend.compute_batch(pcm[i:i + size])
+        batched = (time.perf_counter() - start) / len(chunks)
+
+        # Every chunk, not just the first, is checked against librosa
+        diff_panic = diff_wakeword = 0.0
+        for chunk in chunks[:min(len(chunks), 32)]:
+            wakeword, panic = legacy_features(chunk)
+            features = frontend.compute(chunk)
+            diff_panic = max(diff_panic, float(np.abs(panic - features.mfcc).max()))
+            diff_wakeword = max(diff_wakeword, float(np.abs(wakeword[0] - features.wakeword_view()).max()))
+        result = {
+            'chunks': len(chunks),
+            'legacy_ms_per_chunk': round(legacy * 1000, 3),
+            'frontend_ms_per_chunk': round(shared * 1000, 3),
+            'frontend_batched_ms_per_chunk': round(batched * 1000, 3),
+            'speedup': round(legacy / shared, 2),
+            'max_abs_diff_panic': diff_panic,
+            'max_abs_diff_wakeword': diff_wakeword,
+        }
+
+        if options['clip_stats']:
+            result.update(self._clip_stats(pcm, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+        else:
+            for key, value in result.items():
+                self.stdout.write(f"{key:>31}: {value}")
+
+        if max(diff_panic, diff_wakeword) > options['tolerance']:
+            raise CommandError(f"FeatureFrontend differs from librosa by more than {options['tolerance']}")
+        if options['clip_stats'] and result['max_rel_diff_clip_stats'] > options['clip_stats_tolerance']:
+            raise CommandError(
+                f"ClipStatsFrontend differs from extract_features by more than {options['clip_stats_tolerance']}"
+            )
+
+    @staticmethod
+    def _clip_stats(pcm, options):
+        """Per-window extract_features (what PanicDetector ran before) vs one ClipStatsFrontend pass per batch."""
+        frontend = ClipStatsFrontend()
+        chunks = pcm[:min(len(pcm), 64)]
+        clips = frontend.clip_audio(chunks)
+        extract_features(clips[0])
+        frontend.compute_batch(chunks[:1])
+
+        start = time.perf_counter()
+        expected = np.stack([extract_features(clip) for clip in clips])
+        legacy = (time.perf_counter() - start) / len(chunks)
+
+        size = options['batch_size']
+        start = time.perf_counter()
+        batched = np.concatenate([frontend.compute_batch(chunks[i:i + size]) for i in range(0, len(chunks), size)])
+        elapsed = (time.perf_counter() - start) / len(chunks)
+        return {
+            'clip_stats_librosa_ms_per_chunk': round(legacy * 1000, 3),
+            'clip_stats_batched_ms_per_chunk': round(elapsed * 1000, 3),
+            'clip_stats_speedup': round(legacy / elapsed, 2),
+            'max_rel_diff_clip_stats': float((np.abs(batched - expected) / np.maximum(1.0, np.abs(expected))).max()),
+        }
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from detection.utils.panic_detection import BACKENDS, panic_model_path
+
+HEAVY_MODULES = ('torch', 'onnxruntime', 'librosa', 'numba', 'scipy')
+
+# Runs in a fresh interpreter so every import is cold
+PROBE = r'''
+import sys, time, json
+started = time.perf_counter()
+stages = {}
+
+def mark(name, since):
+    stages[name] = round((time.perf_counter() - since) * 1000, 2)
+    return time.perf_counter()
+
+t = time.perf_counter()
+import django
+django.setup()
+t = mark('django_setup', t)
+import wakeword.asgi
+t = mark('import_asgi', t)
+loaded = [m for m in HEAVY if m in sys.modules]
+
+import numpy as np
+from detection.utils.model_registry import registry
+wakeword = registry.wakeword_detector()
+t = mark('load_wakeword', t)
+panic = registry.panic_detector()
+t = mark('load_panic', t)
+
+audio = (np.random.default_rng(0).standard_normal(CHUNK) * 3000).astype(np.int16)
+if wakeword is not None:
+    wakeword.detect(audio)
+panic.detect(audio)
+mark('first_inference', t)
+stages['time_to_first_inference'] = round((time.perf_counter() - started) * 1000, 2)
+print(json.dumps({'stages_ms': stages, 'heavy_modules_after_import': loaded}))
+'''
+
+
+class Command(BaseCommand):
+    help = "Measures cold-start time to first inference in fresh processes, per panic backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='*', default=list(BACKENDS))
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes per backend; medians are reported')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable output')
+
+    def _probe(self, backend):
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ['DJANGO_SETTINGS_MODULE'],
+            PANIC_BACKEND=backend,
+            # Models are loaded explicitly by the probe so each stage is timed on its own
+            INFERENCE_WARMUP='False',
+            INFERENCE_MODE='local',
+        )
+        code = PROBE.replace('HEAVY', repr(HEAVY_MODULES)).replace(
+            'CHUNK', str(settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE'])
+        )
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        wall_ms = round((time.perf_counter() - start) * 1000, 2)
+        if completed.returncode != 0:
+            return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'}
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        # Includes interpreter start-up, which the in-process timings cannot see
+        result['stages_ms']['process_wall'] = wall_ms
+        return result
+
+    def handle(self, *args, **options):
+        report = {}
+        for backend in options['backends']:
+            path = panic_model_path(settings.MODEL_CONFIG['PANIC'], backend)
+            if not os.path.exists(path):
+                report[backend] = {'error': f'missing artifact {path}'}
+                continue
+            runs = [self._probe(backend) for _ in range(options['runs'])]
+            failed = [r for r in runs if 'error' in r]
+            if failed:
+                report[backend] = failed[0]
+                continue
+            report[backend] = {
+                'stages_ms': {
+                    stage: round(float(np.median([r['stages_ms'][stage] for r in runs])), 2)
+                    for stage in runs[0]['stages_ms']
+                },
+                'heavy_modules_after_import': runs[0]['heavy_modules_after_import'],
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        for backend, entry in report.items():
+            if 'error' in entry:
+                self.stdout.write(f"{backend:>12}: {entry['error']}")
+                continue
+            stages = ', '.join(f"{k}={v}" for k, v in entry['stages_ms'].items())
+            self.stdout.write(f"{backend:>12}: {stages}; loaded at import: {entry['heavy_modules_after_import']}")
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import itertools
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from detection.utils.execution import available_cpus, resolve_affinity
+
+# Runs in a fresh interpreter per configuration: onnxruntime sessions and torch's
+# inter-op pool are sized once per process and cannot be resized in place
+PROBE = r'''
+import os, sys, json, time, asyncio
+import django
+django.setup()
+import numpy as np
+from django.conf import settings
+from detection.utils.model_registry import registry
+from detection.utils.pipeline import DetectionPipeline
+from detection.utils.features import shared_frontend
+
+if STUB:
+    from detection.utils.stub_models import StubWakeWordDetector, StubPanicDetector
+    registry.install('wakeword', StubWakeWordDetector())
+    registry.install('panic', StubPanicDetector())
+registry.warmup()
+frontend = shared_frontend()
+executor = registry.executor()
+rng = np.random.default_rng(0)
+clips = [(rng.standard_normal(CHUNK) * 3000).astype(np.int16) for _ in range(8)]
+
+
+async def stream(index, pipeline, deadline, latencies):
+    # Closed loop: each stream sends its next window as soon as the previous one is scored
+    loop = asyncio.get_running_loop()
+    n = index
+    while loop.time() < deadline:
+        start = time.perf_counter()
+        features = await loop.run_in_executor(executor, frontend.compute, clips[n % len(clips)])
+        await pipeline.run(features)
+        latencies.append(time.perf_counter() - start)
+        n += 1
+
+
+async def main():
+    pipeline = DetectionPipeline.from_settings(
+        registry.batcher('wakeword'), registry.batcher('panic'), settings.INFERENCE_CONFIG['CASCADE']
+    )
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(stream(i, pipeline, loop.time() + 1.0, []) for i in range(STREAMS)))
+    latencies = []
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(stream(i, pipeline, loop.time() + DURATION, latencies) for i in range(STREAMS)))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    values = np.array(latencies) * 1000
+    plan = registry.status()['execution']
+    print(json.dumps({
+        'plan': plan,
+        'windows': len(latencies),
+        'throughput': round(len(latencies) / wall, 2),
+        'latency_ms': {p: round(float(np.percentile(values, int(p[1:]))), 3) for p in ('p50', 'p95', 'p99')},
+        'cpu_utilization': round(cpu / wall / plan['cores'], 3),
+        'threads': len(os.listdir('/proc/self/task')) if os.path.isdir('/proc/self/task') else None,
+    }))
+
+
+asyncio.run(main())
+'''
+
+
+def _counts(text):
+    return sorted({int(value) for value in text.split(',') if value.strip()})
+
+
+class Command(BaseCommand):
+    help = (
+        "Sweeps executor and intra-op thread counts in fresh processes under a concurrent stream load, "
+        "and reports the fastest configuration that meets a p99 latency budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=_counts, help='Executor thread counts to try, e.g. 4,8,16')
+        parser.add_argument('--intra-op', type=_counts, help='Intra-op thread counts per model call, e.g. 1,2,4')
+        parser.add_argument('--streams', type=int, default=16, help='Concurrent closed-loop streams')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds measured per configuration')
+        parser.add_argument('--max-p99-ms', type=float, default=500.0,
+                            help='Latency budget per window; the default is one streaming hop')
+        parser.add_argument('--stub', action='store_true', help='Stub models, so only features and scheduling are measured')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable output')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def _grid(self, options):
+        cpus = available_cpus()
+        cores = len(resolve_affinity(settings.MODEL_CONFIG['EXECUTION']['AFFINITY'], cpus) or cpus)
+        workers = options['workers'] or sorted({max(1, cores // 2), max(2, cores), 2 * cores})
+        intra = options['intra_op'] or sorted({count for count in (1, 2, 4) if count <= cores} or {1})
+        return cores, list(itertools.product(workers, intra))
+
+    def _probe(self, workers, intra, options):
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ['DJANGO_SETTINGS_MODULE'],
+            INFERENCE_EXECUTOR_WORKERS=str(workers),
+            INFERENCE_INTRA_OP_THREADS=str(intra),
+            INFERENCE_WARMUP='False',
+            INFERENCE_MODE='local',
+        )
+        code = (
+            PROBE.replace('STUB', repr(options['stub']))
+            .replace('STREAMS', str(options['streams']))
+            .replace('DURATION', repr(options['duration']))
+            .replace('CHUNK', str(settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']))
+        )
+        completed = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'}
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    @staticmethod
+    def _best(results, max_p99_ms):
+        """Highest throughput within the latency budget, or the lowest p99 if nothing meets it."""
+        measured = [r for r in results if 'error' not in r]
+        if not measured:
+            return None
+        within = [r for r in measured if r['latency_ms']['p99'] <= max_p99_ms]
+        if within:
+            return max(within, key=lambda r: (r['throughput'], -r['latency_ms']['p99']))
+        return min(measured, key=lambda r: r['latency_ms']['p99'])
+
+    def handle(self, *args, **options):
+        if options['streams'] < 1 or options['duration'] <= 0:
+            raise CommandError("--streams and --duration must be positive")
+        cores, grid = self._grid(options)
+
+        results = []
+        for workers, intra in grid:
+            result = self._probe(workers, intra, options)
+            result['config'] = {'executor_workers': workers, 'intra_op_threads': intra}
+            results.append(result)
+            if not options['json']:
+                self.stdout.write(self._line(result))
+
+        best = self._best(results, options['max_p99_ms'])
+        report = {
+            'cores': cores,
+            'streams': options['streams'],
+            'duration': options['duration'],
+            'stub': options['stub'],
+            'max_p99_ms': options['max_p99_ms'],
+            'results': results,
+            'best': best['config'] if best is not None else None,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=1)
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        if best is None:
+            raise CommandError("Every configuration failed")
+        if best['latency_ms']['p99'] > options['max_p99_ms']:
+            self.stdout.write(f"No configuration met p99 <= {options['max_p99_ms']} ms; lowest p99:")
+        self.stdout.write(
+            f"Best for {cores} cores and {options['streams']} streams: "
+            f"INFERENCE_EXECUTOR_WORKERS={best['config']['executor_workers']} "
+            f"INFERENCE_INTRA_OP_THREADS={best['config']['intra_op_threads']}"
+        )
+
+    @staticmethod
+    def _line(result):
+        config = result['config']
+        label = f"workers={config['executor_workers']:>3} intra_op={config['intra_op_threads']:>2}"
+        if 'error' in result:
+            return f"{label}: {result['error']}"
+        latency = result['latency_ms']
+        return (
+            f"{label}: {result['throughput']:8.1f} windows/s, p50 {latency['p50']:.1f} ms, "
+            f"p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms, cpu {result['cpu_utilization']:.0%}, "
+            f"{result['threads']} threads"
+        )
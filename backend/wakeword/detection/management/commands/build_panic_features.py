@@ -0,0 +1,59 @@
+import os
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from detection.training.features import DEFAULT_PARAMS
+from detection.training.pipeline import build_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Extracts (and augments) panic-model training features from a TESS-style dataset across a process pool, "
+        "reusing cached features for files seen before."
+    )
+
+    def add_arguments(self, parser):
+        config = settings.TRAINING_CONFIG
+        parser.add_argument('dataset', help='Directory of labelled .wav files, e.g. the TESS data folder')
+        parser.add_argument('--output', required=True, help='Directory for features.npy, labels.npy, manifest.json, feature_spec.json')
+        parser.add_argument('--cache-dir', default=config['CACHE_DIR'])
+        parser.add_argument('--workers', type=int, default=config['WORKERS'], help='Extraction processes (0 = in-process)')
+        parser.add_argument('--no-augment', action='store_true', help='Skip the panic-class augmentations')
+        parser.add_argument('--sample-rate', type=int, default=DEFAULT_PARAMS['SAMPLE_RATE'])
+        parser.add_argument('--duration', type=float, default=DEFAULT_PARAMS['DURATION'])
+        parser.add_argument('--n-mfcc', type=int, default=DEFAULT_PARAMS['N_MFCC'])
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['dataset']):
+            raise CommandError(f"No such directory: {options['dataset']}")
+
+        def progress(done, total):
+            if not options['json'] and (done == total or done % 100 == 0):
+                self.stderr.write(f"  featurized {done}/{total} files")
+
+        try:
+            summary = build_dataset(
+                options['dataset'],
+                options['cache_dir'],
+                options['output'],
+                params={
+                    'SAMPLE_RATE': options['sample_rate'],
+                    'DURATION': options['duration'],
+                    'N_MFCC': options['n_mfcc'],
+                },
+                workers=options['workers'],
+                augment=not options['no_augment'],
+                progress=progress
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary))
+            return
+        self.stdout.write(
+            f"{summary['rows']} rows ({summary['panic_rows']} panic) from {summary['files']} files in "
+            f"{summary['seconds']} s: {summary['files_computed']} featurized, {summary['files_cached']} cached, "
+            f"{summary['files_failed']} failed -> {options['output']} (feature spec {summary['feature_spec']})"
+        )
@@ -0,0 +1,91 @@
+import os
+import glob
+import json
+import time
+import numpy as np
+import soundfile as sf
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from detection.utils.features import shared_frontend
+from detection.utils.panic_detection import PanicDetector, BACKENDS, panic_model_path
+
+DEFAULT_AUDIO_GLOB = os.path.join(settings.BASE_DIR.parent.parent, 'custom_audio', '*.wav')
+
+
+def load_windows(path, window):
+    """Non-overlapping int16 windows of a WAV file at 16 kHz; short files become one padded window."""
+    audio, sample_rate = sf.read(path, dtype='int16', always_2d=True)
+    audio = audio.mean(axis=1).astype(np.int16)
+    if sample_rate != 16000:
+        from scipy.signal import resample_poly
+        audio = resample_poly(audio.astype(np.float32), 16000, sample_rate).astype(np.int16)
+    if len(audio) < window:
+        audio = np.pad(audio, (0, window - len(audio)))
+    return [audio[i:i + window] for i in range(0, len(audio) - window + 1, window)]
+
+
+class Command(BaseCommand):
+    help = "Compares panic detection accuracy and latency across torch / onnx / onnx-int8 backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help=f'WAV files (default: {DEFAULT_AUDIO_GLOB})')
+        parser.add_argument('--backends', nargs='*', default=list(BACKENDS))
+        parser.add_argument('--repeat', type=int, default=20, help='Timed passes over all windows')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable output')
+
+    def handle(self, *args, **options):
+        config = settings.MODEL_CONFIG['PANIC']
+        files = options['files'] or sorted(glob.glob(DEFAULT_AUDIO_GLOB))
+        window = settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']
+        frontend = shared_frontend()
+
+        # Files named panic_* are positives, everything else negatives
+        samples = []
+        for path in files:
+            label = os.path.basename(path).startswith('panic')
+            samples.extend((path, label, frontend.compute(w)) for w in load_windows(path, window))
+        features = [f for _, _, f in samples]
+
+        report = {'windows': len(samples), 'backends': {}}
+        reference = None
+        for backend in options['backends']:
+            path = panic_model_path(config, backend)
+            if not os.path.exists(path):
+                report['backends'][backend] = {'error': f'missing artifact {path}'}
+                continue
+            detector = PanicDetector(path, backend=backend)
+            detector.warmup()
+
+            results = detector.detect_batch(features)
+            confidences = np.array([r.get('confidence', np.nan) for r in results])
+            predictions = np.array([r['panic'] for r in results])
+            labels = np.array([label for _, label, _ in samples])
+
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                for f in features:
+                    detector.detect_batch([f])
+                timings.append((time.perf_counter() - start) / len(features))
+            start = time.perf_counter()
+            detector.detect_batch(features)
+            batched = (time.perf_counter() - start) / len(features)
+
+            entry = {
+                'accuracy': round(float((predictions == labels).mean()), 4),
+                'ms_per_window': round(float(np.median(timings)) * 1000, 3),
+                'ms_per_window_batched': round(batched * 1000, 3),
+            }
+            if reference is None:
+                reference = (backend, confidences, predictions)
+            else:
+                entry[f'max_confidence_diff_vs_{reference[0]}'] = float(np.nanmax(np.abs(confidences - reference[1])))
+                entry[f'decision_agreement_vs_{reference[0]}'] = round(float((predictions == reference[2]).mean()), 4)
+            report['backends'][backend] = entry
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(f"{report['windows']} windows from {len(files)} files")
+        for backend, entry in report['backends'].items():
+            self.stdout.write(f"{backend:>10}: " + ', '.join(f"{k}={v}" for k, v in entry.items()))
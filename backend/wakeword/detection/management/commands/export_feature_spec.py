@@ -0,0 +1,53 @@
+import os
+import json
+import pickle
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from detection.training.features import DEFAULT_PARAMS
+from detection.training.spec import spec_from_scaler, clip_stats_spec, fit_scaler
+
+DEFAULT_SCALER = os.path.join(settings.BASE_DIR.parent.parent, 'scaler.pkl')
+DEFAULT_OUTPUT = os.path.join(settings.BASE_DIR, 'detection/models/calmalert_model.clip_stats.spec.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the panic model's feature spec from the notebook's pickled StandardScaler, "
+        "or from a feature set built by build_panic_features."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scaler', default=DEFAULT_SCALER, help='Pickled StandardScaler fitted in training')
+        parser.add_argument('--features', help='build_panic_features output directory to fit the scaler on instead')
+        parser.add_argument('--output', default=settings.MODEL_CONFIG['PANIC']['SPEC_PATH'] or DEFAULT_OUTPUT)
+        parser.add_argument('--sample-rate', type=int, default=DEFAULT_PARAMS['SAMPLE_RATE'])
+        parser.add_argument('--duration', type=float, default=DEFAULT_PARAMS['DURATION'])
+        parser.add_argument('--n-mfcc', type=int, default=DEFAULT_PARAMS['N_MFCC'])
+
+    def handle(self, *args, **options):
+        params = {
+            **DEFAULT_PARAMS,
+            'SAMPLE_RATE': options['sample_rate'],
+            'DURATION': options['duration'],
+            'N_MFCC': options['n_mfcc'],
+        }
+        if options['features']:
+            path = os.path.join(options['features'], 'features.npy')
+            if not os.path.exists(path):
+                raise CommandError(f"No features.npy in {options['features']}")
+            spec = clip_stats_spec(params, *fit_scaler(np.load(path, mmap_mode='r')), metadata={'source': path})
+        else:
+            try:
+                # sklearn is only needed here, to unpickle; the spec itself is plain JSON
+                with open(options['scaler'], 'rb') as f:
+                    scaler = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, ImportError) as e:
+                raise CommandError(f"Could not load {options['scaler']}: {str(e)}")
+            try:
+                spec = spec_from_scaler(scaler, params, metadata={'source': os.path.basename(options['scaler'])})
+            except ValueError as e:
+                raise CommandError(f"{options['scaler']} does not fit {params}: {str(e)}")
+
+        spec.save(options['output'])
+        self.stdout.write(json.dumps({'output': options['output'], **spec.summary()}))
@@ -0,0 +1,76 @@
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from detection.utils.features import shared_frontend
+from detection.utils.feature_spec import FeatureSpecError
+from detection.utils.panic_detection import load_panic_spec
+from detection.utils.panic_model import ARCHITECTURES
+
+
+def stamp_onnx(path, digest):
+    """Records the feature spec digest in an ONNX file's metadata, where PanicDetector checks it."""
+    import onnx
+    model = onnx.load(path)
+    del model.metadata_props[:]
+    entry = model.metadata_props.add()
+    entry.key, entry.value = 'feature_spec_digest', digest
+    onnx.save(model, path)
+
+
+class Command(BaseCommand):
+    help = "Exports the panic model to ONNX, optionally with dynamic INT8 quantization and a TorchScript copy."
+
+    def add_arguments(self, parser):
+        config = settings.MODEL_CONFIG['PANIC']
+        parser.add_argument('--checkpoint', default=config['PATH'], help='PyTorch state dict to export')
+        parser.add_argument('--output', default=config['ONNX_PATH'], help='Float32 ONNX output path')
+        parser.add_argument('--quantize', action='store_true', help='Also write a dynamically quantized INT8 model')
+        parser.add_argument('--int8-output', default=config['ONNX_INT8_PATH'], help='INT8 ONNX output path')
+        parser.add_argument('--torchscript', action='store_true', help='Also write a frozen TorchScript model')
+        parser.add_argument('--torchscript-output', default=config['TORCHSCRIPT_PATH'], help='TorchScript output path')
+        parser.add_argument('--opset', type=int, default=17)
+
+    def handle(self, *args, **options):
+        # The architecture and input shape come from the feature spec, whose digest every artifact records
+        try:
+            spec = load_panic_spec(settings.MODEL_CONFIG['PANIC'], shared_frontend())
+        except FeatureSpecError as e:
+            raise CommandError(str(e))
+        if spec.model not in ARCHITECTURES:
+            raise CommandError(f"Unknown panic architecture '{spec.model}' in the feature spec")
+        digest = spec.digest()
+
+        model = ARCHITECTURES[spec.model]()
+        try:
+            model.load_state_dict(torch.load(options['checkpoint'], map_location='cpu'))
+        except Exception as e:
+            raise CommandError(f"Could not load {options['checkpoint']} as a {spec.model}: {str(e)}")
+        model.eval()
+
+        # Batch (and frame count, for MFCC frames) stay dynamic so the micro-batcher can send any shape
+        dummy = torch.zeros(spec.input_shape())
+        input_axes = {0: 'batch'} if spec.kind == 'clip_stats' else {0: 'batch', 1: 'frames'}
+        torch.onnx.export(
+            model,
+            dummy,
+            options['output'],
+            input_names=['features'],
+            output_names=['logits'],
+            dynamic_axes={'features': input_axes, 'logits': {0: 'batch'}},
+            opset_version=options['opset'],
+            dynamo=False
+        )
+        stamp_onnx(options['output'], digest)
+        self.stdout.write(f"Wrote {options['output']} (feature spec {digest})")
+
+        if options['quantize']:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(options['output'], options['int8_output'], weight_type=QuantType.QInt8)
+            stamp_onnx(options['int8_output'], digest)
+            self.stdout.write(f"Wrote {options['int8_output']}")
+
+        if options['torchscript']:
+            # Scripted rather than traced so the frame count stays dynamic; freezing inlines the weights
+            scripted = torch.jit.freeze(torch.jit.script(model))
+            torch.jit.save(scripted, options['torchscript_output'], _extra_files={'feature_spec_digest': digest})
+            self.stdout.write(f"Wrote {options['torchscript_output']}")
@@ -0,0 +1,23 @@
+from django.conf import settings
+from channels.management.commands.runworker import Command as RunWorkerCommand
+from detection.utils.model_registry import registry
+
+
+class Command(RunWorkerCommand):
+    help = (
+        "Loads and warms up the detection models, then runs a channel worker for the inference channel "
+        "(INFERENCE_CONFIG['WORKER']['CHANNEL'] unless other channels are given)."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        # Same as runworker, except the channel list defaults to the inference channel
+        for action in parser._actions:
+            if action.dest == 'channels':
+                action.nargs = '*'
+
+    def handle(self, *args, **options):
+        options['channels'] = options['channels'] or [settings.INFERENCE_CONFIG['WORKER']['CHANNEL']]
+        # Before the worker's event loop starts, so no job waits on a model load
+        registry.warmup()
+        super().handle(*args, **options)
@@ -0,0 +1,59 @@
+import os
+import sys
+import glob
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from detection.utils.offline_scoring import score_recordings
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg')
+
+
+def expand(paths):
+    """Files as given, plus every audio file under any directory, recursively."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                if f.lower().endswith(AUDIO_EXTENSIONS)
+            ))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            raise CommandError(f"No such file or directory: {path}")
+    return files
+
+
+class Command(BaseCommand):
+    help = "Scores long recordings or whole directories offline and writes an NDJSON timeline per window."
+
+    def add_arguments(self, parser):
+        config = settings.BATCH_SCORING_CONFIG
+        parser.add_argument('paths', nargs='+', help='Recordings and/or directories to score')
+        parser.add_argument('--workers', type=int, default=config['WORKERS'], help='Scoring processes (0 = in-process)')
+        parser.add_argument('--hop-ms', type=int, default=config['HOP_SIZE'] * 1000 // 16000, help='Window start spacing')
+        parser.add_argument('--windows-per-task', type=int, default=config['WINDOWS_PER_TASK'])
+        parser.add_argument('--summary-only', action='store_true', help='Only write the per-file summary lines')
+        parser.add_argument('--output', help='NDJSON output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        files = expand(options['paths'])
+        if not files:
+            raise CommandError("No recordings found")
+
+        out = open(options['output'], 'w') if options['output'] else sys.stdout
+        try:
+            for record in score_recordings(
+                files,
+                hop=options['hop_ms'] * 16,
+                windows_per_task=options['windows_per_task'],
+                workers=options['workers']
+            ):
+                if options['summary_only'] and 'summary' not in record and 'error' not in record:
+                    continue
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
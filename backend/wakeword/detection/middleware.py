@@ -1,27 +1,249 @@
 # detection/middleware.py
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from urllib.parse import parse_qs
 from channels.auth import AuthMiddlewareStack
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from rest_framework.authtoken.models import Token
+from .utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters: hit, miss, negative_hit, evicted, invalidated, query
+cache_totals = defaultdict(int)
+_totals_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _totals_lock:
+        cache_totals[key] += n
+
+
+class TokenUserCache:
+    """
+    Token key to user cache with a TTL and LRU eviction.
+
+    Unknown keys are cached too, for `negative_ttl` seconds, so a client
+    retrying with a revoked token cannot keep the database busy. Misses
+    arriving within `batch_wait_ms` of each other are resolved with one
+    `key IN (...)` query, so a reconnect storm of thousands of devices costs
+    a handful of queries instead of one serialized query each.
+
+    Deleting a token invalidates it in this process straight away
+    (`token_deleted`, connected in apps.py); other worker processes drop it
+    once its TTL runs out, which bounds how long a revoked token keeps working.
+    """
+
+    def __init__(self, ttl=60.0, negative_ttl=5.0, max_entries=10000, batch_wait_ms=5.0, max_batch_size=500,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max(1, int(max_entries))
+        self.batch_wait = max(0.0, float(batch_wait_ms)) / 1000
+        # SQLite allows 999 bound parameters per query
+        self.max_batch_size = max(1, min(int(max_batch_size), 900))
+        self.clock = clock
+        # key -> (user or None, expires_at); signal handlers run on other threads
+        self._entries = OrderedDict()
+        # user id -> keys cached for that user, so a User save drops them without scanning the cache
+        self._keys_by_user = defaultdict(set)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flush_handle = None
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(
+            ttl=config['TTL'],
+            negative_ttl=config['NEGATIVE_TTL'],
+            max_entries=config['MAX_ENTRIES'],
+            batch_wait_ms=config['BATCH_WAIT_MS'],
+            max_batch_size=config['MAX_BATCH_SIZE']
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        """Drops `key` from the cache and the user index; call with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] is not None:
+            keys = self._keys_by_user.get(entry[0].pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry[0].pk]
+        return entry
+
+    def _lookup(self, key):
+        """(found, user) from the cache alone."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            user, expires_at = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+        _count('hit' if user is not None else 'negative_hit')
+        return True, user
+
+    def store(self, key, user):
+        ttl = self.ttl if user is not None else self.negative_ttl
+        evicted = 0
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user, self.clock() + ttl)
+            if user is not None:
+                self._keys_by_user[user.pk].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            _count('evicted', evicted)
+
+    def invalidate(self, key):
+        with self._lock:
+            removed = self._remove(key) is not None
+        if removed:
+            _count('invalidated')
+
+    def invalidate_user(self, user_id):
+        """Drops every token cached for a user, e.g. after it was deactivated."""
+        with self._lock:
+            keys = self._keys_by_user.pop(user_id, ())
+            for key in keys:
+                del self._entries[key]
+        if keys:
+            _count('invalidated', len(keys))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    async def get_user(self, key):
+        """The active user owning `key`, or None for unknown keys and inactive users."""
+        found, user = self._lookup(key)
+        if found:
+            return user
+        _count('miss')
+
+        # Join a lookup already waiting for this key rather than queueing another
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush_now(loop)
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_wait, self._flush_now, loop)
+        return await asyncio.shield(future)
+
+    def _flush_now(self, loop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            loop.create_task(self._resolve(pending))
+
+    async def _resolve(self, pending):
+        try:
+            users = await database_sync_to_async(self._query)(list(pending))
+        except Exception as e:
+            logger.error(f"Token lookup failed: {str(e)}")
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            user = users.get(key)
+            # Failed lookups are not cached, only definite answers
+            self.store(key, user)
+            if not future.done():
+                future.set_result(user)
+
+    @staticmethod
+    def _query(keys):
+        _count('query')
+        tokens = Token.objects.select_related('user').filter(key__in=keys)
+        return {token.key: token.user for token in tokens if token.user.is_active}
+
+
+_token_cache = None
+
+
+def token_cache():
+    """Process-wide TokenUserCache shared by every WebSocket connection."""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenUserCache.from_settings(settings.AUTH_CACHE_CONFIG)
+    return _token_cache
+
+
+def stats():
+    with _totals_lock:
+        totals = dict(cache_totals)
+    return {'entries': len(_token_cache) if _token_cache is not None else 0, **totals}
+
+
+def _token_from_scope(scope):
+    values = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    return values[0] if values else None
+
 
 class TokenAuthMiddleware:
+    """
+    Authenticates WebSocket connections from a `?token=` query parameter
+    through the shared TokenUserCache. Connections without a token keep the
+    session user set by AuthMiddlewareStack around it.
+    """
+
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        query_string = scope.get('query_string', b'').decode()
-        token_param = [param.split('=')[1] for param in query_string.split('&') if param.startswith('token=')]
-        
-        if token_param:
+        key = _token_from_scope(scope)
+        if key:
             try:
-                token = await database_sync_to_async(Token.objects.get)(key=token_param[0])
-                scope['user'] = token.user
-            except Token.DoesNotExist:
-                scope['user'] = AnonymousUser()
-        else:
-            scope['user'] = AnonymousUser()
-            
+                user = await token_cache().get_user(key)
+            except Exception:
+                user = None
+            scope = dict(scope, user=user or AnonymousUser())
+
         return await self.inner(scope, receive, send)
 
 def TokenAuthMiddlewareStack(inner):
-    return TokenAuthMiddleware(AuthMiddlewareStack(inner))
\ No newline at end of file
+    # Inside the session stack: AuthMiddleware resolves scope['user'] in place and would clobber a token user
+    return AuthMiddlewareStack(TokenAuthMiddleware(inner))
+
+
+# Invalidation: connected when the app registry is ready (see apps.py)
+
+def token_deleted(sender, instance, **kwargs):
+    if _token_cache is not None:
+        _token_cache.invalidate(instance.key)
+
+
+def user_saved(sender, instance, **kwargs):
+    # A deactivated or edited user must not stay cached under their tokens
+    if _token_cache is not None:
+        _token_cache.invalidate_user(instance.pk)
+
+
+metrics.Counter(
+    'calmalert_auth_cache_total', 'WebSocket token lookups by outcome, and database queries made.', ('outcome',),
+    function=lambda: [({'outcome': key}, value) for key, value in dict(cache_totals).items()]
+)
+metrics.Gauge(
+    'calmalert_auth_cache_entries', 'Tokens held in the authentication cache.',
+    function=lambda: len(_token_cache) if _token_cache is not None else 0
+)
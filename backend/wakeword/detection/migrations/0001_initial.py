@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stream',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('channel_name', models.CharField(blank=True, max_length=255)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='streams', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScoreTimeline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('offsets', models.BinaryField()),
+                ('wakeword', models.BinaryField()),
+                ('panic', models.BinaryField()),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timelines', to='detection.stream')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Incident',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('opened_at', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('max_confidence', models.FloatField()),
+                ('escalated', models.BooleanField(default=False)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incidents', to='detection.stream')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DetectionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('detector', models.CharField(choices=[('wakeword', 'Wakeword'), ('panic', 'Panic')], max_length=16)),
+                ('state', models.CharField(choices=[('on', 'On'), ('off', 'Off')], max_length=3)),
+                ('score', models.FloatField(null=True)),
+                ('smoothed', models.FloatField()),
+                ('occurred_at', models.DateTimeField()),
+                ('sequence', models.BigIntegerField(blank=True, null=True)),
+                ('client_timestamp', models.BigIntegerField(blank=True, null=True)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='detection.stream')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stream',
+            index=models.Index(fields=['started_at'], name='detection_s_started_f3aeba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scoretimeline',
+            index=models.Index(fields=['stream', 'started_at'], name='detection_s_stream__5373ab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['stream', 'opened_at'], name='detection_i_stream__104e19_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['opened_at'], name='detection_i_opened__eb6729_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionevent',
+            index=models.Index(fields=['stream', 'occurred_at'], name='detection_d_stream__71a3ea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionevent',
+            index=models.Index(fields=['detector', 'occurred_at'], name='detection_d_detecto_ce34ff_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stream',
+            name='region',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='stream',
+            name='site',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='stream',
+            index=models.Index(fields=['site'], name='detection_s_site_348c3d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stream',
+            index=models.Index(fields=['region'], name='detection_s_region_e14bd0_idx'),
+        ),
+    ]
@@ -1,3 +1,139 @@
+import numpy as np
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 
-# Create your models here.
+# Score timelines are stored as little-endian packed arrays, one value per scored window
+OFFSET_DTYPE = '<u4'  # Milliseconds since the timeline's started_at
+SCORE_DTYPE = '<f2'  # Scores in [0, 1]; NaN where a model did not run on the window
+
+
+class Stream(models.Model):
+    """One monitored audio stream, i.e. one MonitoringConsumer connection."""
+
+    id = models.CharField(primary_key=True, max_length=32)
+    channel_name = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='streams'
+    )
+    # Routing labels from the client's connection (see detection.alerts.routing_key)
+    site = models.CharField(max_length=64, blank=True)
+    region = models.CharField(max_length=64, blank=True)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at']),
+            models.Index(fields=['site']),
+            models.Index(fields=['region']),
+        ]
+
+    def __str__(self):
+        return self.id
+
+
+class DetectionEvent(models.Model):
+    """A detector on a stream turning on or off (see detection/utils/decisions.py)."""
+
+    DETECTORS = [('wakeword', 'Wakeword'), ('panic', 'Panic')]
+    STATES = [('on', 'On'), ('off', 'Off')]
+
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE, related_name='events')
+    detector = models.CharField(max_length=16, choices=DETECTORS)
+    state = models.CharField(max_length=3, choices=STATES)
+    score = models.FloatField(null=True)
+    smoothed = models.FloatField()
+    occurred_at = models.DateTimeField()
+    # Echoed from the client's frame, when it sent them
+    sequence = models.BigIntegerField(null=True, blank=True)
+    client_timestamp = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stream', 'occurred_at']),
+            models.Index(fields=['detector', 'occurred_at']),
+        ]
+
+
+class IncidentQuerySet(models.QuerySet):
+    def for_stream(self, stream, start, end):
+        """Incidents on `stream` overlapping [start, end): opened before `end` and not closed before `start`."""
+        return self.filter(stream=stream, opened_at__lt=end).filter(
+            Q(closed_at__isnull=True) | Q(closed_at__gte=start)
+        ).order_by('opened_at')
+
+    def open_for(self, sites=(), regions=(), streams=(), everything=False):
+        """
+        Incidents not yet closed, on streams that are still connected, in any
+        of the given sites, regions or streams (or anywhere, with everything).
+        """
+        incidents = self.filter(closed_at__isnull=True, stream__ended_at__isnull=True)
+        if not everything:
+            incidents = incidents.filter(
+                Q(stream__site__in=sites) | Q(stream__region__in=regions) | Q(stream_id__in=streams)
+            )
+        return incidents.select_related('stream').order_by('opened_at')
+
+
+class Incident(models.Model):
+    """An incident raised by a stream's AlertGate; the row is updated as the incident escalates and closes."""
+
+    id = models.CharField(primary_key=True, max_length=32)  # detection.alerts.Incident.id
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE, related_name='incidents')
+    opened_at = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    max_confidence = models.FloatField()
+    escalated = models.BooleanField(default=False)
+
+    objects = IncidentQuerySet.as_manager()
+
+    def to_dict(self):
+        """Same shape as detection.alerts.Incident.to_dict, for dispatcher snapshots."""
+        return {
+            'incident_id': self.id,
+            'stream': self.stream_id,
+            'site': self.stream.site or None,
+            'region': self.stream.region or None,
+            'opened_at': self.opened_at.timestamp(),
+            'last_seen': self.last_seen.timestamp(),
+            'closed_at': self.closed_at.timestamp() if self.closed_at is not None else None,
+            'hits': self.hits,
+            'max_confidence': round(self.max_confidence, 4),
+        }
+
+    class Meta:
+        indexes = [
+            # Incidents per stream in a time range (IncidentQuerySet.for_stream)
+            models.Index(fields=['stream', 'opened_at']),
+            models.Index(fields=['opened_at']),
+        ]
+
+
+class ScoreTimeline(models.Model):
+    """
+    Raw per-window scores for a stretch of one stream, packed into arrays:
+    one row per PERSISTENCE_CONFIG['TIMELINE_WINDOWS'] windows instead of
+    one row per window. Eight bytes per window.
+    """
+
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE, related_name='timelines')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    offsets = models.BinaryField()
+    wakeword = models.BinaryField()
+    panic = models.BinaryField()
+
+    class Meta:
+        indexes = [models.Index(fields=['stream', 'started_at'])]
+
+    def arrays(self):
+        """(offsets_ms, wakeword, panic) as NumPy arrays."""
+        return (
+            np.frombuffer(bytes(self.offsets), dtype=OFFSET_DTYPE),
+            np.frombuffer(bytes(self.wakeword), dtype=SCORE_DTYPE).astype(np.float32),
+            np.frombuffer(bytes(self.panic), dtype=SCORE_DTYPE).astype(np.float32),
+        )
@@ -0,0 +1,341 @@
+# detection/persistence.py
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from .models import Stream, DetectionEvent, Incident, ScoreTimeline, OFFSET_DTYPE, SCORE_DTYPE
+from .utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters, keyed (model, outcome): written, retried, failed, dropped, orphaned
+write_totals = defaultdict(int)
+_totals_lock = threading.Lock()
+
+# Flushed in this order so foreign keys always point at rows already written
+FLUSH_ORDER = (Stream, Incident, DetectionEvent, ScoreTimeline)
+# Rows of these models are snapshots of a changing object and are upserted by primary key
+UPSERT_FIELDS = {
+    Stream: ['channel_name', 'user', 'site', 'region', 'started_at', 'ended_at'],
+    Incident: ['stream', 'opened_at', 'last_seen', 'closed_at', 'hits', 'max_confidence', 'escalated'],
+}
+
+
+def _count(model, outcome, amount=1):
+    with _totals_lock:
+        write_totals[(model.__name__, outcome)] += amount
+
+
+def as_datetime(timestamp):
+    """Unix time (as time.time() returns it) to an aware UTC datetime."""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def _client_int(value):
+    """Client-supplied sequence numbers and timestamps are stored only if they are numbers."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value):
+        return int(value)
+    return None
+
+
+class WriteBehindBuffer:
+    """
+    In-process write-behind buffer for ORM rows.
+
+    `add` only appends field values to a list under a lock, so it is safe
+    and cheap to call from the event loop. A background thread writes them
+    once `max_batch` rows are waiting or `flush_interval` seconds have
+    passed, with one bulk_create per model, each in its own transaction. A
+    database that is slow, locked (SQLite) or down only delays history:
+    failed writes are retried `retries` times and then dropped, and rows
+    past `max_pending` are dropped rather than growing memory, both counted.
+    Rows of a stream whose own row was never written are dropped as
+    orphaned, so they cannot fail the foreign key check for everyone else.
+    """
+
+    def __init__(self, max_batch=500, flush_interval=1.0, max_pending=50000, retries=3, backoff=0.2):
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.max_batch, int(max_pending))
+        self.retries = retries
+        self.backoff = backoff
+        self._rows = []  # (model, fields) in arrival order
+        self._cond = threading.Condition()
+        # Held while a batch is taken and written, so batches reach the database in order
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closing = False
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(
+            max_batch=config['MAX_BATCH'],
+            flush_interval=config['FLUSH_INTERVAL'],
+            max_pending=config['MAX_PENDING'],
+            retries=config['RETRIES']
+        )
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, model, **fields):
+        """Queues one row; returns False if it was dropped because the buffer is full."""
+        with self._cond:
+            if self._closing or len(self._rows) >= self.max_pending:
+                _count(model, 'dropped')
+                return False
+            self._rows.append((model, fields))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.max_batch:
+                self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._rows) < self.max_batch and not self._closing:
+                    self._cond.wait(self.flush_interval)
+                closing = self._closing
+            self.flush()
+            if closing:
+                return
+
+    def flush(self):
+        """Writes everything queued so far; blocks, so never call it on the event loop."""
+        with self._write_lock:
+            with self._cond:
+                rows, self._rows = self._rows, []
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        batches = defaultdict(dict)
+        for index, (model, fields) in enumerate(rows):
+            # A newer snapshot of the same object replaces the older one in this batch
+            key = fields['id'] if model in UPSERT_FIELDS else index
+            batches[model][key] = fields
+        written_streams = set()
+        try:
+            for model in FLUSH_ORDER:
+                if model in batches and self._write_model(model, list(batches[model].values()), written_streams):
+                    if model is Stream:
+                        written_streams.update(batches[model])
+        finally:
+            # This thread lives as long as the process, so it must honour CONN_MAX_AGE like a request would
+            close_old_connections()
+
+    def _write_model(self, model, rows, written_streams):
+        """Writes one model's rows in a transaction, with retries; returns whether they were written."""
+        for attempt in range(self.retries + 1):
+            try:
+                with transaction.atomic():
+                    kept = rows if model is Stream else self._drop_orphans(rows, written_streams)
+                    self._bulk_create(model, kept)
+                break
+            except Exception as e:
+                # Drop a broken connection so the next attempt reconnects
+                close_old_connections()
+                if attempt == self.retries:
+                    _count(model, 'failed', len(rows))
+                    logger.error(f"Dropped {len(rows)} {model.__name__} rows after {attempt + 1} failed writes: {str(e)}")
+                    return False
+                _count(model, 'retried', len(rows))
+                logger.warning(f"Writing {len(rows)} {model.__name__} rows failed ({str(e)}), retrying")
+                time.sleep(self.backoff * (2 ** attempt))
+        if len(kept) < len(rows):
+            _count(model, 'orphaned', len(rows) - len(kept))
+            logger.warning(f"Dropped {len(rows) - len(kept)} {model.__name__} rows of streams that were never written")
+        _count(model, 'written', len(kept))
+        return True
+
+    @staticmethod
+    def _drop_orphans(rows, written_streams):
+        """Rows whose stream is neither in this flush nor in the database, e.g. because its row was dropped."""
+        stream_ids = {fields['stream_id'] for fields in rows} - written_streams
+        known = set(written_streams)
+        if stream_ids:
+            known.update(Stream.objects.filter(id__in=stream_ids).values_list('id', flat=True))
+        return [fields for fields in rows if fields['stream_id'] in known]
+
+    def _bulk_create(self, model, rows):
+        objs = [model(**fields) for fields in rows]
+        if model not in UPSERT_FIELDS:
+            model.objects.bulk_create(objs, batch_size=self.max_batch)
+            return
+        # MySQL upserts on any unique key and rejects an explicit conflict target
+        unique_fields = ['id'] if connection.features.supports_update_conflicts_with_target else None
+        model.objects.bulk_create(
+            objs, batch_size=self.max_batch, update_conflicts=True,
+            unique_fields=unique_fields, update_fields=UPSERT_FIELDS[model]
+        )
+
+    def close(self, timeout=10.0):
+        """Stops the writer thread after a final flush."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        else:
+            self.flush()
+
+
+class TimelineBuilder:
+    """Accumulates one stream's per-window scores until they are packed into a ScoreTimeline row."""
+
+    def __init__(self, stream_id, started_at):
+        self.stream_id = stream_id
+        self.started_at = started_at
+        self.offsets = []
+        self.wakeword = []
+        self.panic = []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, now, wakeword, panic):
+        self.offsets.append(int(round((now - self.started_at) * 1000)))
+        self.wakeword.append(np.nan if wakeword is None else wakeword)
+        self.panic.append(np.nan if panic is None else panic)
+
+    def row(self):
+        return {
+            'stream_id': self.stream_id,
+            'started_at': as_datetime(self.started_at),
+            'ended_at': as_datetime(self.started_at + self.offsets[-1] / 1000),
+            'count': len(self.offsets),
+            'offsets': np.asarray(self.offsets, dtype=OFFSET_DTYPE).tobytes(),
+            'wakeword': np.asarray(self.wakeword, dtype=SCORE_DTYPE).tobytes(),
+            'panic': np.asarray(self.panic, dtype=SCORE_DTYPE).tobytes(),
+        }
+
+
+class Recorder:
+    """
+    What the consumers record about a stream: the stream itself, detector
+    transitions, incident snapshots and every window's raw scores, packed
+    `timeline_windows` at a time. Every call only queues rows on the
+    write-behind buffer. Streams are recorded by the consumer that owns
+    them, on the event loop, so per-stream state needs no lock.
+    """
+
+    def __init__(self, buffer, timeline_windows=120, clock=time.time):
+        self.buffer = buffer
+        self.timeline_windows = max(1, int(timeline_windows))
+        self.clock = clock
+        self._streams = {}
+        self._timelines = {}
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(WriteBehindBuffer.from_settings(config), timeline_windows=config['TIMELINE_WINDOWS'])
+
+    def stream_opened(self, stream_id, channel_name='', user=None, site=None, region=None):
+        self._streams[stream_id] = {
+            'id': stream_id,
+            'channel_name': channel_name,
+            'user_id': user.pk if getattr(user, 'is_authenticated', False) else None,
+            'site': site or '',
+            'region': region or '',
+            'started_at': as_datetime(self.clock()),
+            'ended_at': None,
+        }
+        self.buffer.add(Stream, **self._streams[stream_id])
+
+    def stream_closed(self, stream_id):
+        self._flush_timeline(stream_id)
+        fields = self._streams.pop(stream_id, None)
+        if fields is not None:
+            self.buffer.add(Stream, **dict(fields, ended_at=as_datetime(self.clock())))
+
+    def decision(self, stream_id, transition, meta=None):
+        """A DecisionEngine transition, with the client's sequence number and timestamp when it sent them."""
+        meta = meta or {}
+        self.buffer.add(
+            DetectionEvent,
+            stream_id=stream_id,
+            detector=transition['detector'],
+            state=transition['state'],
+            score=transition['score'],
+            smoothed=transition['smoothed'],
+            occurred_at=as_datetime(self.clock()),
+            sequence=_client_int(meta.get('sequence')),
+            client_timestamp=_client_int(meta.get('timestamp'))
+        )
+
+    def incident(self, incident):
+        """Snapshot of an alerts.Incident; later snapshots overwrite the row."""
+        self.buffer.add(
+            Incident,
+            id=incident.id,
+            stream_id=incident.stream,
+            opened_at=as_datetime(incident.opened_at),
+            last_seen=as_datetime(incident.last_seen),
+            closed_at=as_datetime(incident.closed_at) if incident.closed_at is not None else None,
+            hits=incident.hits,
+            max_confidence=float(incident.max_confidence),
+            escalated=incident.escalated
+        )
+
+    def scores(self, stream_id, wakeword, panic):
+        """Raw scores of one window; None where a model did not run."""
+        now = self.clock()
+        timeline = self._timelines.get(stream_id)
+        if timeline is None:
+            timeline = self._timelines[stream_id] = TimelineBuilder(stream_id, now)
+        timeline.add(now, wakeword, panic)
+        if len(timeline) >= self.timeline_windows:
+            self._flush_timeline(stream_id)
+
+    def _flush_timeline(self, stream_id):
+        timeline = self._timelines.pop(stream_id, None)
+        if timeline is not None and len(timeline):
+            self.buffer.add(ScoreTimeline, **timeline.row())
+
+    def close(self):
+        for stream_id in list(self._timelines):
+            self._flush_timeline(stream_id)
+        self.buffer.close()
+
+
+_recorder = None
+
+
+def recorder():
+    """Process-wide Recorder shared by all consumers; its buffer is flushed at exit."""
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder.from_settings(settings.PERSISTENCE_CONFIG)
+        atexit.register(_recorder.close)
+    return _recorder
+
+
+def stats():
+    with _totals_lock:
+        totals = dict(write_totals)
+    return {
+        'enabled': settings.PERSISTENCE_CONFIG['ENABLED'],
+        'rows': {f"{model}:{outcome}": count for (model, outcome), count in totals.items()},
+        'pending': len(_recorder.buffer) if _recorder is not None else 0,
+    }
+
+
+metrics.Counter(
+    'calmalert_persistence_rows_total', 'Rows handed to the write-behind buffer, by model and outcome.',
+    ('model', 'outcome'),
+    function=lambda: [
+        ({'model': model, 'outcome': outcome}, count) for (model, outcome), count in dict(write_totals).items()
+    ]
+)
+metrics.Gauge(
+    'calmalert_persistence_pending_rows', 'Rows waiting in the write-behind buffer.',
+    function=lambda: len(_recorder.buffer) if _recorder is not None else 0
+)
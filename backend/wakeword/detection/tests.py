@@ -1,3 +1,840 @@
-from django.test import TestCase
+import io
+import asyncio
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from .alerts import AlertGate
+from .consumers import MonitoringConsumer
+from .middleware import TokenUserCache
+from .models import DetectionEvent, Stream
+from .persistence import WriteBehindBuffer, write_totals, as_datetime
+from .utils.audio_protocol import (
+    AudioFrame, AudioProtocolError, decode_binary, encode_frame, HEADER, MAGIC, VERSION,
+    FORMAT_PCM_S16LE, FORMAT_PCM_F32LE, FORMAT_FLAC
+)
+from .utils import backpressure
+from .utils.backpressure import ChunkQueue
+from .utils.batching import MicroBatcher
+from .utils.capture import AudioRing, PanicCapture
+from .utils.decisions import ScoreTrack
+from .utils.feature_spec import FeatureSpec, FeatureSpecError, mfcc_frames_spec
+from .utils.features import ChunkFeatures, FeatureFrontend
+from .utils.pipeline import DetectionPipeline
+from .utils.streaming import StreamingState
+from .utils.vad import VoiceActivityGate
+from .utils.model_registry import ModelRegistry, registry
+from .utils.stub_models import StubPanicDetector
+from .utils import metrics
 
-# Create your tests here.
+
+class FakeClock:
+    """Stands in for time.time / time.monotonic; tests move it forward by hand."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+        self.calls = []
+
+    def batcher(self, **kwargs):
+        def batch_fn(items):
+            self.calls.append(list(items))
+            return [item * 10 for item in items]
+        return MicroBatcher('test', batch_fn, self.executor, **kwargs)
+
+    async def test_concurrent_submits_share_one_call(self):
+        batcher = self.batcher(max_batch_size=16, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        self.assertEqual(results, [0, 10, 20, 30, 40])
+        self.assertEqual(self.calls, [[0, 1, 2, 3, 4]])
+        self.assertEqual(batcher.stats()['requests'], 5)
+
+    async def test_batches_are_capped_at_max_batch_size(self):
+        batcher = self.batcher(max_batch_size=2, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        self.assertEqual(results, [0, 10, 20, 30, 40])
+        self.assertEqual(sorted(len(call) for call in self.calls), [1, 2, 2])
+
+    async def test_submit_many_is_one_call(self):
+        batcher = self.batcher(max_batch_size=2)
+        self.assertEqual(await batcher.submit_many([1, 2, 3]), [10, 20, 30])
+        self.assertEqual(self.calls, [[1, 2, 3]])
+        self.assertEqual(await batcher.submit_many([]), [])
+
+    async def test_failure_reaches_every_waiting_request(self):
+        def failing(items):
+            raise RuntimeError('model failed')
+        batcher = MicroBatcher('test', failing, self.executor, max_wait_ms=50)
+        with self.assertLogs('detection.utils.batching', 'ERROR'):
+            results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+
+
+def frame(values, sequence=None):
+    return AudioFrame(np.asarray(values, dtype=np.int16), timestamp=sequence, sequence=sequence)
+
+
+class ChunkQueueTests(SimpleTestCase):
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            ChunkQueue(2, policy='newest')
+
+    async def test_chunks_come_out_in_order(self):
+        queue = ChunkQueue(3)
+        for sequence in range(3):
+            queue.put(frame([sequence], sequence))
+        self.assertEqual([(await queue.get()).frame.sequence for _ in range(3)], [0, 1, 2])
+        self.assertEqual(len(queue), 0)
+
+    async def test_drop_oldest_silence_prefers_silent_chunks(self):
+        queue = ChunkQueue(2, is_speech=lambda samples: bool(np.abs(samples).max() > 100))
+        queue.put(frame([1000], 0))
+        queue.put(frame([0], 1))
+        queue.put(frame([1000], 2))
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual([(await queue.get()).frame.sequence for _ in range(2)], [0, 2])
+
+    async def test_drop_oldest_silence_drops_oldest_when_all_speech(self):
+        queue = ChunkQueue(2, is_speech=lambda samples: True)
+        for sequence in range(3):
+            queue.put(frame([1000], sequence))
+        self.assertEqual([(await queue.get()).frame.sequence for _ in range(2)], [1, 2])
+
+    async def test_latest_keeps_only_the_new_chunk(self):
+        queue = ChunkQueue(2, policy='latest')
+        for sequence in range(3):
+            queue.put(frame([sequence], sequence))
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual((await queue.get()).frame.sequence, 2)
+
+    async def test_coalesce_merges_into_the_newest_chunk(self):
+        queue = ChunkQueue(1, policy='coalesce')
+        queue.put(frame([1, 2], 0))
+        queue.put(frame([3, 4], 1))
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.coalesced, 1)
+        item = await queue.get()
+        self.assertTrue(item.coalesced)
+        self.assertEqual(item.frame.samples.tolist(), [1, 2, 3, 4])
+        # The merged chunk answers as the newest one
+        self.assertEqual((item.frame.sequence, item.frame.timestamp), (1, 1))
+
+    async def test_coalesce_keeps_the_newest_samples_under_the_cap(self):
+        queue = ChunkQueue(1, policy='coalesce', max_coalesced_samples=3)
+        for sequence, values in enumerate(([1, 2], [3, 4], [5, 6])):
+            queue.put(frame(values, sequence))
+        self.assertEqual((await queue.get()).frame.samples.tolist(), [4, 5, 6])
+
+
+class ScoreTrackTests(SimpleTestCase):
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            ScoreTrack('panic', 0.6, method='median')
+
+    def test_hysteresis_without_smoothing(self):
+        track = ScoreTrack('panic', 0.6, 0.4, method='none')
+        self.assertIsNone(track.update(0.5))
+        self.assertEqual(track.update(0.7), 'on')
+        # Between the thresholds: stays on
+        self.assertIsNone(track.update(0.5))
+        self.assertTrue(track.active)
+        self.assertEqual(track.update(0.3), 'off')
+        self.assertIsNone(track.update(0.5))
+
+    def test_ema_smooths_a_single_spike(self):
+        track = ScoreTrack('panic', 0.6, method='ema', alpha=0.5)
+        self.assertIsNone(track.update(0.0))
+        self.assertIsNone(track.update(1.0))  # EMA 0.5
+        self.assertAlmostEqual(track.smoothed(), 0.5)
+        self.assertEqual(track.update(1.0), 'on')  # EMA 0.75
+
+    def test_vote_needs_k_of_n(self):
+        track = ScoreTrack('panic', 0.6, 0.4, method='vote', k=2, n=3)
+        self.assertIsNone(track.update(0.9))
+        self.assertIsNone(track.update(0.1))
+        self.assertEqual(track.update(0.9), 'on')
+        # Two of the last three still reach the release threshold
+        self.assertIsNone(track.update(0.5))
+        self.assertIsNone(track.update(0.1))
+        self.assertEqual(track.update(0.1), 'off')
+
+    def test_ring_only_holds_the_last_n_scores(self):
+        track = ScoreTrack('panic', 0.6, method='vote', k=1, n=2)
+        track.update(0.9)
+        track.update(0.1)
+        track.update(0.1)
+        self.assertEqual(track.smoothed(), 0.0)
+        self.assertFalse(track.active)
+
+
+class AlertGateTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.gate = AlertGate(
+            'stream-1', min_hits=2, release_threshold=0.5, quiet_seconds=10.0, notify_confidence=0.8, clock=self.clock
+        )
+
+    def events(self, panic, confidence):
+        return [event for event, _ in self.gate.update(panic, confidence)]
+
+    def test_opens_after_consecutive_hits(self):
+        self.assertEqual(self.events(True, 0.7), [])
+        self.assertIsNone(self.gate.seconds_until_expiry())
+        self.clock.advance(0.5)
+        self.assertEqual(self.events(True, 0.7), ['opened'])
+        self.assertEqual(self.gate.incident.hits, 2)
+
+    def test_a_miss_resets_the_streak(self):
+        self.events(True, 0.7)
+        self.events(False, 0.1)
+        self.assertEqual(self.events(True, 0.7), [])
+        self.assertIsNone(self.gate.incident)
+
+    def test_escalates_once(self):
+        self.events(True, 0.7)
+        self.assertEqual(self.events(True, 0.9), ['opened', 'escalated'])
+        self.assertEqual(self.events(True, 0.95), [])
+        self.assertEqual(self.gate.incident.max_confidence, 0.95)
+
+    def test_closes_after_quiet_seconds(self):
+        self.events(True, 0.7)
+        self.events(True, 0.7)
+        incident = self.gate.incident
+        self.clock.advance(4.0)
+        self.assertEqual(self.gate.seconds_until_expiry(), 6.0)
+        self.assertEqual(self.gate.expire(), [])
+        self.clock.advance(6.0)
+        self.assertEqual(self.gate.seconds_until_expiry(), 0.0)
+        self.assertEqual([event for event, _ in self.gate.expire()], ['closed'])
+        self.assertEqual(incident.closed_at, self.clock.now)
+        self.assertIsNone(self.gate.incident)
+
+    def test_windows_above_release_threshold_keep_it_open(self):
+        self.events(True, 0.7)
+        self.events(True, 0.7)
+        for _ in range(3):
+            self.clock.advance(8.0)
+            self.assertEqual(self.events(False, 0.55), [])
+        self.assertIsNotNone(self.gate.incident)
+        # Below the release threshold the quiet period runs from the last qualifying window
+        self.clock.advance(8.0)
+        self.assertEqual(self.events(False, 0.2), [])
+        self.assertEqual(self.gate.seconds_until_expiry(), 2.0)
+        self.clock.advance(2.0)
+        self.assertEqual(self.events(False, 0.2), ['closed'])
+
+    def test_close_ends_an_open_incident(self):
+        self.assertEqual(self.gate.close(), [])
+        self.events(True, 0.7)
+        self.events(True, 0.7)
+        self.assertEqual([event for event, _ in self.gate.close()], ['closed'])
+
+
+def user(pk):
+    return SimpleNamespace(pk=pk)
+
+
+class TokenUserCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenUserCache(ttl=60.0, negative_ttl=5.0, max_entries=3, clock=self.clock)
+
+    def cached(self, key):
+        return self.cache._lookup(key)
+
+    def test_entries_expire(self):
+        self.cache.store('a', user(1))
+        self.cache.store('unknown', None)
+        self.assertEqual(self.cached('a')[1].pk, 1)
+        self.assertEqual(self.cached('unknown'), (True, None))
+        self.clock.advance(5.0)
+        self.assertEqual(self.cached('unknown'), (False, None))
+        self.assertTrue(self.cached('a')[0])
+        self.clock.advance(55.0)
+        self.assertEqual(self.cached('a'), (False, None))
+        self.assertNotIn(1, self.cache._keys_by_user)
+
+    def test_invalidate_user_drops_only_their_tokens(self):
+        self.cache.store('a', user(1))
+        self.cache.store('b', user(1))
+        self.cache.store('c', user(2))
+        self.cache.invalidate_user(1)
+        self.assertFalse(self.cached('a')[0])
+        self.assertFalse(self.cached('b')[0])
+        self.assertTrue(self.cached('c')[0])
+        self.assertEqual(len(self.cache), 1)
+        self.cache.invalidate_user(1)  # Nothing left to drop
+
+    def test_index_follows_a_key_moved_to_another_user(self):
+        self.cache.store('a', user(1))
+        self.cache.store('a', user(2))
+        self.cache.invalidate_user(1)
+        self.assertEqual(self.cached('a')[1].pk, 2)
+        self.cache.invalidate('a')
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(dict(self.cache._keys_by_user), {})
+
+    def test_eviction_keeps_the_index_in_step(self):
+        for key, pk in (('a', 1), ('b', 2), ('c', 3)):
+            self.cache.store(key, user(pk))
+        self.cached('a')  # Most recently used now
+        self.cache.store('d', user(4))
+        self.assertFalse(self.cached('b')[0])
+        self.assertTrue(self.cached('a')[0])
+        self.assertEqual(set(self.cache._keys_by_user), {1, 3, 4})
+
+    async def test_get_user_answers_hits_from_the_cache(self):
+        self.cache.store('a', user(1))
+        self.assertEqual((await self.cache.get_user('a')).pk, 1)
+
+
+class FlakyBuffer(WriteBehindBuffer):
+    """Fails the first `failures` bulk writes, as a locked or unreachable database would."""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def _bulk_create(self, model, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        super()._bulk_create(model, rows)
+
+
+class WriteBehindBufferTests(TransactionTestCase):
+    def buffer(self, failures=0, **kwargs):
+        # The writer thread only wakes for a full batch or after a minute, so flush() below does the writing
+        options = dict(max_batch=100, flush_interval=60.0, retries=2, backoff=0.0)
+        options.update(kwargs)
+        buffer = FlakyBuffer(failures, **options)
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def stream(self, stream_id, **fields):
+        return dict(id=stream_id, channel_name='', user=None, site='', region='',
+                    started_at=as_datetime(1000.0), ended_at=None, **fields)
+
+    def event(self, stream_id):
+        return dict(stream_id=stream_id, detector='panic', state='on', score=0.9, smoothed=0.8,
+                    occurred_at=as_datetime(1000.0), sequence=None, client_timestamp=None)
+
+    def totals(self, outcome, model='Stream'):
+        return write_totals[(model, outcome)]
+
+    def test_flush_writes_queued_rows(self):
+        buffer = self.buffer()
+        written = self.totals('written')
+        self.assertTrue(buffer.add(Stream, **self.stream('s1')))
+        self.assertTrue(buffer.add(Stream, **self.stream('s2')))
+        self.assertEqual(len(buffer), 2)
+        buffer.flush()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Stream.objects.count(), 2)
+        self.assertEqual(self.totals('written') - written, 2)
+
+    def test_later_snapshot_of_a_row_wins(self):
+        buffer = self.buffer()
+        buffer.add(Stream, **self.stream('s1'))
+        buffer.add(Stream, **dict(self.stream('s1'), site='lobby'))
+        buffer.flush()
+        buffer.add(Stream, **dict(self.stream('s1'), site='lobby', ended_at=as_datetime(1060.0)))
+        buffer.flush()
+        row = Stream.objects.get()
+        self.assertEqual(row.site, 'lobby')
+        self.assertEqual(row.ended_at, as_datetime(1060.0))
+
+    def test_failed_writes_are_retried(self):
+        buffer = self.buffer(failures=2)
+        retried, written = self.totals('retried'), self.totals('written')
+        buffer.add(Stream, **self.stream('s1'))
+        with self.assertLogs('detection.persistence', 'WARNING'):
+            buffer.flush()
+        self.assertEqual(Stream.objects.count(), 1)
+        self.assertEqual(self.totals('retried') - retried, 2)
+        self.assertEqual(self.totals('written') - written, 1)
+
+    def test_rows_are_dropped_after_the_last_retry(self):
+        buffer = self.buffer(failures=3)
+        failed = self.totals('failed')
+        buffer.add(Stream, **self.stream('s1'))
+        with self.assertLogs('detection.persistence', 'ERROR'):
+            buffer.flush()
+        self.assertEqual(Stream.objects.count(), 0)
+        self.assertEqual(self.totals('failed') - failed, 1)
+        self.assertEqual(len(buffer), 0)
+
+    def test_a_dropped_stream_only_costs_its_own_rows(self):
+        buffer = self.buffer()
+        buffer.add(Stream, **self.stream('s1'))
+        buffer.flush()
+        # Every attempt at the Stream rows fails; s1's event still has its stream from the earlier flush
+        buffer.failures = 3
+        orphaned = self.totals('orphaned', 'DetectionEvent')
+        buffer.add(Stream, **self.stream('s2'))
+        buffer.add(DetectionEvent, **self.event('s1'))
+        buffer.add(DetectionEvent, **self.event('s2'))
+        with self.assertLogs('detection.persistence', 'WARNING'):
+            buffer.flush()
+        self.assertEqual(list(Stream.objects.values_list('id', flat=True)), ['s1'])
+        self.assertEqual(list(DetectionEvent.objects.values_list('stream_id', flat=True)), ['s1'])
+        self.assertEqual(self.totals('orphaned', 'DetectionEvent') - orphaned, 1)
+
+    def test_full_buffer_drops_new_rows(self):
+        buffer = self.buffer(max_batch=2, max_pending=2)
+        dropped = self.totals('dropped')
+        # Holding the write lock keeps the writer thread, woken by the full batch, from emptying the buffer
+        with buffer._write_lock:
+            buffer.add(Stream, **self.stream('s1'))
+            buffer.add(Stream, **self.stream('s2'))
+            self.assertFalse(buffer.add(Stream, **self.stream('s3')))
+        self.assertEqual(self.totals('dropped') - dropped, 1)
+
+    def test_close_flushes_and_refuses_new_rows(self):
+        buffer = self.buffer()
+        buffer.add(Stream, **self.stream('s1'))
+        buffer.close()
+        self.assertEqual(Stream.objects.count(), 1)
+        self.assertFalse(buffer.add(Stream, **self.stream('s2')))
+
+
+class AudioRingTests(SimpleTestCase):
+    def test_snapshot_before_wraparound(self):
+        ring = AudioRing(8)
+        ring.write([1, 2, 3])
+        self.assertEqual(ring.snapshot(0, 3).tolist(), [1, 2, 3])
+        self.assertEqual(ring.snapshot(1, 10).tolist(), [2, 3])
+
+    def test_wraparound_keeps_the_newest_samples(self):
+        ring = AudioRing(5)
+        ring.write([0, 1, 2, 3])
+        ring.write([4, 5, 6, 7])
+        self.assertEqual(ring.total, 8)
+        self.assertEqual(ring.snapshot(0, 8).tolist(), [3, 4, 5, 6, 7])
+        self.assertEqual(ring.snapshot(4, 7).tolist(), [4, 5, 6])
+
+    def test_write_longer_than_capacity(self):
+        ring = AudioRing(4)
+        ring.write([9])
+        ring.write(np.arange(10))
+        self.assertEqual(ring.total, 11)
+        self.assertEqual(ring.snapshot(0, 11).tolist(), [6, 7, 8, 9])
+
+    def test_spans_no_longer_held_are_empty(self):
+        ring = AudioRing(4)
+        ring.write(np.arange(10))
+        self.assertEqual(len(ring.snapshot(0, 5)), 0)
+        self.assertEqual(len(ring.snapshot(10, 12)), 0)
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.clips = []
+
+    def submit(self, name, samples, sample_rate):
+        self.clips.append((name, samples.tolist()))
+
+
+class PanicCaptureTests(SimpleTestCase):
+    def setUp(self):
+        self.writer = RecordingWriter()
+        # 10 samples before the trigger and 5 after, in a ring of 15
+        self.capture = PanicCapture(self.writer, sample_rate=10, pre_seconds=1.0, post_seconds=0.5)
+        self.capture.push(np.arange(20))
+        self.capture.trigger('incident')
+
+    def test_waits_for_the_post_roll(self):
+        self.capture.push(np.arange(20, 24))
+        self.assertEqual(self.writer.clips, [])
+        self.capture.push(np.arange(24, 30))
+        self.assertEqual(self.writer.clips, [('incident', list(range(10, 25)))])
+
+    def test_a_chunk_past_the_post_roll_keeps_the_pre_roll(self):
+        self.capture.push(np.arange(20, 28))
+        self.assertEqual(self.writer.clips, [('incident', list(range(10, 25)))])
+        self.assertEqual(self.capture.ring.total, 28)
+
+    def test_close_writes_what_arrived(self):
+        self.capture.push(np.arange(20, 22))
+        self.capture.close()
+        self.assertEqual(self.writer.clips, [('incident', list(range(10, 22)))])
+
+
+class DecodeBinaryTests(SimpleTestCase):
+    def test_pcm_is_a_view_over_the_frame(self):
+        samples = np.array([0, 1, -1, 32767, -32768], dtype=np.int16)
+        data = encode_frame(samples, sequence=7, timestamp_ms=1234)
+        decoded = decode_binary(data)
+        self.assertEqual(decoded.samples.tolist(), samples.tolist())
+        self.assertEqual((decoded.sequence, decoded.timestamp), (7, 1234))
+        self.assertFalse(decoded.samples.flags.owndata)
+
+    def test_float_pcm_is_converted(self):
+        decoded = decode_binary(encode_frame([0.0, 0.5, -1.0, 2.0], sample_format=FORMAT_PCM_F32LE))
+        self.assertEqual(decoded.samples.dtype, np.int16)
+        self.assertEqual(decoded.samples.tolist(), [0, 16383, -32767, 32767])
+
+    def test_other_rates_are_resampled(self):
+        decoded = decode_binary(encode_frame(np.zeros(800, dtype=np.int16), sample_rate=8000))
+        self.assertEqual(len(decoded.samples), 1600)
+
+    def test_flac(self):
+        import soundfile as sf
+        samples = (np.sin(np.arange(1600) / 10) * 10000).astype(np.int16)
+        encoded = io.BytesIO()
+        sf.write(encoded, samples, 16000, format='FLAC')
+        decoded = decode_binary(encode_frame(encoded.getvalue(), sample_format=FORMAT_FLAC))
+        self.assertEqual(decoded.samples.tolist(), samples.tolist())
+
+    def test_malformed_frames(self):
+        header = HEADER.pack(MAGIC, VERSION, FORMAT_PCM_S16LE, 16000, 0, 0)
+        for data in (
+            header[:10],
+            HEADER.pack(b'XX', VERSION, FORMAT_PCM_S16LE, 16000, 0, 0),
+            HEADER.pack(MAGIC, VERSION + 1, FORMAT_PCM_S16LE, 16000, 0, 0),
+            header + b'\x00',
+            HEADER.pack(MAGIC, VERSION, FORMAT_PCM_F32LE, 16000, 0, 0) + b'\x00' * 6,
+            HEADER.pack(MAGIC, VERSION, 9, 16000, 0, 0),
+            HEADER.pack(MAGIC, VERSION, FORMAT_FLAC, 16000, 0, 0) + b'not flac',
+        ):
+            with self.subTest(data=data[:24]):
+                with self.assertRaises(AudioProtocolError):
+                    decode_binary(data)
+
+
+def noise(samples, amplitude=3000.0, seed=0):
+    return (np.random.default_rng(seed).standard_normal(samples) * amplitude).astype(np.int16)
+
+
+class FeatureFrontendTests(SimpleTestCase):
+    def test_matches_librosa(self):
+        import librosa
+        frontend = FeatureFrontend()
+        for seed in range(3):
+            samples = noise(24000, seed=seed)
+            expected = librosa.feature.mfcc(
+                y=samples.astype(np.float32), sr=16000, n_mfcc=40, n_fft=512, hop_length=160
+            )
+            mfcc = frontend.compute(samples).mfcc
+            self.assertEqual(mfcc.shape, expected.shape)
+            # The tolerance bench_features enforces by default
+            self.assertLess(np.abs(mfcc - expected).max(), 1e-2)
+
+    def test_batch_rows_match_single_chunks(self):
+        frontend = FeatureFrontend()
+        chunks = [noise(8000, seed=seed) for seed in range(3)]
+        for features, chunk in zip(frontend.compute_many(chunks), chunks):
+            np.testing.assert_allclose(features.mfcc, frontend.compute(chunk).mfcc, atol=1e-3)
+
+
+class StreamingStateTests(SimpleTestCase):
+    def setUp(self):
+        self.frontend = FeatureFrontend()
+
+    def stream(self):
+        return StreamingState(self.frontend, window_samples=24000, hop_samples=8000)
+
+    def test_windows_start_once_a_full_window_arrived(self):
+        stream = self.stream()
+        self.assertEqual(stream.push(noise(16000)), [])
+        windows = stream.push(noise(8000, seed=1))
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows[0].frames, self.frontend.frames_for(24000))
+        self.assertEqual(len(stream.push(noise(16000, seed=2))), 2)
+
+    def test_window_audio_is_the_newest_samples(self):
+        stream = self.stream()
+        samples = noise(40000)
+        windows = stream.push(samples)
+        self.assertEqual(windows[-1].audio.tolist(), samples[-24000:].tolist())
+
+    def test_windows_lag_compute_by_the_frames_still_waiting_for_audio(self):
+        stream = self.stream()
+        self.assertEqual(stream.lag_samples, 320)
+        samples = noise(40000)
+        window = stream.push(samples)[-1]
+        end = len(samples) - stream.lag_samples
+        expected = self.frontend.compute(samples[end - 24000:end])
+        # Edge frames differ: compute() pads the clip with zeros where the stream has real audio
+        np.testing.assert_allclose(window.mfcc[:, 2:-2], expected.mfcc[:, 2:-2], atol=3e-4)
+
+    def test_chunk_boundaries_do_not_change_the_windows(self):
+        samples = noise(48000)
+        whole = self.stream().push(samples)
+        stream = self.stream()
+        pieces = [w for start in range(0, len(samples), 1100) for w in stream.push(samples[start:start + 1100])]
+        self.assertEqual(len(pieces), len(whole))
+        for a, b in zip(pieces, whole):
+            np.testing.assert_allclose(a.mfcc, b.mfcc, atol=1e-3)
+
+
+class VoiceActivityGateTests(SimpleTestCase):
+    def gate(self, **kwargs):
+        gate = VoiceActivityGate(**kwargs)
+        # Only the energy floor and hangover, whether or not webrtcvad is installed
+        gate.vad = None
+        return gate
+
+    def test_energy_floor(self):
+        gate = self.gate(energy_threshold_dbfs=-50.0)
+        self.assertFalse(gate.has_speech(np.zeros(1600, dtype=np.int16)))
+        self.assertFalse(gate.has_speech(noise(1600, amplitude=10.0)))
+        self.assertTrue(gate.has_speech(noise(1600)))
+        self.assertFalse(gate.has_speech(np.zeros(0, dtype=np.int16)))
+
+    def test_hangover_keeps_the_gate_open(self):
+        gate = self.gate(hangover=2)
+        silence = np.zeros(1600, dtype=np.int16)
+        self.assertTrue(gate.check(noise(1600)))
+        self.assertEqual([gate.check(silence) for _ in range(3)], [True, True, False])
+        self.assertEqual(gate.stats(), {'processed': 3, 'skipped': 1})
+
+    def test_counters_count_windows(self):
+        gate = self.gate(hangover=0)
+        self.assertFalse(gate.check(np.zeros(1600, dtype=np.int16), units=3))
+        self.assertTrue(gate.check(noise(1600), units=2))
+        self.assertEqual(gate.stats(), {'processed': 2, 'skipped': 3})
+
+    def test_a_chunk_without_windows_only_arms_the_hangover(self):
+        gate = self.gate(hangover=1)
+        self.assertFalse(gate.check(np.zeros(1600, dtype=np.int16), units=0))
+        self.assertTrue(gate.check(noise(1600), units=0))
+        self.assertTrue(gate.check(np.zeros(1600, dtype=np.int16)))
+        self.assertEqual(gate.stats(), {'processed': 1, 'skipped': 0})
+
+
+class FakeBatcher:
+    """Answers submissions with `score(features)` and records what it was given."""
+
+    def __init__(self, score):
+        self.score = score
+        self.submitted = []
+
+    async def submit(self, features):
+        self.submitted.append(features)
+        return self.score(features)
+
+    async def submit_many(self, windows):
+        self.submitted.extend(windows)
+        return [self.score(features) for features in windows]
+
+
+class DetectionPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.wakeword = FakeBatcher(lambda features: 0.9)
+        self.panic = FakeBatcher(lambda features: {'panic': True, 'confidence': 0.8})
+        frontend = FeatureFrontend()
+        self.loud = frontend.compute(noise(8000, amplitude=8000.0))
+        self.quiet = frontend.compute(noise(8000, amplitude=30.0))
+
+    def pipeline(self, **kwargs):
+        options = dict(cascade=True, cascade_min_level_dbfs=-35.0, wakeword_threshold=0.5)
+        options.update(kwargs)
+        return DetectionPipeline(self.wakeword, self.panic, **options)
+
+    async def test_runs_both_models(self):
+        result = await self.pipeline(cascade=False).run(self.quiet)
+        self.assertTrue(result['wakeword'])
+        self.assertEqual(result['wakeword_score'], 0.9)
+        self.assertEqual(result['panic'], {'panic': True, 'confidence': 0.8})
+        self.assertIn('total', result['timings_ms'])
+
+    async def test_cascade_skips_panic_for_quiet_windows(self):
+        pipeline = self.pipeline()
+        quiet = await pipeline.run(self.quiet)
+        self.assertTrue(quiet['panic']['skipped'])
+        self.assertIn('cascade', quiet['timings_ms'])
+        loud = await pipeline.run(self.loud)
+        self.assertEqual(loud['panic']['confidence'], 0.8)
+        self.assertEqual(self.panic.submitted, [self.loud])
+        self.assertEqual(len(self.wakeword.submitted), 2)
+
+    async def test_without_a_wakeword_model(self):
+        pipeline = self.pipeline(cascade=False)
+        pipeline.wakeword_batcher = None
+        result = await pipeline.run(self.loud)
+        self.assertEqual((result['wakeword'], result['wakeword_score']), (False, None))
+        self.assertEqual(result['panic']['confidence'], 0.8)
+
+    async def test_run_many_only_sends_loud_windows_to_panic(self):
+        results, timings = await self.pipeline().run_many([self.quiet, self.loud, self.quiet])
+        self.assertEqual([r['panic'].get('skipped', False) for r in results], [True, False, True])
+        self.assertEqual(self.panic.submitted, [self.loud])
+        self.assertEqual([r['wakeword_score'] for r in results], [0.9] * 3)
+        self.assertIn('total', timings)
+
+
+class FeatureSpecTests(SimpleTestCase):
+    def spec(self, **overrides):
+        data = mfcc_frames_spec(FeatureFrontend()).to_dict()
+        data.update(overrides)
+        return data
+
+    def test_round_trip(self):
+        spec = FeatureSpec.from_dict(self.spec(scaler={'mean': [0.0] * 40, 'scale': [2.0] * 40}))
+        again = FeatureSpec.from_dict(spec.to_dict())
+        self.assertEqual(again.digest(), spec.digest())
+        self.assertEqual(spec.input_shape(batch=4), (4, 96, 40))
+        np.testing.assert_allclose(spec.apply(np.full((2, 40), 4.0)), 2.0)
+
+    def test_malformed_specs_are_refused(self):
+        for overrides in (
+            {'kind': 'spectrogram'},
+            {'output': 'relu'},
+            {'format_version': 99},
+            {'features': []},
+            {'features': ['mfcc_0']},
+            {'frontend': {'sample_rate': 16000}},
+            {'scaler': {'mean': [0.0] * 40}},
+            {'scaler': {'mean': [0.0] * 39, 'scale': [1.0] * 39}},
+            {'scaler': {'mean': [0.0] * 40, 'scale': [0.0] * 40}},
+        ):
+            with self.subTest(overrides=overrides):
+                with self.assertRaises(FeatureSpecError):
+                    FeatureSpec.from_dict(self.spec(**overrides))
+
+    def test_missing_keys(self):
+        data = self.spec()
+        del data['kind']
+        with self.assertRaisesRegex(FeatureSpecError, 'kind'):
+            FeatureSpec.from_dict(data)
+
+    def test_frontend_must_match(self):
+        spec = FeatureSpec.from_dict(self.spec())
+        spec.check_frontend(FeatureFrontend())
+        with self.assertRaisesRegex(FeatureSpecError, 'n_fft 512 != 1024'):
+            spec.check_frontend(FeatureFrontend(n_fft=1024))
+
+
+class FlakyRegistry(ModelRegistry):
+    """Loads a stub panic model, failing the first `failures` loads as a bad checkpoint would."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.loads = []
+
+    def _factories(self):
+        return {'panic': self._load_panic}
+
+    def _load_panic(self):
+        self.loads.append(threading.current_thread().name)
+        if self.failures:
+            self.failures -= 1
+            raise ValueError('feature spec does not match')
+        return StubPanicDetector(latency_ms=0, per_item_ms=0)
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def test_a_failed_load_is_not_retried(self):
+        models = FlakyRegistry(failures=1)
+        for _ in range(3):
+            with self.assertRaisesRegex(Exception, 'feature spec does not match'):
+                models.get('panic')
+        self.assertEqual(len(models.loads), 1)
+        self.assertEqual(models.status()['panic']['status'], 'error')
+
+    def test_reload_tries_again(self):
+        models = FlakyRegistry(failures=1)
+        with self.assertRaises(ValueError):
+            models.get('panic')
+        self.assertIsInstance(models.reload('panic'), StubPanicDetector)
+        self.assertIs(models.get('panic'), models.get('panic'))
+        self.assertEqual(len(models.loads), 2)
+
+    def test_warmup_retries_a_failed_load(self):
+        models = FlakyRegistry(failures=1)
+        with self.assertRaises(ValueError):
+            models.get('panic')
+        models.warmup()
+        self.assertEqual(models.status()['panic']['status'], 'loaded')
+
+    async def test_load_batcher_loads_on_the_executor(self):
+        models = FlakyRegistry(failures=0)
+        batcher = await models.load_batcher('panic')
+        self.assertIs(await models.load_batcher('panic'), batcher)
+        self.assertEqual(len(models.loads), 1)
+        self.assertTrue(models.loads[0].startswith('inference'))
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PERSISTENCE_CONFIG=dict(settings.PERSISTENCE_CONFIG, ENABLED=False),
+    CAPTURE_CONFIG=dict(settings.CAPTURE_CONFIG, ENABLED=False),
+)
+class MonitoringConsumerTests(SimpleTestCase):
+    def setUp(self):
+        saved = dict(registry._models), dict(registry._stats), dict(registry._batchers)
+
+        def restore():
+            registry._models, registry._stats, registry._batchers = saved
+        self.addCleanup(restore)
+        # The shipped panic checkpoint is not needed to exercise the connection handling
+        registry.install('panic', StubPanicDetector(latency_ms=0, per_item_ms=0))
+
+    def active_connections(self):
+        return metrics.ACTIVE_CONNECTIONS._collect().get(('monitoring',), 0)
+
+    async def test_disconnect_releases_the_connection_gauge(self):
+        before = self.active_connections()
+        communicator = WebsocketCommunicator(MonitoringConsumer.as_asgi(), '/ws/monitoring/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(self.active_connections(), before + 1)
+        await communicator.disconnect()
+        self.assertEqual(self.active_connections(), before)
+
+    async def test_a_chunk_is_scored(self):
+        with self.settings(INFERENCE_CONFIG=dict(settings.INFERENCE_CONFIG, SEND_SCORES=True)):
+            communicator = WebsocketCommunicator(MonitoringConsumer.as_asgi(), '/ws/monitoring/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_to(bytes_data=encode_frame(noise(24000, amplitude=300.0), sequence=3))
+            responses = await communicator.receive_json_from(timeout=5)
+            await communicator.disconnect()
+        self.assertEqual([r['type'] for r in responses], ['scores'])
+        self.assertEqual(responses[0]['sequence'], 3)
+        self.assertIsNone(responses[0]['wakeword_score'])
+        self.assertGreater(responses[0]['panic_confidence'], 0.0)
+
+    async def test_chunks_shed_by_admission_control_are_counted(self):
+        # A process-wide controller with every slot taken, as under load from other connections
+        saved = backpressure._admission
+        self.addCleanup(setattr, backpressure, '_admission', saved)
+        backpressure._admission = backpressure.AdmissionController(1)
+        backpressure._admission.try_acquire()
+
+        communicator = WebsocketCommunicator(MonitoringConsumer.as_asgi(), '/ws/monitoring/')
+        await communicator.connect()
+        await communicator.send_to(bytes_data=encode_frame(noise(8000)))
+        control = (await communicator.receive_json_from())[0]
+        self.assertEqual((control['action'], control['reason']), ('slow_down', 'server_overloaded'))
+        self.assertEqual((control['dropped'], control['rejected']), (0, 1))
+        with self.assertLogs('detection.consumers', 'INFO') as logs:
+            await communicator.disconnect()
+        self.assertIn('rejected 1 chunks', '\n'.join(logs.output))
+
+    async def test_malformed_frames_are_answered_with_an_error(self):
+        communicator = WebsocketCommunicator(MonitoringConsumer.as_asgi(), '/ws/monitoring/')
+        await communicator.connect()
+        await communicator.send_to(bytes_data=b'XX')
+        responses = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(responses[0]['type'], 'error')
@@ -0,0 +1,91 @@
+# detection/training/cache.py
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+
+def params_digest(params):
+    """Stable short hash of a feature parameter dict."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _atomic_write(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class FeatureCache:
+    """
+    Content-addressed store of per-clip feature vectors.
+
+    An entry's key hashes the audio file's contents, the feature parameters
+    and the variant (original or an augmentation), so renaming or moving a
+    file keeps its entries and changing any parameter misses cleanly.
+    Entries are single .npy files written atomically, so an interrupted run
+    leaves nothing half-written. Content hashes are remembered per path with
+    the file's size and mtime, so unchanged files are not re-read.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'hash_index.json')
+        self._index = None
+        self._index_dirty = False
+
+    # File content hashes
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def file_hash(self, path):
+        index = self._load_index()
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        known = index.get(key)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        index[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._index_dirty = True
+        return index[key][2]
+
+    def save_index(self):
+        if self._index_dirty:
+            _atomic_write(self.index_path, lambda f: f.write(json.dumps(self._index).encode()))
+            self._index_dirty = False
+
+    # Feature entries
+
+    @staticmethod
+    def key(content_hash, params, variant):
+        return hashlib.sha256(f"{content_hash}:{params_digest(params)}:{variant}".encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, 'entries', key[:2], f'{key}.npy')
+
+    def has(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        return np.load(self.path(key))
+
+    def save(self, key, vector):
+        _atomic_write(self.path(key), lambda f: np.save(f, np.asarray(vector, dtype=np.float32)))
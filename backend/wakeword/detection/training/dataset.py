@@ -0,0 +1,41 @@
+# detection/training/dataset.py
+import os
+import numpy as np
+
+# TESS file names end in the spoken emotion, e.g. OAF_back_fear.wav
+EMOTION_LABELS = {
+    'fear': 'panic',
+    'angry': 'panic',
+    'happy': 'non_panic',
+    'neutral': 'non_panic',
+    'sad': 'non_panic',
+    'ps': 'non_panic',  # pleasant surprise
+    'disgust': 'non_panic'
+}
+
+
+def label_for(path):
+    """1 for panic, 0 otherwise, from the emotion suffix of a TESS file name."""
+    emotion = os.path.basename(path).split('_')[-1].split('.')[0].lower()
+    return 1 if EMOTION_LABELS.get(emotion, 'non_panic') == 'panic' else 0
+
+
+def find_tess_files(dataset_path):
+    """Every .wav under `dataset_path` with its label, in a stable order."""
+    files = []
+    for root, dirs, names in os.walk(dataset_path):
+        for name in names:
+            if name.endswith('.wav'):
+                path = os.path.join(root, name)
+                files.append((path, label_for(path)))
+    return sorted(files)
+
+
+def load_audio(path, sample_rate=24000, duration=3.0):
+    """Decodes at a fixed sample rate, limited and zero-padded to exactly `duration` seconds."""
+    import librosa
+    audio, _ = librosa.load(path, sr=sample_rate, duration=duration)
+    length = int(sample_rate * duration)
+    if len(audio) < length:
+        audio = np.pad(audio, (0, length - len(audio)), mode='constant')
+    return audio
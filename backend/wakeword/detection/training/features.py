@@ -0,0 +1,79 @@
+# detection/training/features.py
+import numpy as np
+
+# Everything that changes the feature vectors; cache keys are derived from it,
+# so editing a value (or bumping VERSION after changing the code) rebuilds the cache
+DEFAULT_PARAMS = {
+    'VERSION': 1,
+    'SAMPLE_RATE': 24000,
+    'DURATION': 3.0,
+    'N_MFCC': 13,
+    # librosa's defaults, which the notebook relied on
+    'N_FFT': 2048,
+    'HOP_LENGTH': 512,
+    'STRETCH_RANGE': (0.8, 1.2),
+    'PITCH_STEPS': (-3, 3),
+    'NOISE_STD': 0.005,
+}
+
+# Variants computed per file; augmentations only for the panic class, as in the notebook
+ORIGINAL = 'original'
+AUGMENTATIONS = ('stretch', 'pitch', 'noise')
+
+# Rows of the per-frame feature matrix besides the MFCCs
+CONTRAST_BANDS = 7
+CHROMA_BINS = 12
+STATISTICS = ('mean', 'std', 'max')
+
+
+def feature_names(n_mfcc=13):
+    """Column names of extract_features' output, in order, e.g. 'mean_rms' or 'max_mfcc_3'."""
+    rows = ['rms', 'zcr', *(f'mfcc_{i}' for i in range(n_mfcc)),
+            *(f'contrast_{i}' for i in range(CONTRAST_BANDS)), *(f'chroma_{i}' for i in range(CHROMA_BINS))]
+    return [f'{stat}_{row}' for stat in STATISTICS for row in rows]
+
+
+def extract_features(audio, sr=24000, n_mfcc=13, n_fft=2048, hop_length=512):
+    """
+    Per-clip feature vector: mean, std and max over time of RMS, ZCR, MFCCs,
+    spectral contrast and chroma (102 values with the default 13 MFCCs).
+    The server's panic detector computes the same values for a batch at a
+    time with utils.clip_stats.ClipStatsFrontend; `manage.py bench_features
+    --clip-stats` checks the two agree.
+    """
+    import librosa
+    # Time-domain features
+    rms = librosa.feature.rms(y=audio, frame_length=n_fft, hop_length=hop_length)
+    zero_crossing = librosa.feature.zero_crossing_rate(audio, frame_length=n_fft, hop_length=hop_length)
+
+    # Frequency-domain features; the magnitude STFT is shared by contrast and chroma
+    stft = np.abs(librosa.stft(audio, n_fft=n_fft, hop_length=hop_length))
+    mfcc = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length)
+    spectral_contrast = librosa.feature.spectral_contrast(S=stft, sr=sr)
+    chroma = librosa.feature.chroma_stft(S=stft, sr=sr)
+
+    features = np.vstack([rms, zero_crossing, mfcc, spectral_contrast, chroma])
+
+    # Temporal statistics (aggregate across time axis)
+    return np.concatenate([
+        np.mean(features, axis=1),
+        np.std(features, axis=1),
+        np.max(features, axis=1)
+    ]).astype(np.float32)
+
+
+def augment_audio(audio, variant, params, rng):
+    """
+    One augmented copy of `audio`: a random time stretch, pitch shift or
+    added noise. `rng` should be seeded per file and variant so the result,
+    and therefore its cache entry, is reproducible.
+    """
+    import librosa
+    sr = params['SAMPLE_RATE']
+    if variant == 'stretch':
+        return librosa.effects.time_stretch(audio, rate=rng.uniform(*params['STRETCH_RANGE']))
+    if variant == 'pitch':
+        return librosa.effects.pitch_shift(audio, sr=sr, n_steps=int(rng.integers(*params['PITCH_STEPS'])))
+    if variant == 'noise':
+        return audio + rng.normal(0, params['NOISE_STD'], len(audio)).astype(audio.dtype)
+    raise ValueError(f"Unknown augmentation '{variant}', expected one of {AUGMENTATIONS}")
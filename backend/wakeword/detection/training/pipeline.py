@@ -0,0 +1,151 @@
+# detection/training/pipeline.py
+import os
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .cache import FeatureCache, params_digest
+from .dataset import find_tess_files, load_audio
+from .features import DEFAULT_PARAMS, ORIGINAL, AUGMENTATIONS, extract_features, augment_audio
+from .spec import fit_scaler, clip_stats_spec
+
+logger = logging.getLogger(__name__)
+
+
+def variants_for(label, augment=True):
+    """Panic clips are augmented three ways to balance the classes; others are used as-is."""
+    return (ORIGINAL, *AUGMENTATIONS) if augment and label == 1 else (ORIGINAL,)
+
+
+def _variant_seed(content_hash, params, variant):
+    return int(hashlib.sha256(f"{content_hash}:{params_digest(params)}:{variant}".encode()).hexdigest()[:16], 16)
+
+
+def _init_worker():
+    # One clip per process already; nested BLAS/numba threads would only oversubscribe
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+
+def compute_file(path, content_hash, variants, params):
+    """Decodes one file once and returns {variant: feature vector} for the requested variants."""
+    audio = load_audio(path, params['SAMPLE_RATE'], params['DURATION'])
+    vectors = {}
+    for variant in variants:
+        if variant == ORIGINAL:
+            clip = audio
+        else:
+            rng = np.random.default_rng(_variant_seed(content_hash, params, variant))
+            clip = augment_audio(audio, variant, params, rng)
+        vectors[variant] = extract_features(clip, params['SAMPLE_RATE'], params['N_MFCC'], params['N_FFT'], params['HOP_LENGTH'])
+    return vectors
+
+
+def _compute_task(task):
+    path, content_hash, variants, params = task
+    return path, compute_file(path, content_hash, variants, params)
+
+
+def build_dataset(dataset_path, cache_dir, output_dir, params=None, workers=None, augment=True, progress=None):
+    """
+    Builds the panic training set from a TESS-style directory.
+
+    Only (file, variant) pairs missing from the cache are decoded and
+    featurized, across `workers` processes (0 = in this process); adding
+    files to the dataset therefore only costs the new files. The assembled
+    set is written to `output_dir` as features.npy, labels.npy,
+    manifest.json and feature_spec.json, the scaler fitted on these features
+    together with the parameters the server needs to reproduce them. Originals come first and augmentations after, in file
+    order, as the notebook built it. Returns a summary dict.
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    started = time.perf_counter()
+    cache = FeatureCache(cache_dir)
+    files = find_tess_files(dataset_path)
+    if not files:
+        raise ValueError(f"No .wav files found under {dataset_path}")
+
+    rows = []
+    missing = {}
+    for path, label in files:
+        content_hash = cache.file_hash(path)
+        for variant in variants_for(label, augment):
+            key = cache.key(content_hash, params, variant)
+            rows.append((path, label, variant, key))
+            if not cache.has(key):
+                missing.setdefault(path, (content_hash, []))[1].append(variant)
+    cache.save_index()
+    # Same ordering as the notebook: every original, then the augmented copies
+    rows.sort(key=lambda row: row[2] != ORIGINAL)
+
+    tasks = [(path, content_hash, variants, params) for path, (content_hash, variants) in missing.items()]
+    computed = failed = 0
+
+    def store(path, vectors):
+        content_hash = missing[path][0]
+        for variant, vector in vectors.items():
+            cache.save(cache.key(content_hash, params, variant), vector)
+
+    if tasks and workers:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+        ) as pool:
+            futures = {pool.submit(_compute_task, task): task[0] for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    store(*future.result())
+                    computed += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Feature extraction failed for {futures[future]}: {str(e)}")
+                if progress is not None:
+                    progress(computed + failed, len(tasks))
+    else:
+        for task in tasks:
+            try:
+                store(*_compute_task(task))
+                computed += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Feature extraction failed for {task[0]}: {str(e)}")
+            if progress is not None:
+                progress(computed + failed, len(tasks))
+
+    rows = [row for row in rows if cache.has(row[3])]
+    features = np.stack([cache.load(row[3]) for row in rows])
+    labels = np.array([row[1] for row in rows], dtype=np.int64)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'features.npy'), features)
+    np.save(os.path.join(output_dir, 'labels.npy'), labels)
+    spec = clip_stats_spec(params, *fit_scaler(features), metadata={'rows': len(rows)})
+    spec.save(os.path.join(output_dir, 'feature_spec.json'))
+    summary = {
+        'params': params,
+        'files': len(files),
+        'rows': len(rows),
+        'panic_rows': int(labels.sum()),
+        'files_computed': computed,
+        'files_failed': failed,
+        'files_cached': len(files) - len(tasks),
+        'feature_spec': spec.digest(),
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump({**summary, 'entries': [
+            {'path': path, 'label': label, 'variant': variant, 'key': key} for path, label, variant, key in rows
+        ]}, f)
+    return summary
+
+
+def load_dataset(output_dir, mmap=True):
+    """(features, labels) written by build_dataset; features are memory-mapped by default."""
+    features = np.load(os.path.join(output_dir, 'features.npy'), mmap_mode='r' if mmap else None)
+    labels = np.load(os.path.join(output_dir, 'labels.npy'))
+    return features, labels
@@ -0,0 +1,43 @@
+# detection/training/spec.py
+import numpy as np
+from ..utils.feature_spec import FeatureSpec
+from .features import feature_names
+
+# Architecture the notebook trains on these features (detection/utils/panic_model.py)
+MODEL = 'CalmaAlertModel'
+
+
+def fit_scaler(features):
+    """Per-column mean and scale as sklearn's StandardScaler fits them (constant columns get scale 1)."""
+    features = np.asarray(features, dtype=np.float64)
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale < 10 * np.finfo(np.float64).eps] = 1.0
+    return mean, scale
+
+
+def clip_stats_spec(params, mean, scale, model=MODEL, metadata=None):
+    """FeatureSpec for a model trained on extract_features vectors built with `params`."""
+    return FeatureSpec(
+        model=model,
+        kind='clip_stats',
+        output='sigmoid',
+        frontend={
+            'sample_rate': params['SAMPLE_RATE'],
+            'duration': params['DURATION'],
+            'n_fft': params['N_FFT'],
+            'hop_length': params['HOP_LENGTH'],
+            'n_mfcc': params['N_MFCC'],
+            # librosa.load returns samples in [-1, 1]
+            'amplitude': 'unit',
+        },
+        features=feature_names(params['N_MFCC']),
+        mean=mean,
+        scale=scale,
+        metadata={'params_version': params['VERSION'], **(metadata or {})}
+    )
+
+
+def spec_from_scaler(scaler, params, model=MODEL, metadata=None):
+    """Converts a fitted StandardScaler (e.g. the notebook's scaler.pkl) into a FeatureSpec."""
+    return clip_stats_spec(params, scaler.mean_, scaler.scale_, model=model, metadata=metadata)
@@ -2,23 +2,25 @@
 from django.urls import path
 from .views import (
     AudioUploadView,
+    BatchDetectionView,
+    BatchScoringView,
     ModelStatusView,
+    MetricsView,
     EmergencyContactsView,
     StreamingEndpoint
 )
-from .consumers import MonitoringConsumer, EmergencyConsumer
 
 urlpatterns = [
     # Audio Processing
     path('audio/upload/', AudioUploadView.as_view(), name='audio-upload'),
     path('stream/', StreamingEndpoint.as_view(), name='audio-stream'),
+    path('audio/batch/', BatchDetectionView.as_view(), name='audio-batch'),
+    path('audio/score/', BatchScoringView.as_view(), name='audio-score'),
     
     # System Management
     path('status/', ModelStatusView.as_view(), name='model-status'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('emergency-contacts/', EmergencyContactsView, name='emergency-contacts'),
 
-    
-    # WebSocket endpoints
-    path('ws/monitoring/', MonitoringConsumer.as_asgi(), name='monitoring-ws'),
-    path('ws/emergency/', EmergencyConsumer.as_asgi(), name='emergency-ws'),
+    # WebSocket endpoints are routed in detection/routing.py
 ]
\ No newline at end of file
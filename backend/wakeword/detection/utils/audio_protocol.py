@@ -0,0 +1,131 @@
+# detection/utils/audio_protocol.py
+import io
+import json
+import struct
+import base64
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Binary frame header, little-endian, 20 bytes so PCM payloads stay 4-byte aligned:
+#   magic (2s) | version (B) | sample format (B) | sample rate (I) | sequence (I) | timestamp ms (Q)
+HEADER = struct.Struct('<2sBBIIQ')
+MAGIC = b'CA'
+VERSION = 1
+
+FORMAT_PCM_S16LE = 0
+FORMAT_PCM_F32LE = 1
+FORMAT_FLAC = 2
+FORMAT_OGG_OPUS = 3
+
+TARGET_SAMPLE_RATE = 16000
+
+
+class AudioProtocolError(ValueError):
+    """Raised for frames that cannot be decoded into audio."""
+
+
+class AudioFrame:
+    """One decoded client chunk: int16 samples at 16 kHz plus the client's metadata."""
+
+    def __init__(self, samples, timestamp=None, sequence=None):
+        self.samples = samples
+        self.timestamp = timestamp
+        self.sequence = sequence
+
+    def meta(self):
+        """Fields echoed back in every response about this chunk."""
+        meta = {'timestamp': self.timestamp}
+        if self.sequence is not None:
+            meta['sequence'] = self.sequence
+        return meta
+
+
+def encode_frame(samples, sequence=0, timestamp_ms=0, sample_rate=TARGET_SAMPLE_RATE,
+                 sample_format=FORMAT_PCM_S16LE):
+    """Builds a binary frame; the inverse of decode_binary, used by clients and benchmarks."""
+    if sample_format == FORMAT_PCM_S16LE:
+        payload = np.asarray(samples, dtype='<i2').tobytes()
+    elif sample_format == FORMAT_PCM_F32LE:
+        payload = np.asarray(samples, dtype='<f4').tobytes()
+    else:
+        payload = bytes(samples)  # Already encoded FLAC / Ogg Opus
+    return HEADER.pack(MAGIC, VERSION, sample_format, sample_rate, sequence, timestamp_ms) + payload
+
+
+def _to_int16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def _resample(samples, sample_rate):
+    if sample_rate == TARGET_SAMPLE_RATE:
+        return samples
+    from math import gcd
+    from scipy.signal import resample_poly
+    factor = gcd(sample_rate, TARGET_SAMPLE_RATE)
+    resampled = resample_poly(samples.astype(np.float32), TARGET_SAMPLE_RATE // factor, sample_rate // factor)
+    return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+
+def _decode_compressed(payload):
+    try:
+        import soundfile as sf
+    except ImportError:
+        raise AudioProtocolError("Compressed audio requires the soundfile package")
+    try:
+        samples, sample_rate = sf.read(io.BytesIO(payload), dtype='int16')
+    except Exception as e:
+        raise AudioProtocolError(f"Could not decode audio: {str(e)}")
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+def decode_binary(data):
+    """
+    Decodes a binary WebSocket frame. Raw int16 PCM is returned as a view
+    over `data` without copying.
+    """
+    if len(data) < HEADER.size:
+        raise AudioProtocolError("Frame shorter than header")
+    magic, version, sample_format, sample_rate, sequence, timestamp = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise AudioProtocolError("Unknown frame magic or version")
+
+    if sample_format == FORMAT_PCM_S16LE:
+        if (len(data) - HEADER.size) % 2:
+            raise AudioProtocolError("PCM payload is not a whole number of samples")
+        samples = np.frombuffer(data, dtype='<i2', offset=HEADER.size)
+    elif sample_format == FORMAT_PCM_F32LE:
+        if (len(data) - HEADER.size) % 4:
+            raise AudioProtocolError("PCM payload is not a whole number of samples")
+        samples = _to_int16(np.frombuffer(data, dtype='<f4', offset=HEADER.size))
+    elif sample_format in (FORMAT_FLAC, FORMAT_OGG_OPUS):
+        samples, sample_rate = _decode_compressed(memoryview(data)[HEADER.size:])
+    else:
+        raise AudioProtocolError(f"Unsupported sample format {sample_format}")
+
+    return AudioFrame(_resample(samples, sample_rate), timestamp=timestamp, sequence=sequence)
+
+
+def decode_file(data, timestamp=None, sequence=None):
+    """Decodes an uploaded audio file (WAV, FLAC, Ogg) at any sample rate into an AudioFrame."""
+    samples, sample_rate = _decode_compressed(data)
+    return AudioFrame(_resample(samples, sample_rate), timestamp=timestamp, sequence=sequence)
+
+
+def decode_json(text_data):
+    """Decodes the original JSON frame: {"audio": <base64 int16 PCM>, "timestamp": ...}."""
+    try:
+        data = json.loads(text_data)
+        audio_bytes = base64.b64decode(data['audio'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise AudioProtocolError(f"Invalid JSON audio frame: {str(e)}")
+    if len(audio_bytes) % 2:
+        raise AudioProtocolError("PCM payload is not a whole number of samples")
+    return AudioFrame(
+        np.frombuffer(audio_bytes, dtype=np.int16),
+        timestamp=data.get('timestamp'),
+        sequence=data.get('sequence')
+    )
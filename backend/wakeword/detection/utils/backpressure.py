@@ -0,0 +1,154 @@
+# detection/utils/backpressure.py
+import time
+import asyncio
+import threading
+from collections import deque
+import numpy as np
+from . import metrics
+
+POLICIES = ('drop_oldest_silence', 'coalesce', 'latest')
+
+# Process-wide counters across all connections
+totals = {'queued': 0, 'dropped': 0, 'coalesced': 0, 'rejected': 0}
+_totals_lock = threading.Lock()
+# Seconds the most recent chunks spent queued before scoring
+_queue_latencies = deque(maxlen=2000)
+
+
+def _count(key, n=1):
+    with _totals_lock:
+        totals[key] += n
+
+
+class QueuedChunk:
+    def __init__(self, frame):
+        self.frame = frame
+        self.enqueued_at = time.perf_counter()
+        # Set when several chunks were merged; only the newest window is then scored
+        self.coalesced = False
+
+
+class ChunkQueue:
+    """
+    Bounded per-connection queue between receive() and inference.
+
+    When a new chunk arrives at a full queue the policy decides what gives:
+
+    - drop_oldest_silence: drop the oldest chunk judged non-speech by
+      `is_speech`, or the oldest chunk if every queued chunk has speech
+    - coalesce: merge the new chunk into the newest queued one, so a backlog
+      becomes one longer chunk scored once; past `max_coalesced_samples`
+      its oldest samples are dropped, so the merged chunk stays bounded
+    - latest: discard the backlog and keep only the new chunk
+    """
+
+    def __init__(self, max_chunks, policy='drop_oldest_silence', is_speech=None, max_coalesced_samples=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {POLICIES}")
+        self.max_chunks = max(1, int(max_chunks))
+        self.policy = policy
+        self.is_speech = is_speech
+        self.max_coalesced_samples = max_coalesced_samples
+        self._items = deque()
+        self._ready = asyncio.Event()
+
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _drop(self, index):
+        del self._items[index]
+        self.dropped += 1
+        _count('dropped')
+
+    def put(self, frame):
+        """Queues a decoded AudioFrame, applying the drop policy if the queue is full."""
+        _count('queued')
+        if len(self._items) >= self.max_chunks:
+            if self.policy == 'latest':
+                while self._items:
+                    self._drop(0)
+            elif self.policy == 'coalesce':
+                tail = self._items[-1]
+                samples = np.concatenate([tail.frame.samples, frame.samples])
+                if self.max_coalesced_samples is not None:
+                    samples = samples[-self.max_coalesced_samples:]
+                tail.frame.samples = samples
+                tail.frame.timestamp = frame.timestamp
+                tail.frame.sequence = frame.sequence
+                tail.coalesced = True
+                self.coalesced += 1
+                _count('coalesced')
+                return
+            else:
+                silent = None
+                if self.is_speech is not None:
+                    silent = next(
+                        (i for i, item in enumerate(self._items) if not self.is_speech(item.frame.samples)), None
+                    )
+                self._drop(silent if silent is not None else 0)
+
+        self._items.append(QueuedChunk(frame))
+        self._ready.set()
+
+    async def get(self):
+        """Waits for the oldest queued chunk."""
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        item = self._items.popleft()
+        _queue_latencies.append(time.perf_counter() - item.enqueued_at)
+        return item
+
+
+class AdmissionController:
+    """Caps the chunks being scored at once across every connection in the process."""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.in_flight = 0
+
+    def try_acquire(self):
+        if self.in_flight >= self.max_in_flight:
+            _count('rejected')
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+_admission = None
+
+
+def admission_controller(max_in_flight):
+    """Process-wide AdmissionController shared by all MonitoringConsumers."""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController(max_in_flight)
+    return _admission
+
+
+def stats():
+    with _totals_lock:
+        info = dict(totals)
+    info['in_flight'] = _admission.in_flight if _admission is not None else 0
+    latencies = np.array(_queue_latencies, dtype=np.float64) * 1000
+    info['queue_latency_ms'] = {
+        'p50': round(float(np.percentile(latencies, 50)), 3) if latencies.size else 0.0,
+        'p99': round(float(np.percentile(latencies, 99)), 3) if latencies.size else 0.0,
+    }
+    return info
+
+
+metrics.Counter(
+    'calmalert_chunks_total', 'WebSocket chunks by what backpressure did with them.', ('outcome',),
+    function=lambda: [({'outcome': key}, value) for key, value in dict(totals).items()]
+)
+metrics.Gauge(
+    'calmalert_chunks_in_flight', 'Chunks being scored across all connections.',
+    function=lambda: _admission.in_flight if _admission is not None else 0
+)
@@ -0,0 +1,157 @@
+# detection/utils/batching.py
+import time
+import asyncio
+import logging
+from collections import deque
+import numpy as np
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects pending requests from every connection for up to `max_wait_ms`
+    and runs them through `batch_fn` as a single model call.
+
+    `batch_fn` receives a list of inputs and must return a list of results in
+    the same order. It runs in `executor`, so it may block.
+    """
+
+    def __init__(self, name, batch_fn, executor, max_batch_size=16, max_wait_ms=5.0,
+                 max_concurrent_batches=2, stats_window=1000, backend=''):
+        self.name = name
+        self.backend = backend
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._slots = None
+
+        self._batches = 0
+        self._requests = 0
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._queue_waits = deque(maxlen=stats_window)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # Queues are bound to an event loop; rebuild them if the loop changed
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._collect())
+
+    def _owned_elsewhere(self, loop):
+        """
+        True while the queues belong to another event loop that is still
+        running, e.g. a concurrent request served through async_to_sync under
+        WSGI. Rebinding them then would strand that loop's pending futures.
+        """
+        return self._loop is not None and self._loop is not loop and self._loop.is_running()
+
+    async def _run_direct(self, loop, items):
+        return await loop.run_in_executor(self.executor, self._run_batch, items)
+
+    async def submit(self, item):
+        """Queues one input and waits for its result."""
+        loop = asyncio.get_running_loop()
+        if self._owned_elsewhere(loop):
+            # Scored alone on the shared executor rather than batched with the other loop's inputs
+            return (await self._run_direct(loop, [item]))[0]
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def submit_many(self, items):
+        """
+        Runs `items` as one call to `batch_fn`, for requests that arrive
+        already batched. It waits for the same batch slots as submit(), so it
+        shares the concurrency limit, and its wait is counted as queue wait.
+        """
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        if self._owned_elsewhere(loop):
+            return await self._run_direct(loop, items)
+        self._ensure_started()
+        enqueued = time.perf_counter()
+        batch = [(item, self._loop.create_future(), enqueued) for item in items]
+        await self._slots.acquire()
+        # _dispatch releases the slot
+        await self._dispatch(batch)
+        return [future.result() for _, future, _ in batch]
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Limit batches in flight so later arrivals pile up into the next batch
+            await self._slots.acquire()
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            started = time.perf_counter()
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._queue_waits.extend(started - enqueued for _, _, enqueued in batch)
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = await self._loop.run_in_executor(self.executor, self._run_batch, items)
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(batch)} failed: {str(e)}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _run_batch(self, items):
+        # Timed in the executor thread so the histogram excludes time spent waiting for a thread
+        with metrics.INFERENCE_SECONDS.time(model=self.name, backend=self.backend):
+            results = self.batch_fn(items)
+        metrics.INFERENCE_BATCH_SIZE.observe(len(items), model=self.name, backend=self.backend)
+        return results
+
+    def stats(self):
+        """Batch size and queue wait figures over the most recent batches."""
+        sizes = np.array(self._batch_sizes, dtype=np.float64)
+        waits = np.array(self._queue_waits, dtype=np.float64) * 1000
+        return {
+            'batches': self._batches,
+            'requests': self._requests,
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'mean_batch_size': round(float(sizes.mean()), 2) if sizes.size else 0.0,
+            'queue_wait_ms': {
+                'p50': round(float(np.percentile(waits, 50)), 3) if waits.size else 0.0,
+                'p99': round(float(np.percentile(waits, 99)), 3) if waits.size else 0.0,
+            },
+        }
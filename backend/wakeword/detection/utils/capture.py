@@ -0,0 +1,254 @@
+# detection/utils/capture.py
+import os
+import wave
+import queue
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('flac', 'wav')
+
+# Process-wide counters: captured, written, dropped, failed, evicted
+totals = {'captured': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'evicted': 0}
+_totals_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _totals_lock:
+        totals[key] += n
+
+
+class AudioRing:
+    """
+    Fixed-size int16 ring of the most recent `capacity` samples, allocated
+    once. Samples are addressed by their absolute position in the stream,
+    so a capture can name its span before all of it has arrived.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.buffer = np.zeros(self.capacity, dtype=np.int16)
+        self.total = 0  # Samples written since the stream started
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.int16)
+        n = len(samples)
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+        pos = (self.total + n - len(samples)) % self.capacity
+        first = min(len(samples), self.capacity - pos)
+        self.buffer[pos:pos + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.total += n
+
+    def snapshot(self, start, end):
+        """Copy of samples [start, end), clipped to what is still held."""
+        start = max(start, self.total - self.capacity, 0)
+        end = min(end, self.total)
+        if end <= start:
+            return np.zeros(0, dtype=np.int16)
+        pos = start % self.capacity
+        first = min(end - start, self.capacity - pos)
+        return np.concatenate([self.buffer[pos:pos + first], self.buffer[:end - start - first]])
+
+
+class PanicCapture:
+    """
+    Per-stream pre-trigger capture. The ring holds `pre_seconds` +
+    `post_seconds` of audio, so memory stays the same however long the
+    connection lives. `trigger` marks the current position; once
+    `post_seconds` more audio has been pushed, the span from `pre_seconds`
+    before the trigger is copied out and handed to the ClipWriter. A chunk
+    that runs past the end of a capture is written in two parts, so the
+    copy is taken before the rest of the chunk can overwrite its oldest
+    samples. Neither step waits on the disk.
+    """
+
+    def __init__(self, writer, sample_rate=16000, pre_seconds=10.0, post_seconds=5.0):
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.pre_samples = int(pre_seconds * sample_rate)
+        self.post_samples = int(post_seconds * sample_rate)
+        self.ring = AudioRing(self.pre_samples + self.post_samples)
+        # (name, start, due); push runs on an executor thread, trigger on the event loop
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, writer, config, sample_rate):
+        return cls(writer, sample_rate, pre_seconds=config['PRE_SECONDS'], post_seconds=config['POST_SECONDS'])
+
+    def push(self, samples):
+        samples = np.asarray(samples, dtype=np.int16)
+        while True:
+            with self._lock:
+                next_due = min((pending[2] for pending in self._pending), default=None)
+            if next_due is None or next_due - self.ring.total > len(samples):
+                break
+            split = max(next_due - self.ring.total, 0)
+            self.ring.write(samples[:split])
+            samples = samples[split:]
+            self._emit(lambda due: due <= self.ring.total)
+        self.ring.write(samples)
+
+    def trigger(self, name):
+        """Starts a capture named `name` around the current position; a name already pending is ignored."""
+        with self._lock:
+            if any(pending[0] == name for pending in self._pending):
+                return
+            now = self.ring.total
+            self._pending.append((name, now - self.pre_samples, now + self.post_samples))
+        _count('captured')
+
+    def close(self):
+        """Writes pending captures with whatever post-trigger audio arrived, e.g. when the stream ends."""
+        self._emit(lambda due: True)
+
+    def _emit(self, ready):
+        with self._lock:
+            done = [pending for pending in self._pending if ready(pending[2])]
+            self._pending = [pending for pending in self._pending if not ready(pending[2])]
+        for name, start, due in done:
+            self.writer.submit(name, self.ring.snapshot(start, due), self.sample_rate)
+
+
+class ClipWriter:
+    """
+    Background I/O worker writing captured clips to `directory` as FLAC
+    (or WAV) and keeping the directory under `max_bytes` by deleting the
+    oldest clips. `submit` never blocks: clips beyond `queue_size` waiting
+    to be written are dropped and counted.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024, fmt='flac', queue_size=16):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown capture format '{fmt}', expected one of {FORMATS}")
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.format = fmt
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # path -> size, oldest first; rebuilt from the directory when the worker starts
+        self._files = OrderedDict()
+        self._bytes = 0
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(config['DIR'], max_bytes=config['MAX_BYTES'], fmt=config['FORMAT'], queue_size=config['QUEUE_SIZE'])
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='clip-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, name, samples, sample_rate):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((name, samples, sample_rate))
+        except queue.Full:
+            _count('dropped')
+            logger.error(f"Clip writer queue full, dropped capture {name}")
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and os.path.splitext(entry.name)[1][1:] in FORMATS:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._files[path] = size
+            self._bytes += size
+
+    def _run(self):
+        try:
+            self._scan()
+        except OSError as e:
+            logger.error(f"Could not read capture directory {self.directory}: {str(e)}")
+        while True:
+            name, samples, sample_rate = self._queue.get()
+            try:
+                path = self._write(name, samples, sample_rate)
+                _count('written')
+                self._retain(path)
+            except Exception as e:
+                _count('failed')
+                logger.error(f"Could not write capture {name}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, name, samples, sample_rate):
+        path = os.path.join(self.directory, f"{name}.{self.format}")
+        # Written under a temporary name, so a clip is either absent or complete
+        temp = os.path.join(self.directory, f".{name}.{self.format}.part")
+        if self.format == 'flac':
+            import soundfile as sf
+            sf.write(temp, samples, sample_rate, format='FLAC', subtype='PCM_16')
+        else:
+            with wave.open(temp, 'wb') as out:
+                out.setnchannels(1)
+                out.setsampwidth(2)
+                out.setframerate(sample_rate)
+                out.writeframes(samples.astype('<i2').tobytes())
+        os.replace(temp, path)
+        return path
+
+    def _retain(self, path):
+        """Records a new clip and deletes the oldest ones until the directory fits in max_bytes."""
+        size = os.path.getsize(path)
+        self._bytes += size - self._files.pop(path, 0)
+        self._files[path] = size
+        # The newest clip is kept even if it alone exceeds the limit
+        while self._bytes > self.max_bytes and len(self._files) > 1:
+            oldest, oldest_size = self._files.popitem(last=False)
+            self._bytes -= oldest_size
+            try:
+                os.remove(oldest)
+                _count('evicted')
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict capture {oldest}: {str(e)}")
+
+    def join(self):
+        """Waits until every submitted clip has been written or given up on."""
+        self._queue.join()
+
+
+_writer = None
+
+
+def clip_writer():
+    """Process-wide ClipWriter shared by all MonitoringConsumers."""
+    global _writer
+    if _writer is None:
+        _writer = ClipWriter.from_settings(settings.CAPTURE_CONFIG)
+    return _writer
+
+
+def stats():
+    with _totals_lock:
+        info = dict(totals)
+    info['queue_depth'] = _writer.depth() if _writer is not None else 0
+    info['stored_bytes'] = _writer._bytes if _writer is not None else 0
+    return info
+
+
+metrics.Counter(
+    'calmalert_captures_total', 'Pre-trigger panic captures by outcome.', ('outcome',),
+    function=lambda: [({'outcome': key}, value) for key, value in dict(totals).items()]
+)
+metrics.Gauge(
+    'calmalert_capture_stored_bytes', 'Bytes of captured clips kept on disk.',
+    function=lambda: _writer._bytes if _writer is not None else 0
+)
@@ -0,0 +1,186 @@
+# detection/utils/clip_stats.py
+import numpy as np
+from math import gcd
+from .features import hann_window, mel_filterbank, dct_matrix
+from ..training.features import CONTRAST_BANDS, CHROMA_BINS
+
+
+class ClipStatsFrontend:
+    """
+    Batched NumPy version of training.features.extract_features for serving.
+
+    Computes the same per-clip statistics of RMS, ZCR, MFCCs, spectral
+    contrast and chroma as the librosa calls it mirrors (checked by
+    `manage.py bench_features --clip-stats`), but for a whole (batch,
+    samples) array at once: one resample, one STFT shared by every
+    feature, and filterbanks built once. Only the chroma filterbank depends
+    on each clip's estimated tuning, and those are cached per tuning value.
+    """
+
+    def __init__(self, sample_rate=24000, duration=3.0, n_fft=2048, hop_length=512, n_mfcc=13, amplitude='unit',
+                 input_rate=16000, n_mels=128, top_db=80.0, amin=1e-10):
+        self.sample_rate = sample_rate
+        self.samples = int(sample_rate * duration)
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mfcc = n_mfcc
+        self.amplitude = amplitude
+        self.input_rate = input_rate
+        self.top_db = top_db
+        self.amin = amin
+        common = gcd(sample_rate, input_rate)
+        self._up, self._down = sample_rate // common, input_rate // common
+
+        self.window = hann_window(n_fft).astype(np.float32)
+        self.mel_basis = mel_filterbank(sample_rate, n_fft, n_mels).astype(np.float32)
+        self.dct_basis = dct_matrix(n_mfcc, n_mels).astype(np.float32)
+        self.frequencies = np.linspace(0, sample_rate / 2.0, 1 + n_fft // 2)
+        self._contrast_bands = self._band_slices()
+        self._chroma_filters = {}
+
+    @classmethod
+    def from_spec(cls, spec, input_rate):
+        frontend = spec.frontend
+        return cls(
+            sample_rate=frontend['sample_rate'],
+            duration=frontend['duration'],
+            n_fft=frontend['n_fft'],
+            hop_length=frontend['hop_length'],
+            n_mfcc=frontend['n_mfcc'],
+            amplitude=frontend['amplitude'],
+            input_rate=input_rate
+        )
+
+    def clip_audio(self, audio):
+        """(batch, samples) at input_rate, int16 scale -> clips as training read them: rate, amplitude and length."""
+        audio = np.atleast_2d(np.asarray(audio, dtype=np.float32))
+        if self.amplitude == 'unit':
+            audio = audio / 32768.0
+        if self._up != self._down:
+            from scipy.signal import resample_poly
+            audio = resample_poly(audio, self._up, self._down, axis=-1)
+        # Training clips are cut or zero-padded to a fixed duration (training/dataset.py load_audio)
+        if audio.shape[1] < self.samples:
+            audio = np.pad(audio, ((0, 0), (0, self.samples - audio.shape[1])))
+        return np.ascontiguousarray(audio[:, :self.samples], dtype=np.float32)
+
+    def compute_batch(self, audio):
+        """Feature vectors of equal-length windows, (batch, samples) -> (batch, n_features)."""
+        from scipy.fft import rfft
+        clips = self.clip_audio(audio)
+        pad = self.n_fft // 2
+        frames = self._frames(np.pad(clips, ((0, 0), (pad, pad))))
+
+        # (batch, bins, frames) magnitude, as librosa lays it out. scipy's FFT keeps float32 and, a clip
+        # at a time, stays in cache; it is about three times as fast as NumPy's here
+        magnitude = np.empty((len(clips), 1 + self.n_fft // 2, frames.shape[1]), dtype=np.float32)
+        for row in range(len(clips)):
+            magnitude[row] = np.abs(rfft(frames[row] * self.window, axis=-1)).T
+
+        features = np.concatenate([
+            np.sqrt(np.einsum('bfn,bfn->bf', frames, frames) / self.n_fft)[:, np.newaxis],
+            self._zero_crossing_rate(np.pad(clips, ((0, 0), (pad, pad)), mode='edge'))[:, np.newaxis],
+            self._mfcc(magnitude ** 2),
+            self._spectral_contrast(magnitude),
+            self._chroma(magnitude),
+        ], axis=1)
+        return np.concatenate([features.mean(axis=2), features.std(axis=2), features.max(axis=2)], axis=1).astype(
+            np.float32
+        )
+
+    def _power_to_db(self, power, axes):
+        """librosa.power_to_db: dB re 1.0, floored top_db below each clip's own peak over `axes`."""
+        log = 10.0 * np.log10(np.maximum(self.amin, power))
+        return np.maximum(log, log.max(axis=axes, keepdims=True) - self.top_db)
+
+    def _frames(self, padded, width=None):
+        """(batch, frames, width) strided view of each clip's STFT frames."""
+        view = np.lib.stride_tricks.sliding_window_view(padded, width or self.n_fft, axis=-1)
+        return view[:, ::self.hop_length]
+
+    def _zero_crossing_rate(self, padded):
+        # Samples within 1e-10 of zero count as positive. crossings[:, i] is a sign change between samples
+        # i and i + 1; none is counted into a frame's first sample, so a frame holds n_fft - 1 of them
+        negative = padded < -1e-10
+        crossings = negative[:, 1:] != negative[:, :-1]
+        return np.count_nonzero(self._frames(crossings, self.n_fft - 1), axis=-1) / self.n_fft
+
+    def _mfcc(self, power):
+        log_mel = self._power_to_db(self.mel_basis @ power, axes=(1, 2))
+        return self.dct_basis @ log_mel
+
+    def _band_slices(self, fmin=200.0, quantile=0.02):
+        """(start, stop, count) per librosa.feature.spectral_contrast octave band, count being its quantile size."""
+        n_bands = CONTRAST_BANDS - 1
+        edges = np.zeros(n_bands + 2)
+        edges[1:] = fmin * 2.0 ** np.arange(0, n_bands + 1)
+        bands = []
+        for k, (low, high) in enumerate(zip(edges[:-1], edges[1:])):
+            current = (self.frequencies >= low) & (self.frequencies <= high)
+            idx = np.flatnonzero(current)
+            if k > 0:
+                current[idx[0] - 1] = True
+            if k == n_bands:
+                current[idx[-1] + 1:] = True
+            start, stop = np.flatnonzero(current)[[0, -1]]
+            stop = stop + 1 if k == n_bands else stop  # The band's last bin is dropped below the top band
+            bands.append((start, stop, max(1, int(np.rint(quantile * current.sum())))))
+        return bands
+
+    def _spectral_contrast(self, magnitude):
+        peak = np.empty((magnitude.shape[0], len(self._contrast_bands), magnitude.shape[2]), dtype=np.float32)
+        valley = np.empty_like(peak)
+        for k, (start, stop, count) in enumerate(self._contrast_bands):
+            band = np.sort(magnitude[:, start:stop], axis=1)
+            valley[:, k] = band[:, :count].mean(axis=1)
+            peak[:, k] = band[:, -count:].mean(axis=1)
+        return self._power_to_db(peak, axes=(1, 2)) - self._power_to_db(valley, axes=(1, 2))
+
+    def _tuning(self, magnitude, fmin=150.0, fmax=4000.0, threshold=0.1):
+        """librosa.estimate_tuning for each clip: pitch deviation from A440 in fractions of a chroma bin."""
+        # piptrack: thresholded local maxima along frequency, refined by parabolic interpolation. Only bins
+        # in [fmin, fmax) can hold a pitch, so only they and their two neighbours are computed
+        band = np.flatnonzero((self.frequencies >= fmin) & (self.frequencies < min(fmax, self.sample_rate / 2.0)))
+        low, high = band[0], band[-1] + 1
+        x = magnitude[:, low - 1:high + 1]
+        masked = x * (x > threshold * magnitude.max(axis=1, keepdims=True))
+        peaks = (masked[:, 1:-1] > masked[:, :-2]) & (masked[:, 1:-1] >= masked[:, 2:])
+
+        a = x[:, 2:] + x[:, :-2] - 2 * x[:, 1:-1]
+        b = (x[:, 2:] - x[:, :-2]) / 2  # Also np.gradient's central difference
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shift = np.where(np.abs(b) >= np.abs(a), 0.0, -b / a).astype(np.float32)
+        bins = np.arange(low, high, dtype=np.float32)[:, np.newaxis]
+        pitch = (bins + shift) * float(self.sample_rate) / self.n_fft
+        mag = x[:, 1:-1] + 0.5 * b * shift
+
+        # pitch_tuning on the stronger half of each clip's peaks
+        edges = np.linspace(-0.5, 0.5, 101)
+        tunings = []
+        for row in range(magnitude.shape[0]):
+            found = peaks[row] & (pitch[row] > 0)
+            frequencies = pitch[row][found & (mag[row] >= np.median(mag[row][found]))] if found.any() else []
+            if not len(frequencies):
+                tunings.append(0.0)
+                continue
+            residual = np.mod(CHROMA_BINS * np.log2(frequencies / (440.0 / 16)), 1.0)
+            residual[residual >= 0.5] -= 1.0
+            counts, _ = np.histogram(residual, edges)
+            tunings.append(float(edges[np.argmax(counts)]))
+        return tunings
+
+    def _chroma_filter(self, tuning):
+        if tuning not in self._chroma_filters:
+            import librosa
+            self._chroma_filters[tuning] = librosa.filters.chroma(
+                sr=self.sample_rate, n_fft=self.n_fft, tuning=tuning, n_chroma=CHROMA_BINS
+            )
+        return self._chroma_filters[tuning]
+
+    def _chroma(self, magnitude):
+        chroma = np.stack([
+            self._chroma_filter(tuning) @ clip for tuning, clip in zip(self._tuning(magnitude), magnitude)
+        ])
+        # Max-normalized per frame; frames with no energy stay zero
+        norm = chroma.max(axis=1, keepdims=True)
+        return chroma / np.where(norm < np.finfo(chroma.dtype).tiny, 1.0, norm)
@@ -0,0 +1,154 @@
+# detection/utils/decisions.py
+import threading
+from collections import defaultdict
+import numpy as np
+from . import metrics
+
+SMOOTHING_METHODS = ('none', 'ema', 'vote')
+
+# Process-wide transition counts, keyed (detector, state)
+transition_totals = defaultdict(int)
+_totals_lock = threading.Lock()
+
+
+class ScoreTrack:
+    """
+    Smoothed on/off state for one detector on one stream.
+
+    The last `n` scores live in a fixed float32 ring. A track switches on
+    when the smoothed score reaches `on_threshold` and only switches off
+    once it falls below the lower `off_threshold`, so a score hovering
+    around the threshold does not flicker. Smoothing is one of:
+
+    - none: the raw score
+    - ema: exponential moving average with weight `alpha` on the new score
+    - vote: on when at least `k` of the last `n` scores reach `on_threshold`,
+      off when fewer than `k` still reach `off_threshold`
+    """
+
+    def __init__(self, name, on_threshold, off_threshold=None, method='ema', alpha=0.5, k=2, n=3):
+        if method not in SMOOTHING_METHODS:
+            raise ValueError(f"Unknown smoothing method '{method}', expected one of {SMOOTHING_METHODS}")
+        self.name = name
+        self.on_threshold = on_threshold
+        self.off_threshold = on_threshold if off_threshold is None else min(off_threshold, on_threshold)
+        self.method = method
+        self.alpha = alpha
+        self.n = max(1, int(n))
+        self.k = min(max(1, int(k)), self.n)
+
+        self.scores = np.zeros(self.n, dtype=np.float32)
+        self._pos = 0
+        self.count = 0
+        self.ema = None
+        self.active = False
+
+    @classmethod
+    def from_settings(cls, name, config):
+        smoothing = config.get('SMOOTHING', {})
+        return cls(
+            name,
+            config['THRESHOLD'],
+            config.get('RELEASE_THRESHOLD'),
+            method=smoothing.get('METHOD', 'none'),
+            alpha=smoothing.get('ALPHA', 0.5),
+            k=smoothing.get('K', 1),
+            n=smoothing.get('N', 1)
+        )
+
+    def _recent(self):
+        return self.scores if self.count >= self.n else self.scores[:self.count]
+
+    def smoothed(self):
+        """The value the thresholds are applied to, or the latest vote share for 'vote'."""
+        if self.method == 'ema':
+            return self.ema
+        if self.method == 'vote':
+            return float(np.count_nonzero(self._recent() >= self.on_threshold)) / self.n
+        return float(self.scores[(self._pos - 1) % self.n])
+
+    def update(self, score):
+        """Adds one window's score; returns 'on' or 'off' if the state changed, else None."""
+        score = float(score)
+        self.scores[self._pos] = score
+        self._pos = (self._pos + 1) % self.n
+        self.count += 1
+
+        if self.method == 'vote':
+            recent = self._recent()
+            if self.active:
+                turn_on = np.count_nonzero(recent >= self.off_threshold) >= self.k
+            else:
+                turn_on = np.count_nonzero(recent >= self.on_threshold) >= self.k
+        else:
+            if self.method == 'ema':
+                self.ema = score if self.ema is None else self.alpha * score + (1 - self.alpha) * self.ema
+                value = self.ema
+            else:
+                value = score
+            turn_on = value >= (self.off_threshold if self.active else self.on_threshold)
+
+        if turn_on == self.active:
+            return None
+        self.active = turn_on
+        state = 'on' if turn_on else 'off'
+        with _totals_lock:
+            transition_totals[(self.name, state)] += 1
+        return state
+
+
+class DecisionEngine:
+    """
+    Per-stream decisions for both detectors. `update` takes one window's
+    raw scores and returns only the transitions, so a stream in a steady
+    state produces no messages however many windows are scored.
+    """
+
+    def __init__(self, tracks):
+        self.tracks = {track.name: track for track in tracks}
+
+    @classmethod
+    def from_settings(cls, model_config):
+        return cls([
+            ScoreTrack.from_settings('wakeword', model_config['WAKEWORD']),
+            ScoreTrack.from_settings('panic', model_config['PANIC']),
+        ])
+
+    def active(self, name):
+        return self.tracks[name].active
+
+    def update(self, **scores):
+        """
+        scores maps detector name to its raw score; None leaves that track
+        untouched, e.g. when inference failed. Returns a list of
+        {'detector', 'state', 'score', 'smoothed'} dicts.
+        """
+        transitions = []
+        for name, score in scores.items():
+            if score is None:
+                continue
+            track = self.tracks[name]
+            state = track.update(score)
+            if state is not None:
+                smoothed = track.smoothed()
+                transitions.append({
+                    'detector': name,
+                    'state': state,
+                    'score': round(float(score), 4),
+                    'smoothed': round(float(smoothed), 4) if smoothed is not None else None
+                })
+        return transitions
+
+
+def stats():
+    with _totals_lock:
+        return {f"{name}:{state}": count for (name, state), count in transition_totals.items()}
+
+
+metrics.Counter(
+    'calmalert_decision_transitions_total', 'Smoothed detector state changes across all streams.',
+    ('detector', 'state'),
+    function=lambda: [
+        ({'detector': name, 'state': state}, count) for (name, state), count in dict(transition_totals).items()
+    ]
+)
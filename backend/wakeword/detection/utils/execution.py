@@ -0,0 +1,176 @@
+# detection/utils/execution.py
+import os
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Models behind a MicroBatcher, each allowed MAX_CONCURRENT_BATCHES calls at once
+BATCHED_MODELS = 2
+
+
+def parse_cpu_list(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11], the notation of taskset and /sys cpulists."""
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def available_cpus():
+    """CPUs this process may run on, honouring taskset, cgroups cpusets and container limits."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def resolve_affinity(spec, cpus):
+    """
+    The CPUs named by an AFFINITY setting: a cpu list ('0-7'), or
+    'slot:i/n' for the i-th of n equal shares of `cpus`, so n inference
+    worker processes started with i = 0..n-1 never share a core.
+    """
+    spec = (spec or '').strip()
+    if not spec:
+        return None
+    if spec.startswith('slot:'):
+        index, _, count = spec[len('slot:'):].partition('/')
+        index, count = int(index), int(count)
+        if not 0 <= index < count:
+            raise ValueError(f"Affinity slot {spec} is out of range")
+        share = max(1, len(cpus) // count)
+        return cpus[index * share:(index + 1) * share] or cpus[-share:]
+    return parse_cpu_list(spec)
+
+
+class ExecutionPlan:
+    """
+    Thread pool sizes for one process, derived from the cores it may use.
+
+    By default the process runs about one busy thread per core: the
+    inference executor gets a thread per core (at least two, so a model
+    call can overlap feature extraction), and every model call and BLAS
+    routine stays single-threaded, since concurrency comes from batching
+    many streams rather than from splitting one small batch. Any figure
+    set in MODEL_CONFIG['EXECUTION'] overrides the derived one;
+    `manage.py bench_threads` measures which settings suit the host.
+    """
+
+    def __init__(self, cpus, executor_workers=0, intra_op_threads=0, inter_op_threads=1, blas_threads=1,
+                 affinity=None):
+        self.affinity = affinity
+        self.cpus = list(affinity or cpus)
+        self.cores = max(1, len(self.cpus))
+        self.executor_workers = int(executor_workers) or max(2, self.cores)
+        self.intra_op_threads = int(intra_op_threads) or 1
+        self.inter_op_threads = max(1, int(inter_op_threads))
+        self.blas_threads = max(1, int(blas_threads))
+        self._applied = False
+        self._torch_applied = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, config, cpus=None):
+        cpus = available_cpus() if cpus is None else cpus
+        return cls(
+            cpus,
+            executor_workers=config['EXECUTOR_WORKERS'],
+            intra_op_threads=config['INTRA_OP_THREADS'],
+            inter_op_threads=config['INTER_OP_THREADS'],
+            blas_threads=config['BLAS_THREADS'],
+            affinity=resolve_affinity(config['AFFINITY'], cpus)
+        )
+
+    def max_busy_threads(self, concurrent_batches):
+        """Upper bound on threads doing work at once: executor threads, plus intra-op helpers of concurrent model calls."""
+        calls = min(self.executor_workers, BATCHED_MODELS * concurrent_batches)
+        return self.executor_workers + calls * (self.intra_op_threads - 1)
+
+    def apply(self):
+        """Pins the process to its CPUs and limits BLAS pools; runs once, before any pool is created."""
+        with self._lock:
+            if self._applied:
+                return
+            self._applied = True
+            if self.affinity:
+                self._pin(self.affinity)
+            try:
+                from threadpoolctl import threadpool_limits
+            except ImportError:  # threadpoolctl comes with scikit-learn; without it BLAS keeps its default
+                threadpool_limits = None
+            if threadpool_limits is not None:
+                threadpool_limits(limits=self.blas_threads, user_api='blas')
+            logger.info(f"Execution plan: {self.summary()}")
+
+    def _pin(self, cpus):
+        if not hasattr(os, 'sched_setaffinity'):
+            logger.warning("CPU affinity is not supported on this platform; AFFINITY ignored")
+            return
+        # Linux applies affinity per thread; threads started later inherit it from their creator
+        try:
+            threads = [int(tid) for tid in os.listdir('/proc/self/task')]
+        except OSError:
+            threads = [0]
+        for tid in threads:
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError as e:
+                logger.warning(f"Could not pin thread {tid} to CPUs {cpus}: {str(e)}")
+
+    def session_options(self):
+        """onnxruntime SessionOptions for small-batch CPU inference under this plan."""
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Spinning threads burn a core each while idle between micro-batches
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        return options
+
+    def apply_torch(self):
+        """Sizes torch's intra- and inter-op pools; called when a torch backend loads."""
+        with self._lock:
+            if self._torch_applied:
+                return
+            self._torch_applied = True
+        import torch
+        torch.set_num_threads(self.intra_op_threads)
+        try:
+            torch.set_num_interop_threads(self.inter_op_threads)
+        except RuntimeError:
+            # Only possible before torch's first parallel work
+            logger.warning(f"torch inter-op threads already started; keeping {torch.get_num_interop_threads()}")
+
+    def summary(self):
+        return {
+            'cores': self.cores,
+            'affinity': self.affinity,
+            'executor_workers': self.executor_workers,
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+            'blas_threads': self.blas_threads,
+            'max_busy_threads': self.max_busy_threads(settings.INFERENCE_CONFIG['BATCHING']['MAX_CONCURRENT_BATCHES']),
+        }
+
+
+_plan = None
+_plan_lock = threading.Lock()
+
+
+def execution_plan():
+    """Process-wide ExecutionPlan from MODEL_CONFIG['EXECUTION'], applied on first use."""
+    global _plan
+    if _plan is None:
+        with _plan_lock:
+            if _plan is None:
+                plan = ExecutionPlan.from_settings(settings.MODEL_CONFIG['EXECUTION'])
+                plan.apply()
+                _plan = plan
+    return _plan
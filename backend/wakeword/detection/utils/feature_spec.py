@@ -0,0 +1,205 @@
+# detection/utils/feature_spec.py
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+# Bumped when the file layout changes; newer files are refused rather than misread
+FORMAT_VERSION = 1
+
+# clip_stats: one vector of per-clip statistics (detection/training/features.py)
+# mfcc_frames: a (frames, n_mfcc) matrix from the serving FeatureFrontend
+KINDS = ('clip_stats', 'mfcc_frames')
+# Model output columns for each output activation
+OUTPUT_WIDTHS = {'sigmoid': 1, 'softmax': 2}
+# Front-end parameters each kind is defined by
+FRONTEND_KEYS = {
+    'clip_stats': ('sample_rate', 'duration', 'n_fft', 'hop_length', 'n_mfcc', 'amplitude'),
+    'mfcc_frames': ('sample_rate', 'n_fft', 'hop_length', 'n_mfcc', 'n_mels', 'min_frames', 'amplitude'),
+}
+AMPLITUDES = ('unit', 'int16')
+
+
+class FeatureSpecError(ValueError):
+    """A feature spec is malformed, or does not match the model or front-end it is used with."""
+
+
+class FeatureSpec:
+    """
+    The feature contract between panic-model training and serving.
+
+    Written next to the model when it is trained, it records the model
+    architecture and output activation, how features are computed (kind,
+    sample rate, FFT parameters, feature names in column order) and the
+    fitted scaler as plain mean / scale arrays. The server loads it once;
+    apply() is then a single vectorized `(x - mean) / scale` over a batch,
+    with no pickled scaler or sklearn at serving time.
+    """
+
+    def __init__(self, model, kind, output, frontend, features, mean=None, scale=None, metadata=None,
+                 format_version=FORMAT_VERSION):
+        self.model = model
+        self.kind = kind
+        self.output = output
+        self.frontend = dict(frontend)
+        self.features = list(features)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.metadata = dict(metadata or {})
+        self.format_version = format_version
+        self.validate()
+        # Multiplying by a precomputed reciprocal is cheaper than dividing every batch
+        self._inv_scale = None if self.scale is None else (1.0 / self.scale).astype(np.float32)
+
+    def validate(self):
+        if self.format_version > FORMAT_VERSION:
+            raise FeatureSpecError(
+                f"Feature spec format {self.format_version} is newer than this server understands ({FORMAT_VERSION})"
+            )
+        if self.kind not in KINDS:
+            raise FeatureSpecError(f"Unknown feature kind '{self.kind}', expected one of {KINDS}")
+        if self.output not in OUTPUT_WIDTHS:
+            raise FeatureSpecError(f"Unknown model output '{self.output}', expected one of {tuple(OUTPUT_WIDTHS)}")
+        missing = [key for key in FRONTEND_KEYS[self.kind] if key not in self.frontend]
+        if missing:
+            raise FeatureSpecError(f"Feature spec is missing front-end parameters {missing}")
+        if self.frontend['amplitude'] not in AMPLITUDES:
+            raise FeatureSpecError(f"Unknown amplitude '{self.frontend['amplitude']}', expected one of {AMPLITUDES}")
+        if not self.features:
+            raise FeatureSpecError("Feature spec lists no features")
+        if self.kind == 'mfcc_frames' and len(self.features) != self.frontend['n_mfcc']:
+            raise FeatureSpecError(f"{len(self.features)} features listed for {self.frontend['n_mfcc']} MFCCs")
+        if (self.mean is None) != (self.scale is None):
+            raise FeatureSpecError("Scaler needs both mean and scale")
+        if self.mean is not None:
+            if self.mean.shape != (self.input_dim,) or self.scale.shape != (self.input_dim,):
+                raise FeatureSpecError(
+                    f"Scaler arrays have shapes {self.mean.shape} and {self.scale.shape}, expected ({self.input_dim},)"
+                )
+            if not (np.isfinite(self.mean).all() and np.isfinite(self.scale).all() and (self.scale > 0).all()):
+                raise FeatureSpecError("Scaler mean and scale must be finite, and scale positive")
+
+    @property
+    def input_dim(self):
+        return len(self.features)
+
+    @property
+    def output_width(self):
+        return OUTPUT_WIDTHS[self.output]
+
+    def input_shape(self, batch=1):
+        """Shape of a model input batch of `batch` rows (frames at their minimum for mfcc_frames)."""
+        if self.kind == 'clip_stats':
+            return (batch, self.input_dim)
+        return (batch, self.frontend['min_frames'], self.input_dim)
+
+    def apply(self, x, out=None):
+        """Scales float32 features along their last axis; pass `out=x` to scale a batch in place."""
+        x = np.asarray(x, dtype=np.float32)
+        if self._inv_scale is None:
+            if out is not None and out is not x:
+                out[...] = x
+                return out
+            return x
+        out = np.subtract(x, self.mean, out=out)
+        return np.multiply(out, self._inv_scale, out=out)
+
+    def check_frontend(self, frontend):
+        """Raises FeatureSpecError if an mfcc_frames spec was not computed with this FeatureFrontend's parameters."""
+        if self.kind != 'mfcc_frames':
+            return
+        mismatched = {
+            key: (self.frontend[key], getattr(frontend, key))
+            for key in ('sample_rate', 'n_fft', 'hop_length', 'n_mfcc', 'n_mels')
+            if self.frontend[key] != getattr(frontend, key)
+        }
+        if mismatched:
+            details = ', '.join(f"{key} {spec} != {actual}" for key, (spec, actual) in mismatched.items())
+            raise FeatureSpecError(f"Feature front-end does not match the feature spec: {details}")
+
+    def to_dict(self):
+        return {
+            'format_version': self.format_version,
+            'model': self.model,
+            'kind': self.kind,
+            'output': self.output,
+            'frontend': self.frontend,
+            'features': self.features,
+            'scaler': None if self.mean is None else {'mean': self.mean.tolist(), 'scale': self.scale.tolist()},
+            'metadata': self.metadata,
+        }
+
+    def digest(self):
+        """Short hash of everything that affects model inputs; exported models embed it."""
+        contract = self.to_dict()
+        del contract['metadata']
+        return hashlib.sha256(json.dumps(contract, sort_keys=True).encode()).hexdigest()[:16]
+
+    def summary(self):
+        return {
+            'model': self.model,
+            'kind': self.kind,
+            'input_dim': self.input_dim,
+            'scaled': self.mean is not None,
+            'digest': self.digest(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            scaler = data.get('scaler') or {}
+            return cls(
+                model=data['model'],
+                kind=data['kind'],
+                output=data['output'],
+                frontend=data['frontend'],
+                features=data['features'],
+                mean=scaler.get('mean'),
+                scale=scaler.get('scale'),
+                metadata=data.get('metadata'),
+                format_version=data['format_version']
+            )
+        except KeyError as e:
+            raise FeatureSpecError(f"Feature spec is missing '{e.args[0]}'")
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise FeatureSpecError(f"Could not read feature spec {path}: {str(e)}")
+        return cls.from_dict(data)
+
+    def save(self, path):
+        """Writes the spec atomically, so a server never reads a half-written file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.to_dict(), f, indent=1)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def mfcc_frames_spec(frontend, model='PanicClassifier', output='softmax', min_frames=96):
+    """Unscaled spec for a model fed raw FeatureFrontend MFCC frames, as the original PanicClassifier was."""
+    return FeatureSpec(
+        model=model,
+        kind='mfcc_frames',
+        output=output,
+        frontend={
+            'sample_rate': frontend.sample_rate,
+            'n_fft': frontend.n_fft,
+            'hop_length': frontend.hop_length,
+            'n_mfcc': frontend.n_mfcc,
+            'n_mels': frontend.n_mels,
+            'min_frames': min_frames,
+            'amplitude': 'int16',
+        },
+        features=[f'mfcc_{i}' for i in range(frontend.n_mfcc)]
+    )
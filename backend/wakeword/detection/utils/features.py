@@ -0,0 +1,208 @@
+# detection/utils/features.py
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Mean log-mel level (dB, int16-scale input) minus this is roughly dBFS; measured with white noise
+MEL_DB_TO_DBFS = 97.0
+
+
+class ChunkFeatures:
+    """
+    MFCC matrix of one chunk, computed once and shared by both detectors.
+
+    `mfcc` has shape (n_mfcc, frames), the same layout librosa returns.
+    `audio` keeps the chunk's samples (int16 scale) for models whose feature
+    spec asks for features computed from the waveform itself.
+    """
+
+    def __init__(self, mfcc, n_mels=128, audio=None):
+        self.mfcc = mfcc
+        self.n_mels = n_mels
+        self.audio = audio
+        self._normalized = None
+
+    @property
+    def frames(self):
+        return self.mfcc.shape[1]
+
+    def peak_level_dbfs(self):
+        """Loudest frame's level, read off the 0th cepstral coefficient; a near-free loudness score."""
+        return float(self.mfcc[0].max() / np.sqrt(self.n_mels) - MEL_DB_TO_DBFS)
+
+    def panic_view(self):
+        """Raw MFCC frames as (frames, n_mfcc); a transposed view, no copy."""
+        return self.mfcc.T
+
+    def wakeword_view(self):
+        """Globally normalized MFCC frames as (frames, n_mfcc), computed once per chunk."""
+        if self._normalized is None:
+            normalized = self.mfcc - self.mfcc.mean()
+            normalized /= self.mfcc.std()
+            self._normalized = normalized.T
+        return self._normalized
+
+
+def hann_window(n_fft):
+    """Periodic Hann window, as scipy.signal.get_window('hann', n_fft, fftbins=True)."""
+    return 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(n_fft) / n_fft)
+
+
+def hz_to_mel(frequencies):
+    """Slaney mel scale: linear below 1 kHz, logarithmic above (librosa's default, htk=False)."""
+    frequencies = np.asanyarray(frequencies, dtype=np.float64)
+    mels = frequencies / (200.0 / 3)
+    log_region = frequencies >= 1000.0
+    mels = np.where(log_region, 15.0 + np.log(np.maximum(frequencies, 1e-10) / 1000.0) / (np.log(6.4) / 27.0), mels)
+    return mels
+
+
+def mel_to_hz(mels):
+    mels = np.asanyarray(mels, dtype=np.float64)
+    frequencies = mels * (200.0 / 3)
+    log_region = mels >= 15.0
+    return np.where(log_region, 1000.0 * np.exp((np.log(6.4) / 27.0) * (mels - 15.0)), frequencies)
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels, fmin=0.0, fmax=None):
+    """Slaney-normalized triangular mel filters, shape (n_mels, 1 + n_fft // 2); matches librosa.filters.mel."""
+    fmax = sample_rate / 2.0 if fmax is None else fmax
+    fft_frequencies = np.linspace(0, sample_rate / 2.0, 1 + n_fft // 2)
+    mel_frequencies = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+
+    widths = np.diff(mel_frequencies)
+    ramps = mel_frequencies[:, np.newaxis] - fft_frequencies[np.newaxis, :]
+    lower = -ramps[:-2] / widths[:-1, np.newaxis]
+    upper = ramps[2:] / widths[1:, np.newaxis]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    # Constant energy per channel
+    weights *= (2.0 / (mel_frequencies[2:] - mel_frequencies[:-2]))[:, np.newaxis]
+    return weights
+
+
+def dct_matrix(n_out, n_in):
+    """Rows of the orthonormal DCT-II, shape (n_out, n_in); matches scipy.fft.dct(type=2, norm='ortho')."""
+    k = np.arange(n_out)[:, np.newaxis]
+    n = np.arange(n_in)[np.newaxis, :]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_in)) * np.sqrt(2.0 / n_in)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+class FeatureFrontend:
+    """
+    Single-pass MFCC extraction shared by the wakeword and panic detectors.
+
+    Produces the same matrix as `librosa.feature.mfcc` with these parameters
+    (checked by `manage.py bench_features`), using only NumPy: the window,
+    mel filterbank and DCT matrix are built once, and compute_batch() runs
+    the STFT and projections for a whole (batch, samples) array at once.
+    """
+
+    def __init__(self, sample_rate=16000, n_mfcc=40, n_fft=512, hop_length=160, n_mels=128,
+                 top_db=80.0, amin=1e-10):
+        self.sample_rate = sample_rate
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.top_db = top_db
+        self.amin = amin
+
+        self.window = hann_window(n_fft).astype(np.float32)
+        self.mel_basis = mel_filterbank(sample_rate, n_fft, n_mels).astype(np.float32)
+        self.dct_basis = dct_matrix(n_mfcc, n_mels).astype(np.float32)
+
+    def frames_for(self, samples):
+        """MFCC frames compute() returns for a chunk of `samples` samples (centered STFT)."""
+        return 1 + samples // self.hop_length
+
+    @staticmethod
+    def decode(audio):
+        """int16 PCM bytes to float32 samples (kept at int16 scale, as the models were trained)."""
+        if isinstance(audio, np.ndarray):
+            return audio.astype(np.float32, copy=False)
+        return np.frombuffer(audio, dtype=np.int16).astype(np.float32)
+
+    def _framed_power(self, samples):
+        """Centered, zero-padded STFT power of (batch, samples) -> (batch, n_frames, 1 + n_fft // 2)."""
+        pad = self.n_fft // 2
+        padded = np.pad(samples, ((0, 0), (pad, pad)))
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.n_fft, axis=-1)[:, ::self.hop_length]
+        power = np.empty(frames.shape[:2] + (1 + self.n_fft // 2,), dtype=np.float32)
+        # FFT a clip at a time: a whole batch of windowed frames spills out of cache and runs
+        # about half as fast; the projections after this are where batching pays off
+        for row in range(frames.shape[0]):
+            spectrum = np.fft.rfft(frames[row] * self.window, axis=-1)
+            np.add(spectrum.real ** 2, spectrum.imag ** 2, out=power[row])
+        return power
+
+    def power_spectrogram(self, audio):
+        """STFT power of one clip, shape (1 + n_fft // 2, n_frames)."""
+        return self._framed_power(audio[np.newaxis])[0].T
+
+    def power_frames(self, frames):
+        """Power spectra of already framed samples, (n_frames, n_fft) -> (1 + n_fft // 2, n_frames)."""
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        return (spectrum.real ** 2 + spectrum.imag ** 2).T
+
+    def log_mel(self, power):
+        """Mel power in dB relative to 1.0, without the top_db floor."""
+        return 10.0 * np.log10(np.maximum(self.amin, self.mel_basis @ power))
+
+    def mfcc_from_log_mel(self, log_mel):
+        log_mel = np.maximum(log_mel, log_mel.max() - self.top_db)
+        return self.dct_basis @ log_mel
+
+    def compute_batch(self, audio):
+        """MFCCs of equal-length clips, (batch, samples) -> (batch, n_mfcc, n_frames)."""
+        samples = np.atleast_2d(np.asarray(audio, dtype=np.float32))
+        log_mel = 10.0 * np.log10(np.maximum(self.amin, self._framed_power(samples) @ self.mel_basis.T))
+        # top_db floor is relative to each clip's own peak
+        log_mel = np.maximum(log_mel, log_mel.max(axis=(1, 2), keepdims=True) - self.top_db)
+        return (log_mel @ self.dct_basis.T).transpose(0, 2, 1)
+
+    def compute(self, audio):
+        """Decodes one chunk and returns its ChunkFeatures."""
+        samples = self.decode(audio)
+        return ChunkFeatures(self.compute_batch(samples[np.newaxis])[0], self.n_mels, samples)
+
+    def compute_many(self, chunks):
+        """ChunkFeatures for several chunks; chunks of equal length share one batched pass."""
+        samples = [self.decode(chunk) for chunk in chunks]
+        results = [None] * len(samples)
+        by_length = {}
+        for i, clip in enumerate(samples):
+            by_length.setdefault(len(clip), []).append(i)
+        for indices in by_length.values():
+            mfcc = self.compute_batch(np.stack([samples[i] for i in indices]))
+            for row, i in enumerate(indices):
+                results[i] = ChunkFeatures(mfcc[row], self.n_mels, samples[i])
+        return results
+
+    def features_for(self, item):
+        """Accepts either raw audio or precomputed ChunkFeatures."""
+        if isinstance(item, ChunkFeatures):
+            return item
+        return self.compute(item)
+
+    def features_for_batch(self, items):
+        """features_for over a list, computing any raw chunks in batched passes."""
+        raw = [i for i, item in enumerate(items) if not isinstance(item, ChunkFeatures)]
+        results = list(items)
+        for i, features in zip(raw, self.compute_many([items[i] for i in raw])):
+            results[i] = features
+        return results
+
+
+_shared_frontend = None
+
+
+def shared_frontend():
+    """Process-wide FeatureFrontend with the parameters both models were trained on."""
+    global _shared_frontend
+    if _shared_frontend is None:
+        _shared_frontend = FeatureFrontend()
+    return _shared_frontend
@@ -0,0 +1,161 @@
+# detection/utils/metrics.py
+import time
+import bisect
+import threading
+
+# Seconds; spans sub-millisecond feature work up to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_metrics = []
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{value}"' for name, value in pairs)
+    return '{' + body + '}'
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense, one series per label set.
+
+    observe() is a bisect plus a few additions under a lock, cheap enough to
+    leave on for every chunk under full load.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Gauge:
+    """
+    Gauge set from the hot path with set/inc/dec, or read at scrape time
+    from `function`, which returns a number or a list of (labels, value).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _collect(self):
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.function()
+        if not isinstance(value, list):
+            return {(): value}
+        return {_label_key(self.labelnames, labels): v for labels, v in value}
+
+    def samples(self):
+        for key, value in sorted(self._collect().items()):
+            if value is None:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Counter(Gauge):
+    """Monotonic total; usually read from an existing counter dict via `function`."""
+
+    kind = 'counter'
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        try:
+            samples = list(metric.samples())
+        except Exception as e:
+            lines.append(f"# {metric.name} unavailable: {str(e)}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+# Hot-path stages of MonitoringConsumer: decode, features, wakeword, panic, emergency, send
+STAGE_SECONDS = Histogram('calmalert_stage_seconds', 'Time spent in each stage of chunk processing.', ('stage',))
+INFERENCE_SECONDS = Histogram(
+    'calmalert_inference_seconds', 'Model call time per batch, excluding queueing.', ('model', 'backend')
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    'calmalert_inference_batch_size', 'Chunks scored per model call.', ('model', 'backend'),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+ACTIVE_CONNECTIONS = Gauge('calmalert_active_connections', 'Open WebSocket connections.', ('consumer',))
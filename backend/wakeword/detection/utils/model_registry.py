@@ -0,0 +1,231 @@
+# detection/utils/model_registry.py
+import os
+import time
+import asyncio
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from . import wakeword_onnx, panic_detection
+from .batching import MicroBatcher
+from . import metrics
+from .features import shared_frontend
+from .execution import execution_plan
+
+try:
+    import psutil
+except ImportError:  # psutil is optional, memory figures are reported as None without it
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Batched call per model: the wakeword batcher returns raw scores so streams can smooth
+# them (see decisions.py); panic results already carry their confidence
+BATCH_METHODS = {'wakeword': 'score_batch', 'panic': 'detect_batch'}
+
+
+def _rss_bytes():
+    if psutil is None:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the detection models and the inference executor.
+
+    Every consumer and view asks the registry for its detectors instead of
+    building its own, so each model is loaded once per worker process. A
+    load that fails is remembered too, and re-raised without another attempt
+    until reload() or warmup() asks for one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._errors = {}
+        self._stats = {}
+        self._executor = None
+        self._batchers = {}
+
+    @staticmethod
+    def _load_panic():
+        config = settings.MODEL_CONFIG['PANIC']
+        backend = config['BACKEND']
+        return panic_detection.PanicDetector(panic_detection.panic_model_path(config, backend), backend=backend)
+
+    def _factories(self):
+        return {
+            'wakeword': lambda: wakeword_onnx.WakeWordDetector(settings.MODEL_CONFIG['WAKEWORD']['PATH']),
+            'panic': self._load_panic,
+        }
+
+    def enabled(self, name):
+        """Whether the named model is served; a disabled model is never loaded and scores as None."""
+        return name in self._models or settings.MODEL_CONFIG[name.upper()].get('ENABLED', True)
+
+    def _raise_load_error(self, name):
+        # A new exception each time, chained to the original: re-raising that one would grow its traceback
+        error = self._errors[name]
+        raise RuntimeError(f"{name} model failed to load: {error}") from error
+
+    def get(self, name):
+        """Returns the shared model instance, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name in self._errors:
+            self._raise_load_error(name)
+
+        with self._lock:
+            if name in self._errors:
+                self._raise_load_error(name)
+            if name not in self._models:
+                factory = self._factories()[name]
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                try:
+                    self._models[name] = factory()
+                except Exception as e:
+                    self._errors[name] = e
+                    self._stats[name] = {'status': 'error', 'error': str(e)}
+                    raise
+                load_time = time.perf_counter() - start
+                rss_after = _rss_bytes()
+                self._stats[name] = {
+                    'status': 'loaded',
+                    'load_time_ms': round(load_time * 1000, 2),
+                    'memory_bytes': max(rss_after - rss_before, 0) if rss_before is not None else None,
+                    'loaded_at': time.time(),
+                }
+                spec = getattr(self._models[name], 'spec', None)
+                if spec is not None:
+                    self._stats[name]['feature_spec'] = spec.summary()
+                logger.info(f"Loaded {name} model in {load_time * 1000:.1f} ms")
+            return self._models[name]
+
+    def install(self, name, model, status='stub'):
+        """Replaces a model in place, e.g. with a stub for offline benchmarks."""
+        with self._lock:
+            self._models[name] = model
+            self._errors.pop(name, None)
+            self._stats[name] = {'status': status, 'load_time_ms': 0.0, 'memory_bytes': 0, 'loaded_at': time.time()}
+            # A batcher built earlier would still call the old model
+            self._batchers.pop(name, None)
+
+    def reload(self, name):
+        """Drops the named model, or the error its last load raised, and loads it again."""
+        with self._lock:
+            self._models.pop(name, None)
+            self._errors.pop(name, None)
+            self._stats.pop(name, None)
+            self._batchers.pop(name, None)
+        return self.get(name)
+
+    def wakeword_detector(self):
+        """The wakeword detector, or None while MODEL_CONFIG['WAKEWORD']['ENABLED'] is off."""
+        return self.get('wakeword') if self.enabled('wakeword') else None
+
+    def panic_detector(self):
+        return self.get('panic')
+
+    def executor(self):
+        """Thread pool shared by every consumer for blocking inference calls, sized by the execution plan."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=execution_plan().executor_workers,
+                        thread_name_prefix='inference'
+                    )
+        return self._executor
+
+    def batcher(self, name):
+        """
+        Shared micro-batcher that groups chunks from all connections into one
+        call to the named model; None for a disabled model.
+        """
+        if not self.enabled(name):
+            return None
+        batcher = self._batchers.get(name)
+        if batcher is None:
+            model = self.get(name)
+            executor = self.executor()
+            config = settings.INFERENCE_CONFIG['BATCHING']
+            with self._lock:
+                batcher = self._batchers.setdefault(name, MicroBatcher(
+                    name,
+                    getattr(model, BATCH_METHODS[name]),
+                    executor,
+                    max_batch_size=config['MAX_BATCH_SIZE'],
+                    max_wait_ms=config['MAX_WAIT_MS'],
+                    max_concurrent_batches=config['MAX_CONCURRENT_BATCHES'],
+                    backend=getattr(model, 'backend', '')
+                ))
+        return batcher
+
+    async def load_batcher(self, name):
+        """
+        batcher() for async callers: a model not loaded yet is loaded on the
+        executor, so torch.load and spec checks never block the event loop.
+        """
+        batcher = self._batchers.get(name)
+        if batcher is not None or not self.enabled(name):
+            return batcher
+        if name in self._errors:
+            self._raise_load_error(name)
+        return await asyncio.get_running_loop().run_in_executor(self.executor(), self.batcher, name)
+
+    def warmup(self, load_models=True):
+        """Loads every model and runs one dummy inference so the first real chunk is not slow."""
+        # Builds the cached filterbanks and touches the FFT code path before real traffic
+        shared_frontend().compute(np.zeros(settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE'], dtype=np.int16))
+        self.executor()
+        if not load_models:
+            return
+        for name in self._factories():
+            if not self.enabled(name) or 'warmup_ms' in self._stats.get(name, {}):
+                continue
+            try:
+                # Warm-up is an explicit request to load, so an earlier failure is tried again
+                model = self.reload(name) if name in self._errors else self.get(name)
+                start = time.perf_counter()
+                model.warmup()
+                self._stats[name]['warmup_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            except Exception as e:
+                logger.error(f"Warm-up of {name} model failed: {str(e)}")
+
+    def status(self):
+        """Load state, load time and memory use for each model."""
+        info = {}
+        for name in self._factories():
+            info[name] = dict(self._stats.get(name, {'status': 'not_loaded' if self.enabled(name) else 'disabled'}))
+        info['panic']['backend'] = settings.MODEL_CONFIG['PANIC']['BACKEND']
+        info['batching'] = {name: batcher.stats() for name, batcher in self._batchers.items()}
+        info['execution'] = execution_plan().summary()
+        info['process_rss_bytes'] = _rss_bytes()
+        return info
+
+    def executor_queue_depth(self):
+        """Calls waiting for a free executor thread."""
+        if self._executor is None:
+            return 0
+        return self._executor._work_queue.qsize()
+
+
+registry = ModelRegistry()
+
+metrics.Gauge(
+    'calmalert_executor_queue_depth', 'Calls waiting for a free inference executor thread.',
+    function=registry.executor_queue_depth
+)
+metrics.Gauge(
+    'calmalert_batcher_pending', 'Chunks waiting in a micro-batcher.', ('model',),
+    function=lambda: [({'model': name}, b.stats()['pending']) for name, b in list(registry._batchers.items())]
+)
+metrics.Gauge(
+    'calmalert_model_memory_bytes', 'RSS growth measured while loading each model.', ('model',),
+    function=lambda: [({'model': name}, s.get('memory_bytes')) for name, s in list(registry._stats.items())]
+)
+metrics.Gauge('calmalert_process_rss_bytes', 'Resident memory of this process.', function=_rss_bytes)
@@ -0,0 +1,276 @@
+# detection/utils/offline_scoring.py
+import os
+import math
+import struct
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _wav_layout(path):
+    """(sample_rate, channels, data_offset, frames) for 16-bit PCM WAVs, or None for anything else."""
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                body = f.read(size)
+                audio_format, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', body[:16])
+                if audio_format == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    audio_format = struct.unpack('<H', body[24:26])[0]
+                fmt = (audio_format, channels, sample_rate, block_align, bits)
+                if size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None or fmt[0] != WAVE_FORMAT_PCM or fmt[4] != 16:
+                    return None
+                offset = f.tell()
+                file_size = os.fstat(f.fileno()).st_size
+                # Recorders that were killed mid-write leave a stale size; trust the file length instead
+                size = min(size, file_size - offset)
+                return fmt[2], fmt[1], offset, size // fmt[3]
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+
+class Recording:
+    """
+    A recording opened for windowed reads without loading it into memory.
+
+    16-bit PCM WAVs are memory-mapped, so a window read only touches the pages
+    it covers. Other formats soundfile can read are seeked and read per window.
+    Windows are returned as 16 kHz mono int16 whatever the source format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._samples = None
+        self._soundfile = None
+
+        layout = _wav_layout(path)
+        if layout is not None:
+            self.sample_rate, self.channels, offset, frames = layout
+            self._samples = np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(frames, self.channels))
+        else:
+            import soundfile as sf
+            self._soundfile = sf.SoundFile(path)
+            self.sample_rate, self.channels, frames = self._soundfile.samplerate, self._soundfile.channels, self._soundfile.frames
+        self.source_frames = frames
+        # Length in 16 kHz samples, the unit windows are counted in
+        self.frames = frames * SAMPLE_RATE // self.sample_rate
+
+    @property
+    def duration(self):
+        return self.frames / SAMPLE_RATE
+
+    def _read_source(self, start, count):
+        if self._samples is not None:
+            block = self._samples[start:start + count]
+        else:
+            self._soundfile.seek(min(start, self.source_frames))
+            block = self._soundfile.read(count, dtype='int16', always_2d=True)
+        if self.channels > 1:
+            return block.mean(axis=1).astype(np.int16)
+        return np.asarray(block[:, 0])
+
+    def read(self, start, count):
+        """`count` samples at 16 kHz from `start`, zero-padded past the end of the recording."""
+        if self.sample_rate == SAMPLE_RATE:
+            window = self._read_source(start, count)
+        else:
+            from scipy.signal import resample_poly
+            source_start = start * self.sample_rate // SAMPLE_RATE
+            source_count = math.ceil(count * self.sample_rate / SAMPLE_RATE)
+            block = self._read_source(source_start, source_count).astype(np.float32)
+            window = resample_poly(block, SAMPLE_RATE, self.sample_rate).astype(np.int16)[:count] if block.size else block
+        if len(window) < count:
+            window = np.pad(window, (0, count - len(window)))
+        return window.astype(np.int16, copy=False)
+
+    def close(self):
+        if self._soundfile is not None:
+            self._soundfile.close()
+        self._samples = None
+
+
+def window_starts(frames, window, hop):
+    """Start offsets of overlapping windows covering `frames` samples; the last one may run past the end."""
+    count = 1 + max(0, math.ceil((frames - window) / hop))
+    return [i * hop for i in range(count)]
+
+
+# Worker side
+
+_open_recording = None
+
+
+def _recording(path):
+    """Keeps the last recording open, since consecutive tasks usually come from the same file."""
+    global _open_recording
+    if _open_recording is None or _open_recording.path != path:
+        if _open_recording is not None:
+            _open_recording.close()
+        _open_recording = Recording(path)
+    return _open_recording
+
+
+def _init_worker():
+    import django
+    django.setup()
+    from .panic_detection import TORCH_BACKENDS
+    if settings.MODEL_CONFIG['PANIC']['BACKEND'] in TORCH_BACKENDS:
+        import torch
+        # One process per core already; intra-op threads would only oversubscribe
+        torch.set_num_threads(1)
+
+
+def score_windows(path, starts, window):
+    """Scores the windows of one recording starting at `starts` with both models, batched."""
+    from .model_registry import registry
+    from .features import shared_frontend
+
+    recording = _recording(path)
+    frontend = shared_frontend()
+    features = frontend.compute_many([recording.read(start, window) for start in starts])
+    wakeword_detector = registry.wakeword_detector()
+    if wakeword_detector is not None:
+        wakeword_scores = wakeword_detector.score_batch(features)
+    else:
+        wakeword_scores = [None] * len(features)
+    panic_results = registry.panic_detector().detect_batch(features)
+
+    records = []
+    for start, wakeword_score, panic in zip(starts, wakeword_scores, panic_results):
+        records.append({
+            'start_s': round(start / SAMPLE_RATE, 3),
+            'end_s': round(min(start + window, recording.frames) / SAMPLE_RATE, 3),
+            'wakeword': wakeword_score is not None and wakeword_score > wakeword_detector.threshold,
+            'wakeword_score': wakeword_score,
+            'panic': panic['panic'],
+            'panic_confidence': panic.get('confidence'),
+        })
+    return records
+
+
+def _score_task(task):
+    return score_windows(*task)
+
+
+# Parent side
+
+_pool = None
+
+
+def scoring_pool(workers):
+    """Process-wide pool for offline scoring; spawned so forking a threaded server is never an issue."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    return _pool
+
+
+def _summary(path, duration, records):
+    panic_starts = [r['start_s'] for r in records if r['panic']]
+    confidences = [r['panic_confidence'] for r in records if r['panic_confidence'] is not None]
+    return {
+        'file': path,
+        'summary': {
+            'duration_s': round(duration, 3),
+            'windows': len(records),
+            'wakeword_windows': sum(r['wakeword'] for r in records),
+            'panic_windows': len(panic_starts),
+            'first_panic_s': panic_starts[0] if panic_starts else None,
+            'max_panic_confidence': max(confidences) if confidences else None,
+        }
+    }
+
+
+def score_recordings(paths, window=None, hop=None, windows_per_task=None, workers=None, pool=None):
+    """
+    Yields a per-window timeline for each recording in order, then a summary
+    record per file. Windows are scored in parallel across a process pool in
+    tasks of `windows_per_task`; at most two tasks per worker are in flight,
+    so memory stays flat however many files are queued. workers=0 scores in
+    this process.
+    """
+    config = settings.BATCH_SCORING_CONFIG
+    window = window or settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE']
+    hop = hop or config['HOP_SIZE']
+    windows_per_task = windows_per_task or config['WINDOWS_PER_TASK']
+    workers = config['WORKERS'] if workers is None else workers
+    if workers and pool is None:
+        pool = scoring_pool(workers)
+
+    def tasks():
+        for path in paths:
+            try:
+                recording = Recording(path)
+            except Exception as e:
+                logger.error(f"Could not open {path}: {str(e)}")
+                yield path, None, None, str(e)
+                continue
+            duration = recording.duration
+            starts = window_starts(recording.frames, window, hop)
+            recording.close()
+            for i in range(0, len(starts), windows_per_task):
+                yield path, starts[i:i + windows_per_task], i + windows_per_task >= len(starts), duration
+
+    pending = deque()
+    timeline = []
+    task_iter = tasks()
+    max_in_flight = max(1, workers * 2)
+
+    def submit_next():
+        for path, starts, last, extra in task_iter:
+            if starts is None:
+                pending.append((path, None, last, extra))
+                continue
+            if pool is None:
+                result = score_windows(path, starts, window)
+            else:
+                result = pool.submit(_score_task, (path, starts, window))
+            pending.append((path, result, last, extra))
+            return True
+        return False
+
+    while len(pending) < max_in_flight and submit_next():
+        pass
+    while pending:
+        path, result, last, extra = pending.popleft()
+        if result is None:
+            yield {'file': path, 'error': extra}
+            continue
+        try:
+            records = result if pool is None else result.result()
+        except Exception as e:
+            logger.error(f"Scoring {path} failed: {str(e)}")
+            records = []
+            yield {'file': path, 'error': str(e)}
+        for record in records:
+            record = {'file': path, 'window': len(timeline), **record}
+            timeline.append(record)
+            yield record
+        if last:
+            yield _summary(path, extra, timeline)
+            timeline = []
+        while len(pending) < max_in_flight and submit_next():
+            pass
@@ -1,66 +1,219 @@
 # detection/utils/panic_detection.py
-import torch
-import librosa
+import os
 import numpy as np
 from django.conf import settings
 import logging
+from .features import shared_frontend
+from .feature_spec import FeatureSpec, FeatureSpecError, mfcc_frames_spec
+from .clip_stats import ClipStatsFrontend
+from .execution import execution_plan
 
 logger = logging.getLogger(__name__)
 
+BACKENDS = ('torch', 'torchscript', 'onnx', 'onnx-int8')
+# torch and onnxruntime are imported on first model load, not at import time, so
+# importing this module (and the consumers) stays cheap
+TORCH_BACKENDS = ('torch', 'torchscript')
+
+
+def panic_model_path(config, backend):
+    """Artifact path in MODEL_CONFIG['PANIC'] for the given backend."""
+    return {
+        'torch': config['PATH'],
+        'torchscript': config['TORCHSCRIPT_PATH'],
+        'onnx': config['ONNX_PATH'],
+        'onnx-int8': config['ONNX_INT8_PATH'],
+    }[backend]
+
+
+def load_panic_spec(config, frontend):
+    """
+    The feature spec the panic model was trained with, from MODEL_CONFIG['PANIC']['SPEC_PATH'].
+    Without one, the original contract (raw 40-MFCC frames into a PanicClassifier) is assumed.
+    """
+    path = config.get('SPEC_PATH')
+    if not path:
+        return mfcc_frames_spec(frontend)
+    if not os.path.exists(path):
+        raise FeatureSpecError(f"No panic feature spec at {path}")
+    return FeatureSpec.load(path)
+
+
 class PanicDetector:
-    def __init__(self, model_path):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = self._load_model(model_path)
-        self.sample_rate = 16000
-        self.model.eval()
-        
+    """
+    Panic scoring for whichever model the feature spec describes.
+
+    The spec is checked when the model loads: the front-end parameters, the
+    architecture the weights are loaded into, the spec digest embedded in
+    exported artifacts, the output width of a probe forward pass, and that a
+    silent window scores below the threshold. A model that does not fit its
+    spec fails here instead of scoring garbage.
+    """
+
+    def __init__(self, model_path, frontend=None, backend='torch', threshold=None, spec=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown panic backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self.frontend = frontend or shared_frontend()
+        self.sample_rate = self.frontend.sample_rate
+        config = settings.MODEL_CONFIG['PANIC']
+        self.threshold = config['THRESHOLD'] if threshold is None else threshold
+        self.spec = spec or load_panic_spec(config, self.frontend)
+        self.spec.check_frontend(self.frontend)
+        self._check_features()
+        self.clip_frontend = None
+        if self.spec.kind == 'clip_stats':
+            self.clip_frontend = ClipStatsFrontend.from_spec(self.spec, self.sample_rate)
+
+        if backend in TORCH_BACKENDS:
+            import torch
+            execution_plan().apply_torch()
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self.model = self._load_model(model_path)
+            self.model.eval()
+        else:
+            self.session = self._load_session(model_path)
+        self._check_model(model_path)
+        self._check_silence(model_path)
+
+    def _check_features(self):
+        """clip_stats columns must be exactly what extract_features computes, in the same order."""
+        if self.spec.kind != 'clip_stats':
+            return
+        from ..training.features import feature_names
+        expected = feature_names(self.spec.frontend['n_mfcc'])
+        if self.spec.features != expected:
+            raise FeatureSpecError(
+                f"Feature spec lists {self.spec.input_dim} features, but this server computes {len(expected)}: "
+                f"{', '.join(expected[:3])}, ..."
+            )
+
+    def _check_digest(self, model_path, digest):
+        if not digest:
+            logger.warning(f"{model_path} does not record its feature spec; re-export it to have it checked")
+        elif digest != self.spec.digest():
+            raise FeatureSpecError(
+                f"{model_path} was exported for feature spec {digest}, but the configured spec is {self.spec.digest()}"
+            )
+
     def _load_model(self, model_path):
-        # Define model architecture (must match training)
-        class PanicClassifier(torch.nn.Module):
-            def __init__(self):
-                super().__init__()
-                self.lstm = torch.nn.LSTM(40, 128, bidirectional=True)
-                self.classifier = torch.nn.Sequential(
-                    torch.nn.Linear(256, 64),
-                    torch.nn.ReLU(),
-                    torch.nn.Linear(64, 2)
-                )
-            
-            def forward(self, x):
-                x, _ = self.lstm(x)
-                return self.classifier(x[:, -1, :])
-        
-        model = PanicClassifier()
-        model.load_state_dict(torch.load(model_path, map_location=self.device))
+        import torch
+        if self.backend == 'torchscript':
+            # Serialized graph and weights: no module rebuild, no pickle
+            extra_files = {'feature_spec_digest': ''}
+            model = torch.jit.load(model_path, map_location=self.device, _extra_files=extra_files)
+            digest = extra_files['feature_spec_digest']
+            self._check_digest(model_path, digest.decode() if isinstance(digest, bytes) else digest)
+            return model
+
+        from .panic_model import ARCHITECTURES
+        if self.spec.model not in ARCHITECTURES:
+            raise FeatureSpecError(f"Unknown panic architecture '{self.spec.model}', expected one of {tuple(ARCHITECTURES)}")
+        model = ARCHITECTURES[self.spec.model]()
+        try:
+            # Weights are memory-mapped rather than read and unpickled up front
+            state = torch.load(model_path, map_location=self.device, weights_only=True, mmap=True)
+        except RuntimeError:
+            # Checkpoints saved in the legacy (pre-zipfile) format cannot be memory-mapped
+            state = torch.load(model_path, map_location=self.device, weights_only=True)
+        try:
+            model.load_state_dict(state)
+        except RuntimeError as e:
+            raise FeatureSpecError(f"{model_path} is not a {self.spec.model} checkpoint: {str(e)}")
         return model.to(self.device)
 
-    def extract_features(self, audio_bytes):
-        """Match features used during training"""
-        audio = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32)
-        return librosa.feature.mfcc(
-            y=audio,
-            sr=self.sample_rate,
-            n_mfcc=40,
-            n_fft=512,
-            hop_length=160
+    def _load_session(self, model_path):
+        import onnxruntime as ort
+        session = ort.InferenceSession(
+            model_path,
+            sess_options=execution_plan().session_options(),
+            providers=['CPUExecutionProvider']
         )
+        self.input_name = session.get_inputs()[0].name
+        self.output_name = session.get_outputs()[0].name
+        self._check_digest(model_path, session.get_modelmeta().custom_metadata_map.get('feature_spec_digest'))
+        return session
 
-    async def detect(self, audio_bytes):
+    def _check_model(self, model_path):
+        """Probe forward pass: the model must accept spec-shaped input and return the spec's output width."""
+        probe = np.zeros(self.spec.input_shape(), dtype=np.float32)
         try:
+            outputs = self._forward(probe)
+        except Exception as e:
+            raise FeatureSpecError(f"{model_path} rejects {probe.shape} input from the feature spec: {str(e)}")
+        if outputs.shape != (1, self.spec.output_width):
+            raise FeatureSpecError(
+                f"{model_path} returns {outputs.shape[1:]} outputs, the feature spec expects {self.spec.output_width}"
+            )
+
+    def _check_silence(self, model_path):
+        """A spec and model that score a silent window as panic would alert on every quiet room."""
+        silence = np.zeros(settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE'], dtype=np.int16)
+        prob = float(self._panic_probabilities(self.model_inputs(self.frontend.features_for_batch([silence])))[0])
+        if not prob < self.threshold:  # NaN fails too
+            raise FeatureSpecError(
+                f"{model_path} scores silence as panic ({prob:.3f}, threshold {self.threshold}) with feature spec "
+                f"{self.spec.digest()}; the model was not trained on these features"
+            )
+
+    def _forward(self, batch):
+        """Raw model outputs for a batch of model inputs, as a NumPy array."""
+        if self.backend in TORCH_BACKENDS:
+            import torch
             with torch.no_grad():
-                features = self.extract_features(audio_bytes)
-                tensor = torch.Tensor(features.T).unsqueeze(0).to(self.device)
-                
-                if tensor.shape[1] < 96:  # Pad if needed
-                    tensor = torch.nn.functional.pad(tensor, (0,0,0,96-tensor.shape[1]))
-                
-                outputs = self.model(tensor)
-                probs = torch.nn.functional.softmax(outputs, dim=1)
-                return {
-                    "panic": probs[0][1].item() > 0.65,  # Threshold
-                    "confidence": probs[0][1].item(),
-                    "features": features.shape
-                }
+                return self.model(torch.from_numpy(batch).to(self.device)).cpu().numpy()
+        return self.session.run([self.output_name], {self.input_name: batch})[0]
+
+    def _panic_probabilities(self, batch):
+        """Panic-class probability for each row of a model input batch."""
+        outputs = self._forward(batch)
+        if self.spec.output == 'sigmoid':
+            return 1.0 / (1.0 + np.exp(-outputs[:, 0]))
+        outputs = outputs - outputs.max(axis=1, keepdims=True)
+        exp = np.exp(outputs)
+        return exp[:, 1] / exp.sum(axis=1)
+
+    def warmup(self):
+        """Scores a second of faint noise end to end, so imports, JIT compilation and allocations happen before real traffic."""
+        noise = np.random.default_rng(0).integers(-64, 64, self.sample_rate).astype(np.int16)
+        self._panic_probabilities(self.model_inputs(self.frontend.features_for_batch([noise])))
+
+    def model_inputs(self, features):
+        """Scaled model input batch for a list of ChunkFeatures, per the feature spec."""
+        if self.spec.kind == 'clip_stats':
+            batch = np.empty(self.spec.input_shape(len(features)), dtype=np.float32)
+            # Windows of equal length (all of them, when streaming) share one batched pass
+            by_length = {}
+            for row, f in enumerate(features):
+                if f.audio is None:
+                    raise FeatureSpecError("clip_stats features need the window's audio, but none was kept")
+                by_length.setdefault(len(f.audio), []).append(row)
+            for rows in by_length.values():
+                batch[rows] = self.clip_frontend.compute_batch(np.stack([features[row].audio for row in rows]))
+        else:
+            frames = max(self.spec.frontend['min_frames'], max(f.frames for f in features))  # Pad if needed
+            batch = np.zeros((len(features), frames, self.spec.input_dim), dtype=np.float32)
+            for row, f in enumerate(features):
+                batch[row, :f.frames] = f.panic_view()
+        return self.spec.apply(batch, out=batch)
+
+    def extract_features(self, audio_bytes):
+        """Model input row for one chunk, exactly as training computed and scaled it"""
+        return self.model_inputs([self.frontend.features_for(audio_bytes)])[0]
+
+    def detect(self, audio_bytes):
+        return self.detect_batch([audio_bytes])[0]
+
+    def detect_batch(self, audio_chunks):
+        """Scores several chunks in one forward pass (MFCC frames are padded to a common count)."""
+        try:
+            features = self.frontend.features_for_batch(audio_chunks)
+            probs = self._panic_probabilities(self.model_inputs(features))
+            return [{
+                "panic": bool(prob > self.threshold),
+                "confidence": float(prob),
+                "features": f.mfcc.shape if self.spec.kind == 'mfcc_frames' else (self.spec.input_dim,)
+            } for prob, f in zip(probs, features)]
         except Exception as e:
             logger.error(f"Panic detection failed: {str(e)}")
-            return {"panic": False, "error": str(e)}
\ No newline at end of file
+            return [{"panic": False, "error": str(e)} for _ in audio_chunks]
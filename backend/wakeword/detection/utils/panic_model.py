@@ -0,0 +1,55 @@
+# detection/utils/panic_model.py
+import torch
+
+
+class PanicClassifier(torch.nn.Module):
+    # Model architecture (must match training)
+    def __init__(self):
+        super().__init__()
+        self.lstm = torch.nn.LSTM(40, 128, bidirectional=True, batch_first=True)
+        self.classifier = torch.nn.Sequential(
+            torch.nn.Linear(256, 64),
+            torch.nn.ReLU(),
+            torch.nn.Linear(64, 2)
+        )
+
+    def forward(self, x):
+        x, _ = self.lstm(x)
+        return self.classifier(x[:, -1, :])
+
+
+class CalmaAlertModel(torch.nn.Module):
+    """
+    The notebook's classifier over one scaled clip_stats vector
+    (detection/training/features.py); returns one logit per row.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.conv1 = torch.nn.Conv1d(1, 64, kernel_size=5, padding=2)
+        self.bn1 = torch.nn.BatchNorm1d(64)
+        self.conv2 = torch.nn.Conv1d(64, 128, kernel_size=3, padding=1)
+        self.bn2 = torch.nn.BatchNorm1d(128)
+        self.pool = torch.nn.MaxPool1d(2)
+        self.lstm1 = torch.nn.LSTM(128, 64, bidirectional=True, batch_first=True)
+        self.lstm2 = torch.nn.LSTM(128, 32, bidirectional=True, batch_first=True)
+        self.fc1 = torch.nn.Linear(64, 128)
+        self.fc2 = torch.nn.Linear(128, 64)
+        self.out = torch.nn.Linear(64, 1)
+
+    def forward(self, x):
+        # Dropout layers are omitted: they hold no weights and are identity at inference
+        x = self.pool(torch.relu(self.bn1(self.conv1(x.unsqueeze(1)))))
+        x = self.pool(torch.relu(self.bn2(self.conv2(x))))
+        x, _ = self.lstm1(x.transpose(1, 2))
+        x, _ = self.lstm2(x)
+        x = torch.relu(self.fc1(x[:, -1, :]))
+        x = torch.relu(self.fc2(x))
+        return self.out(x)
+
+
+# Feature spec 'model' names to architectures
+ARCHITECTURES = {
+    'PanicClassifier': PanicClassifier,
+    'CalmaAlertModel': CalmaAlertModel,
+}
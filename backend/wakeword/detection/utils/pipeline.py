@@ -0,0 +1,128 @@
+# detection/utils/pipeline.py
+import time
+import asyncio
+import logging
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+class DetectionPipeline:
+    """
+    Scores one feature window with both models at once.
+
+    Wakeword and panic inference are submitted together and awaited with
+    asyncio.gather, so a window costs the slower of the two models rather
+    than their sum. In cascade mode a near-free loudness score taken from
+    the MFCCs decides first whether the panic LSTM runs at all. run_many()
+    does the same for a list of windows, with one model call per model.
+    Without a wakeword batcher (the model is disabled) wakeword scores are None.
+    """
+
+    def __init__(self, wakeword_batcher, panic_batcher, cascade=False, cascade_min_level_dbfs=-35.0,
+                 wakeword_threshold=0.5):
+        self.wakeword_batcher = wakeword_batcher
+        self.wakeword_threshold = wakeword_threshold
+        self.panic_batcher = panic_batcher
+        self.cascade = cascade
+        self.cascade_min_level_dbfs = cascade_min_level_dbfs
+
+    @classmethod
+    def from_settings(cls, wakeword_batcher, panic_batcher, config):
+        return cls(
+            wakeword_batcher,
+            panic_batcher,
+            cascade=config['ENABLED'],
+            cascade_min_level_dbfs=config['MIN_LEVEL_DBFS'],
+            wakeword_threshold=settings.MODEL_CONFIG['WAKEWORD']['THRESHOLD']
+        )
+
+    async def _timed(self, batcher, features, timings, key):
+        start = time.perf_counter()
+        result = await batcher.submit(features)
+        elapsed = time.perf_counter() - start
+        timings[key] = round(elapsed * 1000, 3)
+        # Includes time waiting to join a batch; calmalert_inference_seconds has the model call alone
+        metrics.STAGE_SECONDS.observe(elapsed, stage=key)
+        return result
+
+    async def _timed_many(self, batcher, windows, timings, key):
+        start = time.perf_counter()
+        results = await batcher.submit_many(windows)
+        elapsed = time.perf_counter() - start
+        timings[key] = round(elapsed * 1000, 3)
+        metrics.STAGE_SECONDS.observe(elapsed, stage=key)
+        return results
+
+    async def run(self, features):
+        """
+        Returns {'wakeword': bool, 'wakeword_score': float or None, 'panic': dict,
+        'timings_ms': {...}} for one window. The wakeword batcher yields raw scores;
+        the bool is this window's unsmoothed decision.
+        """
+        start = time.perf_counter()
+        timings = {}
+
+        run_panic = True
+        if self.cascade:
+            stage_start = time.perf_counter()
+            level = features.peak_level_dbfs()
+            run_panic = level >= self.cascade_min_level_dbfs
+            timings['cascade'] = _elapsed_ms(stage_start)
+
+        tasks = []
+        if self.wakeword_batcher is not None:
+            tasks.append(self._timed(self.wakeword_batcher, features, timings, 'wakeword'))
+        if run_panic:
+            tasks.append(self._timed(self.panic_batcher, features, timings, 'panic'))
+        results = await asyncio.gather(*tasks)
+
+        wake_score = results[0] if self.wakeword_batcher is not None else None
+        wake_detected = wake_score is not None and wake_score > self.wakeword_threshold
+        if run_panic:
+            panic_result = results[-1]
+        else:
+            panic_result = {'panic': False, 'confidence': 0.0, 'skipped': True}
+
+        timings['total'] = _elapsed_ms(start)
+        return {'wakeword': wake_detected, 'wakeword_score': wake_score, 'panic': panic_result, 'timings_ms': timings}
+
+    async def run_many(self, windows):
+        """
+        Scores a list of windows with one batched call per model. Returns
+        (results, timings_ms): results as run() gives them, without
+        'timings_ms', and one set of stage timings for the whole batch.
+        """
+        start = time.perf_counter()
+        timings = {}
+
+        panic_rows = list(range(len(windows)))
+        if self.cascade:
+            stage_start = time.perf_counter()
+            panic_rows = [i for i, features in enumerate(windows)
+                          if features.peak_level_dbfs() >= self.cascade_min_level_dbfs]
+            timings['cascade'] = _elapsed_ms(stage_start)
+
+        panic_task = self._timed_many(self.panic_batcher, [windows[i] for i in panic_rows], timings, 'panic')
+        if self.wakeword_batcher is not None:
+            wake_scores, panic_results = await asyncio.gather(
+                self._timed_many(self.wakeword_batcher, windows, timings, 'wakeword'), panic_task
+            )
+        else:
+            wake_scores, panic_results = [None] * len(windows), await panic_task
+
+        panic_by_row = dict(zip(panic_rows, panic_results))
+        results = []
+        for i, wake_score in enumerate(wake_scores):
+            results.append({
+                'wakeword': wake_score is not None and wake_score > self.wakeword_threshold,
+                'wakeword_score': wake_score,
+                'panic': panic_by_row.get(i, {'panic': False, 'confidence': 0.0, 'skipped': True}),
+            })
+        timings['total'] = _elapsed_ms(start)
+        return results, timings
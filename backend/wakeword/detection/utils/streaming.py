@@ -0,0 +1,124 @@
+# detection/utils/streaming.py
+import numpy as np
+from .features import ChunkFeatures
+
+
+class StreamingState:
+    """
+    Per-connection audio context for continuous detection.
+
+    Keeps a ring buffer of the last `window_samples` PCM samples and a rolling
+    log-mel frame buffer covering the same window. Each push only runs the
+    STFT and mel projection for the frames completed by the new samples; the
+    window's MFCC matrix is then one small DCT over the rolling buffer. A
+    window is emitted every `hop_samples`, so a wakeword that straddles two
+    client chunks is still seen whole.
+
+    A frame is only computed once all of its samples have arrived, never
+    with the zero padding a centered one-shot STFT puts after the clip. So
+    a window lags the audio received so far by `lag_samples`: ceil(n_fft / 2
+    / hop_length) frames, 2 frames or 320 samples with the default
+    front-end. It matches FeatureFrontend.compute() on the window_samples
+    samples ending `lag_samples` before the newest one, apart from the
+    edge frames, which here hold real audio instead of padding.
+    window_audio() is not delayed.
+    """
+
+    def __init__(self, frontend, window_samples, hop_samples):
+        self.frontend = frontend
+        self.window_samples = int(window_samples)
+        self.hop_samples = max(frontend.hop_length, int(hop_samples))
+        # Same frame count a centered STFT gives for a clip of window_samples
+        self.window_frames = 1 + self.window_samples // frontend.hop_length
+        # Frames still waiting for samples past the newest one (see the class docstring)
+        self.lag_samples = -(-(frontend.n_fft // 2) // frontend.hop_length) * frontend.hop_length
+
+        self.ring = np.zeros(self.window_samples, dtype=np.int16)
+        self._ring_pos = 0
+        self.total_samples = 0
+
+        floor = 10.0 * np.log10(frontend.amin)
+        self.log_mel = np.full((frontend.n_mels, self.window_frames), floor, dtype=np.float32)
+        self._frame_pos = 0
+        self.total_frames = 0
+
+        # Samples not yet covered by a full frame, starting at the next frame's first sample.
+        # Starts with n_fft // 2 zeros, matching the centered padding of a one-shot STFT.
+        self._pending = np.zeros(frontend.n_fft // 2, dtype=np.float32)
+        self._since_window = 0
+
+    def _write_ring(self, samples):
+        n = len(samples)
+        if n >= self.window_samples:
+            self.ring[:] = samples[-self.window_samples:]
+            self._ring_pos = 0
+            return
+        end = self._ring_pos + n
+        if end <= self.window_samples:
+            self.ring[self._ring_pos:end] = samples
+        else:
+            split = self.window_samples - self._ring_pos
+            self.ring[self._ring_pos:] = samples[:split]
+            self.ring[:n - split] = samples[split:]
+        self._ring_pos = end % self.window_samples
+
+    def _advance_frames(self, samples):
+        """Runs STFT + mel only on the frames completed by `samples`."""
+        n_fft, hop = self.frontend.n_fft, self.frontend.hop_length
+        pending = np.concatenate([self._pending, samples.astype(np.float32)])
+        if len(pending) < n_fft:
+            self._pending = pending
+            return
+
+        count = (len(pending) - n_fft) // hop + 1
+        frames = np.lib.stride_tricks.sliding_window_view(pending, n_fft)[::hop][:count]
+        log_mel = self.frontend.log_mel(self.frontend.power_frames(frames))
+        self._pending = pending[count * hop:]
+
+        # Only the newest window_frames columns can survive in the rolling buffer
+        log_mel = log_mel[:, -self.window_frames:]
+        count = log_mel.shape[1]
+        end = self._frame_pos + count
+        if end <= self.window_frames:
+            self.log_mel[:, self._frame_pos:end] = log_mel
+        else:
+            split = self.window_frames - self._frame_pos
+            self.log_mel[:, self._frame_pos:] = log_mel[:, :split]
+            self.log_mel[:, :count - split] = log_mel[:, split:]
+        self._frame_pos = end % self.window_frames
+        self.total_frames += count
+
+    def window_audio(self):
+        """The last `window_samples` samples in chronological order."""
+        return np.concatenate([self.ring[self._ring_pos:], self.ring[:self._ring_pos]])
+
+    def window_features(self):
+        """ChunkFeatures for the current window, built from the rolling log-mel buffer."""
+        log_mel = np.concatenate([self.log_mel[:, self._frame_pos:], self.log_mel[:, :self._frame_pos]], axis=1)
+        return ChunkFeatures(self.frontend.mfcc_from_log_mel(log_mel), self.frontend.n_mels, self.window_audio())
+
+    def push(self, samples):
+        """
+        Appends int16 samples and returns the ChunkFeatures of every window
+        that became due, oldest first. Nothing is emitted until the first
+        full window has been received.
+        """
+        samples = np.asarray(samples, dtype=np.int16)
+        windows = []
+        offset = 0
+        while offset < len(samples):
+            # Feed at most up to the next hop boundary so each due window is captured in place
+            step = min(len(samples) - offset, self.hop_samples - self._since_window)
+            piece = samples[offset:offset + step]
+            offset += step
+
+            self._write_ring(piece)
+            self._advance_frames(piece)
+            self.total_samples += step
+            self._since_window += step
+
+            if self._since_window >= self.hop_samples:
+                self._since_window = 0
+                if self.total_samples >= self.window_samples:
+                    windows.append(self.window_features())
+        return windows
@@ -0,0 +1,57 @@
+# detection/utils/stub_models.py
+import time
+import numpy as np
+from .features import shared_frontend
+
+
+class StubDetector:
+    """
+    Stand-in for a detector that needs no model file, for benchmarks run offline.
+
+    Features are still computed through the shared front-end, so only the
+    model call itself is replaced, by a sleep of `latency_ms` per batch plus
+    `per_item_ms` per chunk.
+    """
+
+    backend = 'stub'
+
+    def __init__(self, latency_ms=5.0, per_item_ms=0.5, frontend=None):
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.frontend = frontend or shared_frontend()
+
+    def _simulate(self, count):
+        time.sleep((self.latency_ms + self.per_item_ms * count) / 1000)
+
+    def warmup(self):
+        self._simulate(1)
+
+    def detect(self, audio_bytes):
+        return self.detect_batch([audio_bytes])[0]
+
+
+class StubWakeWordDetector(StubDetector):
+    """Reports a wakeword for every chunk, so each scored window produces a response."""
+
+    threshold = 0.5
+
+    def score_batch(self, audio_chunks):
+        self.frontend.features_for_batch(audio_chunks)
+        self._simulate(len(audio_chunks))
+        return [1.0 for _ in audio_chunks]
+
+    def detect_batch(self, audio_chunks):
+        return [score > self.threshold for score in self.score_batch(audio_chunks)]
+
+
+class StubPanicDetector(StubDetector):
+    """Never reports panic; confidence follows the window's loudness so it is not constant."""
+
+    def detect_batch(self, audio_chunks):
+        features = self.frontend.features_for_batch(audio_chunks)
+        self._simulate(len(audio_chunks))
+        return [{
+            "panic": False,
+            "confidence": float(np.clip((f.peak_level_dbfs() + 60) / 60, 0.0, 1.0)),
+            "features": f.mfcc.shape
+        } for f in features]
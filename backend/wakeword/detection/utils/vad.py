@@ -0,0 +1,108 @@
+# detection/utils/vad.py
+import threading
+import logging
+import numpy as np
+from . import metrics
+
+try:
+    import webrtcvad
+except ImportError:  # Fall back to the energy gate alone
+    webrtcvad = None
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceActivityGate:
+    """
+    Per-stream speech gate in front of both detectors.
+
+    A chunk first has to clear an RMS energy floor, then webrtcvad must mark
+    at least `speech_ratio` of its frames as voiced. After a speech chunk the
+    gate stays open for `hangover` more chunks so trailing windows that still
+    contain the utterance are scored.
+    """
+
+    _totals_lock = threading.Lock()
+    totals = {'processed': 0, 'skipped': 0}
+
+    def __init__(self, sample_rate=16000, aggressiveness=2, frame_ms=30, energy_threshold_dbfs=-50.0,
+                 speech_ratio=0.1, hangover=2):
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.energy_threshold = 32768.0 * 10 ** (energy_threshold_dbfs / 20)
+        self.speech_ratio = speech_ratio
+        self.hangover = hangover
+        self.vad = webrtcvad.Vad(aggressiveness) if webrtcvad is not None else None
+
+        self._hangover_left = 0
+        self.processed = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_settings(cls, config, sample_rate=16000):
+        return cls(
+            sample_rate=sample_rate,
+            aggressiveness=config['AGGRESSIVENESS'],
+            frame_ms=config['FRAME_MS'],
+            energy_threshold_dbfs=config['ENERGY_THRESHOLD_DBFS'],
+            speech_ratio=config['SPEECH_RATIO'],
+            hangover=config['HANGOVER_CHUNKS']
+        )
+
+    def has_speech(self, samples):
+        """Stateless speech decision for one chunk; ignores and does not touch the hangover."""
+        if samples.size == 0:
+            return False
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float64)))
+        if rms < self.energy_threshold:
+            return False
+        if self.vad is None:
+            return True
+
+        count = len(samples) // self.frame_samples
+        if count == 0:
+            return True
+        needed = max(1, int(np.ceil(count * self.speech_ratio)))
+        pcm = np.ascontiguousarray(samples[:count * self.frame_samples], dtype='<i2').tobytes()
+        step = self.frame_samples * 2
+        voiced = 0
+        for i in range(count):
+            if self.vad.is_speech(pcm[i * step:(i + 1) * step], self.sample_rate):
+                voiced += 1
+                if voiced >= needed:
+                    return True
+        return False
+
+    def check(self, samples, units=1):
+        """
+        Returns True if inference should run for this chunk. `units` is the
+        number of model invocations the chunk stands for (streaming windows),
+        so the counters reflect skipped inference rather than received chunks.
+        A chunk with no due windows only arms the hangover.
+        """
+        if self.has_speech(samples):
+            self._hangover_left = self.hangover
+            allowed = True
+        elif units == 0:
+            return False
+        elif self._hangover_left > 0:
+            self._hangover_left -= 1
+            allowed = True
+        else:
+            allowed = False
+
+        if units:
+            key = 'processed' if allowed else 'skipped'
+            setattr(self, key, getattr(self, key) + units)
+            with self._totals_lock:
+                VoiceActivityGate.totals[key] += units
+        return allowed
+
+    def stats(self):
+        return {'processed': self.processed, 'skipped': self.skipped}
+
+
+metrics.Counter(
+    'calmalert_vad_windows_total', 'Windows scored or skipped by the voice-activity gate.', ('decision',),
+    function=lambda: [({'decision': key}, value) for key, value in dict(VoiceActivityGate.totals).items()]
+)
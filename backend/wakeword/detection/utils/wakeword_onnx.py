@@ -1,62 +1,133 @@
 import numpy as np
-import onnxruntime as ort
-import librosa
 from django.conf import settings
 import logging
+from .features import shared_frontend
+from .execution import execution_plan
 
 logger = logging.getLogger(__name__)
 
+class IncompatibleModelError(ValueError):
+    """The model's input shape cannot be fed from the shared MFCC front-end."""
+
+
 class WakeWordDetector:
-    def __init__(self, model_path):
+    def __init__(self, model_path, frontend=None, threshold=None, chunk_size=None):
+        import onnxruntime as ort  # Deferred so importing the consumers does not load it
         self.session = ort.InferenceSession(
             model_path,
+            sess_options=execution_plan().session_options(),
             providers=['CUDAExecutionProvider', 'CPUExecutionProvider']
         )
         self.input_name = self.session.get_inputs()[0].name
         self.output_name = self.session.get_outputs()[0].name
         self.sample_rate = 16000  # Must match training config
         self.frame_length = 1.5  # Seconds of audio needed for prediction
+        self.frontend = frontend or shared_frontend()
+        self.backend = 'onnx'
+        self.threshold = settings.MODEL_CONFIG['WAKEWORD']['THRESHOLD'] if threshold is None else threshold
+        self.chunk_size = settings.MODEL_CONFIG['WAKEWORD']['CHUNK_SIZE'] if chunk_size is None else chunk_size
+        # Fixed dimensions of the model's (batch, frames, features) input, None where dynamic
+        self.batch_size, self.input_frames, self.input_features = self._input_layout(model_path, self.chunk_size)
+
+    def _input_layout(self, model_path, chunk_size):
+        """
+        (batch, frames, features) the model takes, with None for dynamic
+        dimensions. Raises IncompatibleModelError when a fixed dimension
+        cannot be fed from the front-end's (frames, n_mfcc) windows, so a
+        wrong model fails once at load instead of on every batch.
+        """
+        shape = self.session.get_inputs()[0].shape
+        fixed = [dim if isinstance(dim, int) else None for dim in shape]
+        frames = self.frontend.frames_for(chunk_size)
+        if len(fixed) != 3:
+            raise IncompatibleModelError(
+                f"{model_path} takes input of shape {shape}; expected (batch, frames, features)"
+            )
+        batch, model_frames, model_features = fixed
+        if model_frames is not None and model_frames != frames:
+            raise IncompatibleModelError(
+                f"{model_path} takes {model_frames} frames per window, but a {chunk_size}-sample chunk "
+                f"gives {frames} MFCC frames (input shape {shape})"
+            )
+        if model_features is not None and model_features < self.frontend.n_mfcc:
+            raise IncompatibleModelError(
+                f"{model_path} takes {model_features} features per frame, fewer than the "
+                f"front-end's {self.frontend.n_mfcc} MFCCs (input shape {shape})"
+            )
+        return batch, model_frames, model_features
+
+    def warmup(self):
+        """Runs the session once on a zero window so lazy allocations happen before real traffic."""
+        frames = self.input_frames or self.frontend.frames_for(self.chunk_size)
+        features = self.input_features or self.frontend.n_mfcc
+        self._run(np.zeros((1, frames, features), dtype=np.float32))
+
+    def _run(self, batch):
+        """Scores a (rows, frames, features) batch, split and padded to the model's fixed batch size if it has one."""
+        if self.batch_size is None:
+            return self.session.run([self.output_name], {self.input_name: batch})[0][:, 0]
+        scores = []
+        for start in range(0, len(batch), self.batch_size):
+            part = batch[start:start + self.batch_size]
+            rows = len(part)
+            if rows < self.batch_size:
+                part = np.concatenate([part, np.zeros((self.batch_size - rows,) + part.shape[1:], dtype=part.dtype)])
+            scores.append(self.session.run([self.output_name], {self.input_name: part})[0][:rows, 0])
+        return np.concatenate(scores)
 
     def preprocess_audio(self, audio_data):
-        """Convert raw audio bytes to MFCC features."""
+        """Convert raw audio bytes (or precomputed ChunkFeatures) to MFCC features."""
         try:
-            # Convert bytes to numpy array
-            audio = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-            
-            # Extract MFCC features (match training parameters)
-            mfcc = librosa.feature.mfcc(
-                y=audio,
-                sr=self.sample_rate,
-                n_mfcc=40,
-                n_fft=512,
-                hop_length=160
-            )
-            
-            # Normalize and reshape for model input
-            mfcc = (mfcc - np.mean(mfcc)) / np.std(mfcc)
-            return mfcc.T.astype(np.float32)[np.newaxis, ...]  # Add batch dimension
+            # MFCC matrix is shared with the panic detector; this is its normalized view
+            features = self.frontend.features_for(audio_data)
+            return features.wakeword_view()[np.newaxis, ...]  # Add batch dimension
             
         except Exception as e:
             logger.error(f"Audio preprocessing failed: {str(e)}")
             return None
 
+    def _prepare(self, audio_chunk):
+        """Features for one chunk as a (frames, features) array, or None if preprocessing failed."""
+        features = self.preprocess_audio(audio_chunk)
+        if features is None:
+            return None
+
+        # Zero-pad the MFCCs up to a fixed feature width
+        if self.input_features is not None and features.shape[2] < self.input_features:
+            features = np.pad(features, ((0, 0), (0, 0), (0, self.input_features - features.shape[2])))
+        return features[0]
+
     def detect(self, audio_chunk):
         """Run inference on audio chunk."""
+        return self.detect_batch([audio_chunk])[0]
+
+    def detect_batch(self, audio_chunks):
+        """Run inference on several chunks, padded to a common frame count, in one session call."""
+        scores = self.score_batch(audio_chunks)
+        return [score is not None and score > self.threshold for score in scores]
+
+    def score_batch(self, audio_chunks):
+        """Raw model scores for several chunks; None where preprocessing or inference failed."""
+        results = [None] * len(audio_chunks)
         try:
-            features = self.preprocess_audio(audio_chunk)
-            if features is None:
-                return False
-                
-            # Pad if insufficient frames
-            if features.shape[2] < 96:
-                features = np.pad(features, ((0, 0), (0, 0), (0, 96 - features.shape[2])))
-                
-            outputs = self.session.run(
-                [self.output_name],
-                {self.input_name: features}
-            )
-            return outputs[0][0][0] > 0.5  # Threshold can be adjusted
-            
+            # Raw chunks in the batch get their MFCCs in one vectorized pass
+            prepared = [self._prepare(chunk) for chunk in self.frontend.features_for_batch(audio_chunks)]
+            valid = [i for i, features in enumerate(prepared) if features is not None]
+            if not valid:
+                return results
+
+            # Shorter chunks are zero-padded, and with a fixed frame count longer ones keep their latest frames
+            frames = self.input_frames or max(prepared[i].shape[0] for i in valid)
+            batch = np.zeros((len(valid), frames, prepared[valid[0]].shape[1]), dtype=np.float32)
+            for row, i in enumerate(valid):
+                window = prepared[i][-frames:]
+                batch[row, :window.shape[0]] = window
+
+            scores = self._run(batch)
+            for row, i in enumerate(valid):
+                results[i] = float(scores[row])
+            return results
+
         except Exception as e:
             logger.error(f"Inference failed: {str(e)}")
-            return False
+            return results
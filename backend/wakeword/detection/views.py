@@ -2,68 +2,331 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
-import base64
+import os
 import json
+import time
+import asyncio
+import tempfile
 from django.conf import settings
-from .utils import wakeword_onnx, panic_detection
+from django.core.exceptions import SuspiciousOperation
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .utils.model_registry import registry
+from .utils.features import shared_frontend
+from .utils.pipeline import DetectionPipeline
+from .utils.audio_protocol import decode_file, decode_json, AudioProtocolError
+from .utils.vad import VoiceActivityGate
+from .utils import backpressure, capture, decisions, metrics
+from .utils.offline_scoring import score_recordings
+from .workers import remote_stats, channel_queue_depth
+from . import alerts, middleware, persistence
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 
-class AudioUploadView(APIView):
-    def post(self, request):
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def _in_executor(timings, stage, func, *args):
+    """Runs a blocking step on the shared inference executor and records how long it took."""
+    start = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(registry.executor(), func, *args)
+    timings[stage] = _elapsed_ms(start)
+    metrics.STAGE_SECONDS.observe(timings[stage] / 1000, stage=stage)
+    return result
+
+
+async def _pipeline():
+    # The batchers are shared, so REST windows join the same model calls as WebSocket windows.
+    # A model not loaded yet is loaded on the executor rather than in the event loop
+    return DetectionPipeline.from_settings(
+        await registry.load_batcher('wakeword'), await registry.load_batcher('panic'),
+        settings.INFERENCE_CONFIG['CASCADE']
+    )
+
+
+def _check_clip(frame, name):
+    max_samples = int(settings.REST_SCORING_CONFIG['MAX_CLIP_SECONDS'] * settings.MODEL_CONFIG['WAKEWORD']['SAMPLE_RATE'])
+    if not len(frame.samples):
+        raise AudioProtocolError(f"{name} has no audio")
+    if len(frame.samples) > max_samples:
+        raise AudioProtocolError(f"{name} is longer than {settings.REST_SCORING_CONFIG['MAX_CLIP_SECONDS']} s; use /api/audio/score/")
+    return frame
+
+
+def _read_upload(upload):
+    if upload.size > settings.AUDIO_CONFIG['MAX_FILE_SIZE']:
+        raise AudioProtocolError(f"{upload.name} is too large")
+    return _check_clip(decode_file(upload.read()), upload.name)
+
+
+def _read_clips(request):
+    """
+    (AudioFrame, meta) for every clip in a batch request: uploaded files under
+    'audio', or an NDJSON body of {"audio": <base64 int16 PCM>, "timestamp": ...} lines.
+    """
+    max_clips = settings.REST_SCORING_CONFIG['MAX_CLIPS']
+    clips = []
+    if request.content_type == 'application/x-ndjson':
+        # Read line by line rather than through request.body, so a large batch is never held twice
+        for number, line in enumerate(request, 1):
+            if not line.strip():
+                continue
+            if len(clips) == max_clips:
+                raise AudioProtocolError(f"More than {max_clips} clips in one request")
+            try:
+                frame = _check_clip(decode_json(line), f"Line {number}")
+            except AudioProtocolError as e:
+                raise AudioProtocolError(f"Line {number}: {str(e)}")
+            clips.append((frame, frame.meta()))
+    else:
+        uploads = request.FILES.getlist('audio')
+        if len(uploads) > max_clips:
+            raise AudioProtocolError(f"More than {max_clips} clips in one request")
+        clips = [(_read_upload(upload), {'name': upload.name}) for upload in uploads]
+    if not clips:
+        raise AudioProtocolError("No clips given")
+    return clips
+
+
+def _clip_result(result):
+    panic = result['panic']
+    body = {
+        'wakeword': result['wakeword'],
+        'wakeword_score': result['wakeword_score'],
+        'panic': panic.get('panic', False),
+        'confidence': panic.get('confidence'),
+    }
+    if panic.get('skipped'):
+        body['panic_skipped'] = True
+    if 'error' in panic:
+        body['error'] = panic['error']
+    return body
+
+
+def _error(e, status_code):
+    return JsonResponse({'error': str(e)}, status=status_code)
+
+
+async def _score_one(frame, timings):
+    features = await _in_executor(timings, 'features', shared_frontend().compute, frame.samples)
+    pipeline = await _pipeline()
+    result = await pipeline.run(features)
+    timings.update(result.pop('timings_ms'))
+    return _clip_result(result)
+
+
+# Scoring views are async: requests wait on the shared executor and micro-batchers without
+# holding a worker thread, as the WebSocket consumer does. They are csrf-exempt like APIView.
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AudioUploadView(View):
+    async def post(self, request):
+        """Scores one uploaded audio file (WAV, FLAC or Ogg, any sample rate) as a single window."""
+        start = time.perf_counter()
+        timings = {}
         try:
-            audio_file = request.FILES['audio']
-            audio_bytes = audio_file.read()
-            
-            # Process with both models
-            wake_detected = wakeword_onnx.WakeWordDetector.detect(audio_bytes)
-            panic_result = panic_detection.PanicDetector.detect(audio_bytes)
-            
-            return Response({
-                'wakeword': wake_detected,
-                'panic': panic_result['panic'],
-                'confidence': panic_result['confidence'],
-                'processing_time_ms': {
-                    'wakeword': wake_detected['processing_time'],
-                    'panic': panic_result['processing_time']
-                }
-            }, status=status.HTTP_200_OK)
-            
+            frame = await _in_executor(timings, 'decode', lambda: _read_upload(request.FILES['audio']))
+        except KeyError:
+            return _error("No file uploaded under 'audio'", 400)
+        except (AudioProtocolError, SuspiciousOperation) as e:
+            return _error(e, 400)
+        try:
+            body = await _score_one(frame, timings)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return _error(e, 500)
+        timings['total'] = _elapsed_ms(start)
+        return JsonResponse({**body, 'processing_time_ms': timings})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StreamingEndpoint(View):
+    async def post(self, request):
+        """Scores one JSON chunk, {"audio": <base64 int16 PCM>, "timestamp": ...}, as the WebSocket text frames."""
+        start = time.perf_counter()
+        timings = {}
+        try:
+            frame = await _in_executor(timings, 'decode', lambda: _check_clip(decode_json(request.body), 'Chunk'))
+        except (AudioProtocolError, SuspiciousOperation) as e:
+            return _error(e, 400)
+        try:
+            body = await _score_one(frame, timings)
+        except Exception as e:
+            return _error(e, 500)
+        timings['total'] = _elapsed_ms(start)
+        return JsonResponse({**body, **frame.meta(), 'processing_time_ms': timings})
+
 
-class StreamingEndpoint(APIView):
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchDetectionView(View):
+    async def post(self, request):
+        """
+        Scores many clips in one request with one batched call per model, so
+        a gateway can forward buffered audio in a single round trip. Clips
+        are uploaded files under 'audio', or NDJSON lines in the WebSocket
+        JSON frame format. Results come back in request order; the stage
+        timings cover the whole batch.
+        """
+        start = time.perf_counter()
+        timings = {}
+        try:
+            clips = await _in_executor(timings, 'decode', _read_clips, request)
+        except (AudioProtocolError, SuspiciousOperation) as e:
+            return _error(e, 400)
+        try:
+            windows = await _in_executor(
+                timings, 'features', shared_frontend().compute_many, [frame.samples for frame, _ in clips]
+            )
+            pipeline = await _pipeline()
+            results, model_timings = await pipeline.run_many(windows)
+        except Exception as e:
+            return _error(e, 500)
+        timings.update(model_timings)
+        timings['total'] = _elapsed_ms(start)
+        return JsonResponse({
+            'clips': len(clips),
+            'results': [{**meta, **_clip_result(result)} for (_, meta), result in zip(clips, results)],
+            'processing_time_ms': timings,
+        })
+
+def _recording_names(data):
+    """'paths' as a list: repeated fields in a form body, or a JSON array of strings."""
+    if hasattr(data, 'getlist'):
+        return data.getlist('paths')
+    names = data.get('paths', []) if isinstance(data, dict) else []
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise AudioProtocolError("'paths' must be a list of recording names")
+    return names
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class _ClosingStream:
+    """
+    Streaming response content that runs `on_close` when the response is
+    closed, which Django does whether or not the client read any of it.
+    """
+
+    def __init__(self, iterable, on_close):
+        self.iterable = iterable
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            self.iterable.close()
+        finally:
+            self.on_close()
+
+
+class BatchScoringView(APIView):
     def post(self, request):
+        """
+        Scores long recordings window by window and streams back an NDJSON
+        timeline: one line per window, then a summary line per file.
+
+        Accepts uploaded files under 'audio' and/or 'paths' relative to
+        BATCH_SCORING_CONFIG['ARCHIVE_DIR'].
+        """
+        config = settings.BATCH_SCORING_CONFIG
+        # Server-side path -> name reported back, so records never expose server paths
+        paths, names, temp_paths = [], {}, []
+        # Uploads copied to disk here are removed when the response closes, or below if none is returned
+        streaming = False
         try:
-            data = json.loads(request.body)
-            audio_chunk = base64.b64decode(data['audio'])
-            
-            # Real-time processing
-            wake_detected = wakeword_onnx.WakeWordDetector.detect(audio_chunk)
-            panic_result = panic_detection.PanicDetector.detect(audio_chunk)
-            
-            return Response({
-                'wakeword': wake_detected,
-                'panic': panic_result['panic'],
-                'timestamp': data.get('timestamp')
-            }, status=status.HTTP_200_OK)
-            
+            archive = os.path.realpath(config['ARCHIVE_DIR'])
+            for name in _recording_names(request.data):
+                path = os.path.realpath(os.path.join(archive, name))
+                if not path.startswith(archive + os.sep) or not os.path.isfile(path):
+                    return Response({'error': f'Unknown recording {name}'}, status=status.HTTP_400_BAD_REQUEST)
+                paths.append(path)
+                names[path] = name
+
+            for upload in request.FILES.getlist('audio'):
+                if upload.size > config['MAX_FILE_SIZE']:
+                    return Response({'error': f'{upload.name} is too large'}, status=status.HTTP_400_BAD_REQUEST)
+                if hasattr(upload, 'temporary_file_path'):
+                    # Large uploads are already on disk and can be memory-mapped in place
+                    paths.append(upload.temporary_file_path())
+                    names[paths[-1]] = upload.name
+                    continue
+                with tempfile.NamedTemporaryFile(
+                    dir=settings.AUDIO_CONFIG['TEMP_DIR'], suffix=os.path.splitext(upload.name)[1], delete=False
+                ) as f:
+                    temp_paths.append(f.name)
+                    for chunk in upload.chunks():
+                        f.write(chunk)
+                paths.append(f.name)
+                names[f.name] = upload.name
+
+            if not paths:
+                return Response({'error': 'No recordings given'}, status=status.HTTP_400_BAD_REQUEST)
+
+            def timeline():
+                for record in score_recordings(paths):
+                    record['file'] = names[record['file']]
+                    yield json.dumps(record) + '\n'
+
+            response = StreamingHttpResponse(
+                _ClosingStream(timeline(), lambda: _remove_files(temp_paths)), content_type='application/x-ndjson'
+            )
+            streaming = True
+            return response
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            if not streaming:
+                _remove_files(temp_paths)
 
 class ModelStatusView(APIView):
     def get(self, request):
         """
-        Returns a simple status response indicating the models are loaded.
-        Modify this logic to perform actual model health checks if necessary.
+        Returns the load state of each shared model together with its
+        load time and the memory it added to this worker process.
         """
         try:
+            models = registry.status()
             status_info = {
-                'wakeword_model': 'loaded',
-                'panic_model': 'loaded'
+                'wakeword_model': models['wakeword'],
+                'panic_model': models['panic'],
+                'batching': models['batching'],
+                'vad': dict(VoiceActivityGate.totals),
+                'backpressure': backpressure.stats(),
+                'decisions': decisions.stats(),
+                'alerts': alerts.stats(),
+                'auth_cache': middleware.stats(),
+                'persistence': persistence.stats(),
+                'capture': capture.stats(),
+                'process_rss_bytes': models['process_rss_bytes']
             }
+            if settings.INFERENCE_CONFIG['MODE'] == 'worker':
+                channel = settings.INFERENCE_CONFIG['WORKER']['CHANNEL']
+                status_info['inference_workers'] = {
+                    **remote_stats,
+                    'queue_depth': async_to_sync(channel_queue_depth)(get_channel_layer(), channel)
+                }
             return Response(status_info, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class MetricsView(APIView):
+    def get(self, request):
+        """
+        Per-stage latency histograms and resource gauges for this process,
+        in the Prometheus text format.
+        """
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @api_view(['GET'])
 def EmergencyContactsView(request):
     """
@@ -0,0 +1,189 @@
+# detection/workers.py
+import time
+import uuid
+import asyncio
+import logging
+import numpy as np
+from channels.consumer import AsyncConsumer
+from channels.exceptions import ChannelFull
+from django.conf import settings
+from .utils.model_registry import registry
+from .utils.features import ChunkFeatures
+from .utils.pipeline import DetectionPipeline
+
+logger = logging.getLogger(__name__)
+
+# Counters for jobs sent from this socket-server process
+remote_stats = {'sent': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'expired': 0}
+
+
+async def channel_queue_depth(layer, channel):
+    """Best-effort count of messages waiting on a channel, or None if the layer cannot tell."""
+    try:
+        if hasattr(layer, 'ring_size') and hasattr(layer, 'connection'):
+            # channels_redis spreads a general channel's messages over every host
+            total = 0
+            for index in range(layer.ring_size):
+                total += await layer.connection(index).zcount(layer.prefix + channel, '-inf', '+inf')
+            return total
+        queue = getattr(layer, 'channels', {}).get(channel)
+        return queue.qsize() if queue is not None else 0
+    except Exception as e:
+        logger.error(f"Queue depth lookup failed: {str(e)}")
+        return None
+
+
+def encode_job(features, reply_channel, meta):
+    return {
+        'type': 'inference.request',
+        'job_id': uuid.uuid4().hex,
+        'reply_channel': reply_channel,
+        'mfcc': np.ascontiguousarray(features.mfcc, dtype=np.float32).tobytes(),
+        'shape': list(features.mfcc.shape),
+        'n_mels': features.n_mels,
+        # Waveform-based panic features are computed on the worker from these samples
+        'audio': None if features.audio is None else np.asarray(features.audio).astype(np.int16).tobytes(),
+        'meta': meta,
+        'sent_at': time.time(),
+    }
+
+
+def decode_job(message):
+    mfcc = np.frombuffer(message['mfcc'], dtype=np.float32).reshape(message['shape'])
+    audio = message.get('audio')
+    return ChunkFeatures(mfcc, message['n_mels'], None if audio is None else np.frombuffer(audio, dtype=np.int16))
+
+
+class RemoteJobs:
+    """
+    Jobs a MonitoringConsumer has handed to the inference workers.
+
+    Each job is numbered in submission order and gets a future that the
+    consumer's inference_result handler resolves. The consumer awaits the
+    replies from its drain task, never inside receive(): replies arrive as
+    channel messages, which are only dispatched between handler calls.
+    """
+
+    def __init__(self, channel_layer, reply_channel, worker_channel, timeout):
+        self.channel_layer = channel_layer
+        self.reply_channel = reply_channel
+        self.worker_channel = worker_channel
+        self.timeout = timeout
+        self.pending = {}  # job_id -> (sequence, sent_at, future)
+        self.sequence = 0
+
+    async def submit(self, features, meta):
+        """Queues one window for the worker pool; returns its job id, or None if the channel is full."""
+        job = encode_job(features, self.reply_channel, meta)
+        job['sequence'] = self.sequence
+        try:
+            await self.channel_layer.send(self.worker_channel, job)
+        except ChannelFull:
+            remote_stats['rejected'] += 1
+            return None
+        self.pending[job['job_id']] = (self.sequence, job['sent_at'], asyncio.get_running_loop().create_future())
+        self.sequence += 1
+        remote_stats['sent'] += 1
+        return job['job_id']
+
+    def complete(self, message):
+        """Hands a reply to whoever awaits its job; False for expired or unknown jobs."""
+        entry = self.pending.get(message['job_id'])
+        if entry is None or entry[2].done():
+            return False
+        _, sent_at, future = entry
+        remote_stats['failed' if message.get('error') else 'completed'] += 1
+        future.set_result(dict(message, round_trip_ms=round((time.time() - sent_at) * 1000, 3)))
+        return True
+
+    async def results(self, job_ids):
+        """
+        Replies to `job_ids` in sequence order, after waiting at most
+        `timeout` seconds. A job without a reply by then is expired, so a
+        late reply is ignored, and its place in the list is None.
+        """
+        jobs = sorted(
+            ((job_id,) + self.pending[job_id] for job_id in job_ids if job_id in self.pending),
+            key=lambda job: job[1]
+        )
+        if jobs:
+            await asyncio.wait([future for _, _, _, future in jobs], timeout=self.timeout)
+        replies = []
+        for job_id, _, _, future in jobs:
+            self.pending.pop(job_id, None)
+            if future.done() and not future.cancelled():
+                replies.append(future.result())
+                continue
+            if not future.cancelled():
+                future.cancel()
+                remote_stats['expired'] += 1
+            replies.append(None)
+        return replies
+
+    def cancel(self):
+        """Expires every pending job, e.g. when the connection closes."""
+        for _, _, future in self.pending.values():
+            future.cancel()
+        remote_stats['expired'] += len(self.pending)
+        self.pending.clear()
+
+
+class InferenceWorkerConsumer(AsyncConsumer):
+    """
+    Runs detection for windows sent by MonitoringConsumer over the channel layer
+    and replies to the originating channel. Start with:
+
+        python manage.py run_inference_worker
+
+    which loads and warms up the models before the worker takes its first job.
+    """
+
+    _pipeline = None
+    _slots = None
+    in_flight = 0
+    processed = 0
+
+    @classmethod
+    async def pipeline(cls):
+        if cls._pipeline is None:
+            cls._pipeline = DetectionPipeline.from_settings(
+                await registry.load_batcher('wakeword'), await registry.load_batcher('panic'),
+                settings.INFERENCE_CONFIG['CASCADE']
+            )
+        return cls._pipeline
+
+    async def inference_request(self, message):
+        # Channel messages are dispatched one at a time; score in a task so
+        # concurrent jobs reach the micro-batchers together. Waiting for a free
+        # slot stops this worker pulling more jobs, leaving them queued for others.
+        if InferenceWorkerConsumer._slots is None:
+            InferenceWorkerConsumer._slots = asyncio.Semaphore(settings.INFERENCE_CONFIG['WORKER']['MAX_IN_FLIGHT'])
+        await InferenceWorkerConsumer._slots.acquire()
+        asyncio.ensure_future(self._score(message))
+
+    async def _score(self, message):
+        InferenceWorkerConsumer.in_flight += 1
+        reply = {
+            'type': 'inference.result',
+            'job_id': message['job_id'],
+            'sequence': message.get('sequence'),
+            'meta': message.get('meta', {})
+        }
+        try:
+            queued_ms = round((time.time() - message['sent_at']) * 1000, 3)
+            pipeline = await self.pipeline()
+            result = await pipeline.run(decode_job(message))
+            result['timings_ms']['queue'] = queued_ms
+            reply['result'] = result
+        except Exception as e:
+            logger.error(f"Inference job failed: {str(e)}")
+            reply['error'] = str(e)
+        finally:
+            InferenceWorkerConsumer.in_flight -= 1
+            InferenceWorkerConsumer.processed += 1
+            InferenceWorkerConsumer._slots.release()
+
+        try:
+            await self.channel_layer.send(message['reply_channel'], reply)
+        except Exception as e:
+            logger.error(f"Could not reply to {message['reply_channel']}: {str(e)}")
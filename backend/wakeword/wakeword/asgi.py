@@ -1,14 +1,31 @@
 import os
+from django.conf import settings
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import detection.routing  # Import the app’s WebSocket routes
+from channels.routing import ProtocolTypeRouter, URLRouter, ChannelNameRouter
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wakeword.settings")
 
+# Set up Django before importing anything that touches models or settings
+django_asgi_app = get_asgi_application()
+
+import detection.routing  # Import the app’s WebSocket routes
+from detection.middleware import TokenAuthMiddlewareStack
+from detection.utils.model_registry import registry
+from detection.workers import InferenceWorkerConsumer
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    # ?token= connections are authenticated through a cached lookup (see detection/middleware.py)
+    "websocket": TokenAuthMiddlewareStack(
         URLRouter(detection.routing.websocket_urlpatterns)
     ),
+    # Background inference workers: `python manage.py run_inference_worker`
+    "channel": ChannelNameRouter({
+        settings.INFERENCE_CONFIG['WORKER']['CHANNEL']: InferenceWorkerConsumer.as_asgi(),
+    }),
 })
+
+# Load the shared models once per worker before the first connection arrives.
+# Socket servers in 'worker' mode only need the feature front-end.
+if settings.INFERENCE_CONFIG['WARMUP_ON_STARTUP']:
+    registry.warmup(load_models=settings.INFERENCE_CONFIG['MODE'] == 'local')
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'channels',
     'detection', 
     'corsheaders',
@@ -112,19 +113,108 @@ DETECTION_PATH = os.path.join(BASE_DIR, 'detection')
 
 MODEL_CONFIG = {
     'WAKEWORD': {
-        'PATH': os.path.join(BASE_DIR, 'detection/models/wakeword.onnx'),
+        # The bundled detect_me.onnx takes (1, 16, 96) embedding frames, not the (151, 40) MFCC windows
+        # the shared front-end produces, so it fails to load; enable with a model trained on those MFCCs
+        'ENABLED': os.getenv('WAKEWORD_ENABLED', 'False') == 'True',
+        'PATH': os.getenv('WAKEWORD_MODEL_PATH', os.path.join(BASE_DIR, 'detection/models/detect_me.onnx')),
         'THRESHOLD': 0.7,
+        # Per-stream decisions (see detection/utils/decisions.py): a detector turns on when its
+        # smoothed score reaches THRESHOLD and off only once it drops below RELEASE_THRESHOLD
+        'RELEASE_THRESHOLD': 0.5,
+        'SMOOTHING': {'METHOD': os.getenv('WAKEWORD_SMOOTHING', 'ema'), 'ALPHA': 0.6, 'K': 2, 'N': 3},
         'SAMPLE_RATE': 16000,
-        'CHUNK_SIZE': 24000  # 1.5 seconds of audio
+        'CHUNK_SIZE': 24000,  # 1.5 seconds of audio
+        # Sliding-window streaming in MonitoringConsumer: run detection every HOP_SIZE samples
+        'STREAMING': os.getenv('WAKEWORD_STREAMING', 'True') == 'True',
+        'HOP_SIZE': 8000  # 0.5 seconds of audio
     },
     'PANIC': {
         'PATH': os.path.join(BASE_DIR, 'detection/models/calmalert_model.pt'),
+        # Produced by `manage.py export_panic_onnx [--quantize] [--torchscript]`
+        'ONNX_PATH': os.path.join(BASE_DIR, 'detection/models/calmalert_model.onnx'),
+        'ONNX_INT8_PATH': os.path.join(BASE_DIR, 'detection/models/calmalert_model.int8.onnx'),
+        'TORCHSCRIPT_PATH': os.path.join(BASE_DIR, 'detection/models/calmalert_model.ts'),
+        # Feature contract the model was trained with (detection/utils/feature_spec.py); written by
+        # `manage.py build_panic_features`, or from the notebook's scaler.pkl by `manage.py export_feature_spec`.
+        # Empty means raw MFCC frames into a PanicClassifier. The shipped checkpoint is a CalmaAlertModel, but
+        # with detection/models/calmalert_model.clip_stats.spec.json it scores silence as panic, so that spec
+        # is opt-in and PanicDetector refuses the pair at load
+        'SPEC_PATH': os.getenv('PANIC_SPEC_PATH', ''),
+        # torch, torchscript, onnx or onnx-int8; the onnx backends start fastest as they never import torch
+        'BACKEND': os.getenv('PANIC_BACKEND', 'torch'),
         'THRESHOLD': 0.65,
+        'RELEASE_THRESHOLD': 0.45,
+        # k-of-n voting: K of the last N windows must reach THRESHOLD
+        'SMOOTHING': {'METHOD': os.getenv('PANIC_SMOOTHING', 'vote'), 'ALPHA': 0.5, 'K': 2, 'N': 3},
         'SAMPLE_RATE': 16000,
         'MAX_LENGTH': 2.4
+    },
+    # Thread pools for both models and the inference executor (see detection/utils/execution.py).
+    # 0 derives a figure from the cores this process may use; `manage.py bench_threads` compares settings
+    'EXECUTION': {
+        'EXECUTOR_WORKERS': int(os.getenv('INFERENCE_EXECUTOR_WORKERS', '0')),
+        'INTRA_OP_THREADS': int(os.getenv('INFERENCE_INTRA_OP_THREADS', '0')),  # Per model call, onnxruntime and torch
+        'INTER_OP_THREADS': int(os.getenv('INFERENCE_INTER_OP_THREADS', '1')),
+        'BLAS_THREADS': int(os.getenv('INFERENCE_BLAS_THREADS', '1')),  # NumPy/BLAS calls in feature extraction
+        # CPUs to pin this process to: a list such as '0-7', or 'slot:i/n' for the i-th of n equal shares
+        'AFFINITY': os.getenv('INFERENCE_AFFINITY', '')
     }
 }
 
+# Voice-activity gating in front of both detectors (see detection/utils/vad.py)
+VAD_CONFIG = {
+    'ENABLED': os.getenv('VAD_ENABLED', 'True') == 'True',
+    'AGGRESSIVENESS': int(os.getenv('VAD_AGGRESSIVENESS', '2')),  # webrtcvad mode, 0-3
+    'FRAME_MS': 30,
+    'ENERGY_THRESHOLD_DBFS': -50.0,
+    'SPEECH_RATIO': 0.1,  # Fraction of voiced frames needed to call a chunk speech
+    'HANGOVER_CHUNKS': 2
+}
+
+# Shared inference resources (see detection/utils/model_registry.py)
+INFERENCE_CONFIG = {
+    'WARMUP_ON_STARTUP': os.getenv('INFERENCE_WARMUP', 'True') == 'True',
+    # 'local' scores in the socket-server process; 'worker' sends windows over the channel
+    # layer to `manage.py run_inference_worker` processes
+    'MODE': os.getenv('INFERENCE_MODE', 'local'),
+    # Clients normally only get detector state changes; this adds a 'scores' message for every window
+    'SEND_SCORES': os.getenv('INFERENCE_SEND_SCORES', 'False') == 'True',
+    'WORKER': {
+        'CHANNEL': 'detection-inference',
+        'MAX_IN_FLIGHT': int(os.getenv('INFERENCE_WORKER_MAX_IN_FLIGHT', '64')),  # Jobs scored concurrently per worker
+        'JOB_TIMEOUT': 5.0  # Seconds a socket server waits for a reply before dropping the job
+    },
+    # Chunks from all connections are grouped into one model call
+    'BATCHING': {
+        'MAX_BATCH_SIZE': int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '16')),
+        'MAX_WAIT_MS': float(os.getenv('INFERENCE_MAX_WAIT_MS', '5')),
+        'MAX_CONCURRENT_BATCHES': 2
+    },
+    # Two-stage mode: the panic model only runs on windows whose loudest frame reaches MIN_LEVEL_DBFS
+    'CASCADE': {
+        'ENABLED': os.getenv('INFERENCE_CASCADE', 'False') == 'True',
+        'MIN_LEVEL_DBFS': float(os.getenv('INFERENCE_CASCADE_MIN_DBFS', '-35'))
+    }
+}
+
+# Overload handling in MonitoringConsumer (see detection/utils/backpressure.py)
+BACKPRESSURE_CONFIG = {
+    'MAX_QUEUED_CHUNKS': int(os.getenv('BACKPRESSURE_MAX_QUEUED_CHUNKS', '4')),  # Per connection
+    'POLICY': os.getenv('BACKPRESSURE_POLICY', 'drop_oldest_silence'),  # drop_oldest_silence, coalesce or latest
+    'SLOW_DOWN_AT': 3,  # Queue depth at which clients are asked to slow down
+    'RESUME_AT': 1,  # ...and told to resume once it falls back to this
+    'MAX_IN_FLIGHT': int(os.getenv('BACKPRESSURE_MAX_IN_FLIGHT', '256'))  # Chunks being scored across all connections
+}
+
+# WebSocket token authentication cache (see detection/middleware.py)
+AUTH_CACHE_CONFIG = {
+    'TTL': float(os.getenv('AUTH_CACHE_TTL', '60')),  # Also how long other workers honour a deleted token
+    'NEGATIVE_TTL': 5.0,  # Unknown tokens are remembered briefly so retries skip the database
+    'MAX_ENTRIES': int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000')),
+    'BATCH_WAIT_MS': 5.0,  # Misses within this window share one query
+    'MAX_BATCH_SIZE': 500
+}
+
 # Audio Processing
 AUDIO_CONFIG = {
     'MAX_FILE_SIZE': 5242880,
@@ -132,6 +222,40 @@ AUDIO_CONFIG = {
     'TEMP_DIR': os.path.join(BASE_DIR, 'temp_audio')
 }
 
+# Audio kept around panic incidents (see detection/utils/capture.py)
+CAPTURE_CONFIG = {
+    'ENABLED': os.getenv('CAPTURE_ENABLED', 'True') == 'True',
+    'PRE_SECONDS': 10.0,  # Audio kept from before the incident opened
+    'POST_SECONDS': 5.0,  # ...and recorded after it
+    'FORMAT': os.getenv('CAPTURE_FORMAT', 'flac'),  # 'flac' or 'wav'
+    'DIR': os.getenv('CAPTURE_DIR', os.path.join(AUDIO_CONFIG['TEMP_DIR'], 'incidents')),
+    'MAX_BYTES': int(os.getenv('CAPTURE_MAX_BYTES', str(500 * 1024 * 1024))),  # Oldest clips are deleted beyond this
+    'QUEUE_SIZE': 16  # Clips waiting for the writer; more are dropped
+}
+
+# Clip scoring over REST (/api/audio/upload/, /api/stream/, /api/audio/batch/)
+REST_SCORING_CONFIG = {
+    # Multipart batches are also bounded by Django's DATA_UPLOAD_MAX_NUMBER_FILES (100)
+    'MAX_CLIPS': int(os.getenv('REST_SCORING_MAX_CLIPS', '100')),
+    'MAX_CLIP_SECONDS': 10.0  # Longer recordings go to /api/audio/score/
+}
+
+# Offline scoring of long recordings (see detection/utils/offline_scoring.py)
+BATCH_SCORING_CONFIG = {
+    'WORKERS': int(os.getenv('BATCH_SCORING_WORKERS', str(max(1, (os.cpu_count() or 2) - 1)))),
+    'WINDOWS_PER_TASK': 32,  # Windows per model call in a worker process
+    'HOP_SIZE': 8000,  # 0.5 seconds between window starts; windows are MODEL_CONFIG CHUNK_SIZE long
+    'MAX_FILE_SIZE': 524288000,  # Per uploaded recording
+    # Server-side recordings the batch API may score by relative path
+    'ARCHIVE_DIR': os.getenv('RECORDINGS_ARCHIVE_DIR', os.path.join(BASE_DIR, 'recordings'))
+}
+
+# Panic model retraining data (see detection/training/)
+TRAINING_CONFIG = {
+    'CACHE_DIR': os.getenv('TRAINING_CACHE_DIR', os.path.join(BASE_DIR, 'training_cache')),
+    'WORKERS': int(os.getenv('TRAINING_WORKERS', str(os.cpu_count() or 1)))
+}
+
 # WebSocket Configuration
 CHANNEL_LAYERS = {
     "default": {
@@ -152,7 +276,43 @@ EMERGENCY_CONFIG = {
     'CONTACTS': [
         '+15551234567',
         'admin@example.com'
-    ]
+    ],
+    # IoT siren controller that receives escalated incidents as JSON POSTs
+    'SIREN_WEBHOOK_URL': os.getenv('SIREN_WEBHOOK_URL')
+}
+
+# Incident coalescing and notification delivery (see detection/alerts.py)
+ALERT_CONFIG = {
+    # Consecutive panic windows before an incident opens; panic scores are already smoothed per stream
+    'MIN_HITS': int(os.getenv('ALERT_MIN_HITS', '1')),
+    'RELEASE_THRESHOLD': 0.5,  # An open incident stays open while windows score at least this
+    'QUIET_SECONDS': float(os.getenv('ALERT_QUIET_SECONDS', '10')),  # ...and closes after this long without one
+    'NOTIFY_CONFIDENCE': 0.8,  # Sirens and contacts are alerted once an incident reaches this confidence
+    'NOTIFIER': {
+        'WORKERS': 4,
+        'QUEUE_SIZE': 256,
+        'TIMEOUT': 5.0,  # Seconds per delivery attempt
+        'RETRIES': 3,
+        'BACKOFF': 0.5  # Seconds before the first retry, doubling after each failure
+    },
+    # [{'CLASS': 'detection.alerts.WebhookBackend', 'OPTIONS': {...}}]; empty derives them from EMERGENCY_CONFIG
+    'BACKENDS': [],
+    # EmergencyConsumer dispatchers subscribe to incidents by site, region or stream
+    'DASHBOARD': {
+        'GROUP_PREFIX': 'emergency',
+        'MAX_SUBSCRIPTIONS': 64,  # Per dispatcher connection
+        'SNAPSHOT_LIMIT': 200  # Open incidents sent on connect and on each new subscription
+    }
+}
+
+# History of streams, detector transitions, incidents and score timelines (see detection/persistence.py)
+PERSISTENCE_CONFIG = {
+    'ENABLED': os.getenv('PERSISTENCE_ENABLED', 'True') == 'True',
+    'MAX_BATCH': 500,  # Rows per flush; a full batch is written without waiting for the interval
+    'FLUSH_INTERVAL': float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', '1.0')),  # Seconds
+    'MAX_PENDING': int(os.getenv('PERSISTENCE_MAX_PENDING', '50000')),  # Rows beyond this are dropped, not queued
+    'RETRIES': 3,
+    'TIMELINE_WINDOWS': 120  # Windows of raw scores packed into each ScoreTimeline row
 }
 
 # Twilio Credentials Check